@@ -0,0 +1,134 @@
+import hashlib
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from observability import RERANK_PAIRS
+
+# === Adaptive Reranking Settings ===
+# Candidates whose dense similarity is more than RERANK_DENSE_MARGIN below the top_k-th best
+# dense candidate are dropped without running the cross-encoder; "off" reranks every candidate.
+# Candidates only BM25 found have no dense score and are always reranked.
+RERANK_DENSE_MARGIN = os.getenv("RERANK_DENSE_MARGIN", "0.15")
+# Cross-encoder scores by (question, chunk), so repeated and overlapping questions skip forward passes
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "50000"))
+# ms-marco cross-encoders output logits: clearly irrelevant pairs score far below zero. Chunks under
+# this are dropped rather than padding the context up to top_k; "off" keeps top_k whatever they score.
+RERANK_MIN_SCORE = os.getenv("RERANK_MIN_SCORE", "-5")
+
+OUTCOMES = ("scored", "cached", "skipped", "below_cutoff")
+
+
+def optional_setting(value: str) -> float | None:
+    return None if value == "off" else float(value)
+
+
+def pair_key(question: str, text: str) -> tuple[bytes, bytes]:
+    # (question hash, chunk id); chunks are identified by their text, which is all the score depends on
+    return (hashlib.blake2b(question.encode("utf-8"), digest_size=16).digest(),
+            hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+
+
+@dataclass
+class Candidates:
+    question: str
+    payloads: list[dict]
+    top_k: int
+    dense_scores: dict[str, float] = field(default_factory=dict)  # chunk text -> dense similarity
+
+
+class AdaptiveReranker:
+    """Cross-encoder reranking that only scores the pairs it has to.
+
+    Clear dense losers are skipped (see RERANK_DENSE_MARGIN), scores come from a bounded LRU
+    cache where possible, the remaining pairs of every group go to the reranker in one
+    submission, and results under RERANK_MIN_SCORE are dropped.
+    """
+
+    def __init__(self, batcher, cache_size: int = RERANK_CACHE_SIZE,
+                 margin: float | None = optional_setting(RERANK_DENSE_MARGIN),
+                 min_score: float | None = optional_setting(RERANK_MIN_SCORE)):
+        self.batcher = batcher
+        self.cache_size = cache_size
+        self.margin = margin
+        self.min_score = min_score
+        self._cache: OrderedDict[tuple[bytes, bytes], float] = OrderedDict()
+        self.counts = {outcome: 0 for outcome in OUTCOMES}
+
+    def _count(self, outcome: str, n: int):
+        if n:
+            self.counts[outcome] += n
+            RERANK_PAIRS.inc(n, outcome)
+
+    def select(self, group: Candidates) -> list[dict]:
+        # The candidates worth a cross-encoder pass
+        if group.top_k <= 0:
+            return []
+        dense = sorted((group.dense_scores[p["text"]] for p in group.payloads if p["text"] in group.dense_scores),
+                       reverse=True)
+        if self.margin is None or len(dense) <= group.top_k:
+            return group.payloads
+        floor = dense[group.top_k - 1] - self.margin
+        # When the dense gap below the top_k-th candidate exceeds the margin only the top_k are left,
+        # but they are still scored: packing compares scores across sources, and RERANK_MIN_SCORE is
+        # in cross-encoder logits, so dense similarities can't stand in for them
+        return [p for p in group.payloads if group.dense_scores.get(p["text"], floor) >= floor]
+
+    def _cached(self, key) -> float | None:
+        score = self._cache.get(key)
+        if score is not None:
+            self._cache.move_to_end(key)
+        return score
+
+    def _store(self, key, score: float):
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = score
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def rerank(self, groups: list[Candidates]) -> list[list[tuple[dict, float]]]:
+        """Returns, per group, up to top_k (payload, score) pairs, best first."""
+        selected = [self.select(group) for group in groups]
+        self._count("skipped", sum(len(g.payloads) - len(s) for g, s in zip(groups, selected)))
+
+        scores: dict[tuple[bytes, bytes], float] = {}
+        misses: dict[tuple[bytes, bytes], tuple[str, str]] = {}
+        for group, payloads in zip(groups, selected):
+            for payload in payloads:
+                key = pair_key(group.question, payload["text"])
+                if key in scores or key in misses:
+                    continue
+                score = self._cached(key)
+                if score is None:
+                    misses[key] = (group.question, payload["text"])
+                else:
+                    scores[key] = score
+        self._count("cached", len(scores))
+        if misses:
+            # One submission for every group, so they share forward passes
+            predicted = await self.batcher.submit_many(list(misses.values()))
+            for key, score in zip(misses, predicted):
+                scores[key] = float(score)
+                self._store(key, float(score))
+            self._count("scored", len(misses))
+
+        ranked = []
+        for group, payloads in zip(groups, selected):
+            scored = [(p, scores[pair_key(group.question, p["text"])]) for p in payloads]
+            if self.min_score is not None:
+                relevant = [(p, score) for p, score in scored if score >= self.min_score]
+                self._count("below_cutoff", len(scored) - len(relevant))
+                scored = relevant
+            ranked.append(sorted(scored, key=lambda x: x[1], reverse=True)[:group.top_k])
+        return ranked
+
+    def stats(self) -> dict:
+        return {
+            **{f"pairs_{outcome}": n for outcome, n in self.counts.items()},
+            "cache_entries": len(self._cache),
+            "cache_limit": self.cache_size,
+            "dense_margin": self.margin,
+            "min_score": self.min_score,
+        }
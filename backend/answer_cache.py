@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# === Answer Cache Settings ===
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))              # seconds
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))  # cosine threshold, >1 disables
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")                       # empty: memory only
+
+
+def normalize_question(question: str) -> str:
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?!.")
+
+
+@dataclass
+class CacheEntry:
+    scope: str
+    question: str
+    answer: str
+    vector: np.ndarray | None
+    created: float
+
+
+class AnswerCache:
+    """Two-tier LRU/TTL cache of generated answers.
+
+    The exact tier matches the normalised question; the semantic tier matches any cached
+    question whose embedding has cosine similarity >= `similarity`. Entries are only visible
+    within their `scope` (report version plus retrieval settings), so replacing the report
+    makes every older answer unreachable even before `invalidate()` drops it.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 similarity: float = ANSWER_CACHE_SIMILARITY, path: str = ANSWER_CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.path = path
+        self._entries: OrderedDict[tuple[str, str], CacheEntry] = OrderedDict()
+        self._matrix: np.ndarray | None = None
+        self._matrix_keys: list[tuple[str, str]] = []
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if path:
+            self.load()
+
+    def _expired(self, entry: CacheEntry) -> bool:
+        return self.ttl > 0 and time.time() - entry.created > self.ttl
+
+    def _drop(self, key):
+        del self._entries[key]
+        self._matrix = None
+
+    def get_exact(self, scope: str, question: str) -> str | None:
+        key = (scope, normalize_question(question))
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            self.expirations += 1
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        self.exact_hits += 1
+        return entry.answer
+
+    def get_semantic(self, scope: str, vector: np.ndarray) -> str | None:
+        if self.similarity <= 1.0 and self._entries:
+            if self._matrix is None:
+                self._matrix_keys = [k for k, e in self._entries.items() if e.vector is not None]
+                self._matrix = (np.stack([self._entries[k].vector for k in self._matrix_keys])
+                                if self._matrix_keys else np.zeros((0, len(vector)), dtype=np.float32))
+            if len(self._matrix_keys):
+                sims = self._matrix @ unit(vector)
+                for i in np.argsort(-sims):
+                    if sims[i] < self.similarity:
+                        break
+                    key = self._matrix_keys[i]
+                    entry = self._entries.get(key)
+                    if entry is None or entry.scope != scope:
+                        continue
+                    if self._expired(entry):
+                        self.expirations += 1
+                        self._drop(key)
+                        break
+                    self._entries.move_to_end(key)
+                    self.semantic_hits += 1
+                    return entry.answer
+        self.misses += 1
+        return None
+
+    def put(self, scope: str, question: str, answer: str, vector: np.ndarray | None = None):
+        key = (scope, normalize_question(question))
+        self._entries[key] = CacheEntry(scope, key[1], answer,
+                                        unit(vector) if vector is not None else None, time.time())
+        self._entries.move_to_end(key)
+        self._matrix = None
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, scope_prefix: str = ""):
+        # Drop every entry (or only those whose scope starts with `scope_prefix`)
+        for key in [k for k in self._entries if k[0].startswith(scope_prefix)]:
+            del self._entries[key]
+        self._matrix = None
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    # --- Optional persistence across restarts ---
+    def save(self):
+        if not self.path:
+            return
+        entries = [
+            {"scope": e.scope, "question": e.question, "answer": e.answer, "created": e.created,
+             "vector": e.vector.tolist() if e.vector is not None else None}
+            for e in self._entries.values() if not self._expired(e)
+        ]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+        logger.info(f"Saved {len(entries)} cached answers to {self.path}.")
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not load answer cache from {self.path}: {e}")
+            return
+        for raw in entries[-self.max_entries:]:
+            entry = CacheEntry(raw["scope"], raw["question"], raw["answer"],
+                               np.asarray(raw["vector"], dtype=np.float32) if raw["vector"] is not None else None,
+                               raw["created"])
+            if not self._expired(entry):
+                self._entries[(entry.scope, entry.question)] = entry
+        logger.info(f"Loaded {len(self._entries)} cached answers from {self.path}.")
+
+
+def unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,84 @@
+"""Answer a JSONL file of questions offline, through the same code path as POST /ask/batch.
+
+    python ask_batch.py questions.jsonl answers.jsonl --session-id qa-suite [--report report.pdf]
+
+Each input line is {"question": "...", ...} (or a bare JSON string); any other fields, such as
+an id or an expected answer, are copied to the output line. Output lines are written as answers
+complete, with `index` giving the question's position in the input file.
+"""
+import argparse
+import asyncio
+import json
+import os
+from contextlib import aclosing
+
+
+def read_questions(path: str) -> list[dict]:
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if isinstance(row, str):
+                row = {"question": row}
+            if not isinstance(row, dict) or not isinstance(row.get("question"), str):
+                raise SystemExit(f"❌ {path}:{line_number}: expected an object with a \"question\" string.")
+            rows.append(row)
+    return rows
+
+
+async def ingest_report(server, session_id: str, path: str):
+    from fastapi import UploadFile
+
+    with open(path, "rb") as f:
+        job = await server.report_ingestor.submit(session_id, UploadFile(f, filename=os.path.basename(path)))
+        await job.task
+    if job.status != "done":
+        raise SystemExit(f"❌ Report ingestion {job.status}: {job.error}")
+    print(f"Report indexed: {job.to_dict()}")
+
+
+async def run(args):
+    import main as server  # loads .env and the settings; the models and indexes load in warm_up()
+
+    options = server.AskOptions(candidates=args.candidates, report_top_k=args.report_top_k,
+                                who_top_k=args.who_top_k, topics=args.topics)
+    rows = read_questions(args.input)
+    batch_size = args.batch_size or server.ASK_BATCH_MAX_QUESTIONS
+    await server.warm_up()
+    if args.report:
+        await ingest_report(server, args.session_id, args.report)
+
+    # Not stdout: the app logs there
+    out = open(args.output, "w", encoding="utf-8")
+    answered = failed = 0
+    try:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            questions = [row["question"] for row in batch]
+            async with aclosing(server.answer_batch(questions, options, args.session_id)) as results:
+                async for result in results:
+                    out.write(json.dumps({**batch[result["index"]], **result, "index": start + result["index"]},
+                                         ensure_ascii=False) + "\n")
+                    out.flush()
+                    answered += "answer" in result
+                    failed += "error" in result
+    finally:
+        out.close()
+        await server.shutdown()
+    print(f"Answered {answered} of {len(rows)} questions ({failed} failed).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions, as POST /ask/batch does.")
+    parser.add_argument("input", help="JSONL file with one question per line")
+    parser.add_argument("output", help="JSONL file for the answers")
+    parser.add_argument("--session-id", default="offline", help="Session whose report is searched")
+    parser.add_argument("--report", help="PDF to ingest into the session first")
+    parser.add_argument("--batch-size", type=int, help="Questions per batch (default: ASK_BATCH_MAX_QUESTIONS)")
+    parser.add_argument("--candidates", type=int, default=4)
+    parser.add_argument("--report-top-k", type=int, default=3)
+    parser.add_argument("--who-top-k", type=int, default=3)
+    parser.add_argument("--topics", nargs="+", help="WHO topics to search")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import time
+
+# === Micro-batching Settings ===
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "32"))
+RERANK_MAX_BATCH_SIZE = int(os.getenv("RERANK_MAX_BATCH_SIZE", "64"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class MicroBatcher:
+    """Coalesces single inference calls from concurrent requests into batched forward passes.
+
+    `fn` takes a list of items and returns one result per item; it runs on `executor`.
+    The collector waits at most `max_wait_ms` after the first queued item for more work, and
+    while every executor slot is busy it keeps accumulating, so batches grow under load.
+    """
+
+    def __init__(self, name: str, fn, executor, max_batch_size: int, max_wait_ms: float = BATCH_MAX_WAIT_MS,
+                 max_in_flight: int = 1):
+        self.name = name
+        self.fn = fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_in_flight = max_in_flight
+        self._queue: asyncio.Queue | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._collector: asyncio.Task | None = None
+        # Metrics
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+        self.batch_size_counts = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+
+    def _ensure_started(self):
+        if self._collector is None or self._collector.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._collector = asyncio.create_task(self._collect(), name=f"{self.name}-batcher")
+
+    async def submit(self, item):
+        return (await self.submit_many([item]))[0]
+
+    async def submit_many(self, items: list) -> list:
+        if not items:
+            return []
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for item in items:
+            future = loop.create_future()
+            self._queue.put_nowait((item, future, time.perf_counter()))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._slots.acquire()
+            # Whatever queued up while we waited for a free slot rides along in this batch
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            asyncio.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch: list):
+        try:
+            now = time.perf_counter()
+            self._record(len(batch), [now - enqueued for _, _, enqueued in batch])
+            loop = asyncio.get_running_loop()
+            try:
+                results = await loop.run_in_executor(self.executor, self.fn, [item for item, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def _record(self, size: int, delays: list[float]):
+        self.batches += 1
+        self.items += size
+        self.max_batch_seen = max(self.max_batch_seen, size)
+        self.queue_delay_total += sum(delays)
+        self.queue_delay_max = max(self.queue_delay_max, max(delays))
+        bucket = next((b for b in BATCH_SIZE_BUCKETS if size <= b), BATCH_SIZE_BUCKETS[-1])
+        self.batch_size_counts[bucket] += 1
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "batch_size_histogram": {f"<={b}": n for b, n in self.batch_size_counts.items()},
+            "avg_queue_delay_ms": self.queue_delay_total / self.items * 1000 if self.items else 0.0,
+            "max_queue_delay_ms": self.queue_delay_max * 1000,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_batch_limit": self.max_batch_size,
+        }
+
+    async def close(self):
+        if self._collector is not None:
+            self._collector.cancel()
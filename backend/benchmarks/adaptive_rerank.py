@@ -0,0 +1,125 @@
+"""Cross-encoder time saved by adaptive reranking, and how much the chosen chunks change.
+
+Builds dense candidates for a fixed question set over the WHO guidelines (three questions per
+topic, each knowing its topic), then reranks them with every reranking on, as before, and with
+the adaptive reranker at several dense margins. Each question set runs twice, the second time
+as repeat traffic for the score cache:
+    python benchmarks/adaptive_rerank.py --who-topics 60 --candidates 10 --top-k 3 --margins 0.05 0.1 0.2
+
+Quality is reported as agreement with full reranking (the share of its top_k chunks that are
+still chosen) and as topic hit@1 (the best chunk comes from the question's topic).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from adaptive_rerank import AdaptiveReranker, Candidates, optional_setting  # noqa: E402
+from models import load_embedder, load_reranker  # noqa: E402
+from who_index import WHO_GUIDELINES_PATH, read_guidelines, split_topics, who_chunk_payloads  # noqa: E402
+
+TEMPLATES = ["What is {topic}?", "How can {topic} be prevented?", "What are the main risks of {topic}?"]
+
+
+class TimedReranker:
+    """Stands in for the rerank MicroBatcher: scores pairs directly and adds up the time spent."""
+
+    def __init__(self, reranker):
+        self.reranker = reranker
+        self.seconds = 0.0
+        self.pairs = 0
+
+    async def submit_many(self, pairs: list[tuple[str, str]]) -> list[float]:
+        start = time.perf_counter()
+        scores = self.reranker.predict(pairs, batch_size=64)
+        self.seconds += time.perf_counter() - start
+        self.pairs += len(pairs)
+        return [float(score) for score in scores]
+
+
+def dense_candidates(embedder, payloads: list[dict], questions: list[str], candidates: int, top_k: int):
+    vectors = embedder.encode([p["text"] for p in payloads], batch_size=64, convert_to_numpy=True,
+                              normalize_embeddings=True)
+    q_vecs = embedder.encode(questions, convert_to_numpy=True, normalize_embeddings=True)
+    groups = []
+    for question, q_vec in zip(questions, q_vecs):
+        scores = vectors @ q_vec
+        best = np.argsort(-scores)[:candidates]
+        groups.append(Candidates(question, [payloads[i] for i in best], top_k,
+                                 {payloads[i]["text"]: float(scores[i]) for i in best}))
+    return groups
+
+
+def run(reranker, groups: list[Candidates], margin: float | None, min_score: float | None, cache_size: int,
+        passes: int) -> tuple[dict, list]:
+    timed = TimedReranker(reranker)
+    adaptive = AdaptiveReranker(timed, cache_size=cache_size, margin=margin, min_score=min_score)
+    for _ in range(passes):
+        ranked = asyncio.run(adaptive.rerank(groups))
+    stats = adaptive.stats()
+    return {
+        "dense_margin": margin,
+        "min_score": min_score,
+        "cache": cache_size > 0,
+        "rerank_seconds": round(timed.seconds, 3),
+        **{key: stats[key] for key in ("pairs_scored", "pairs_cached", "pairs_skipped", "pairs_below_cutoff")},
+    }, ranked
+
+
+def quality(ranked: list, baseline: list, topics: list[str]) -> dict:
+    agreement, hits = [], 0
+    for chosen, full, topic in zip(ranked, baseline, topics):
+        full_texts = {p["text"] for p, _ in full}
+        agreement.append(len(full_texts & {p["text"] for p, _ in chosen}) / len(full_texts) if full_texts else 1.0)
+        hits += bool(chosen) and chosen[0][0].get("topic") == topic
+    return {
+        "agreement_with_full_rerank": round(float(np.mean(agreement)), 3),
+        "topic_hit_at_1": round(hits / len(topics), 3),
+        "mean_chunks_kept": round(float(np.mean([len(chosen) for chosen in ranked])), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure adaptive reranking against reranking every candidate.")
+    parser.add_argument("--path", default=WHO_GUIDELINES_PATH)
+    parser.add_argument("--who-topics", type=int, default=60, help="First N WHO topics (0: all)")
+    parser.add_argument("--candidates", type=int, default=10, help="Dense candidates per question")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--margins", nargs="+", default=["0.05", "0.1", "0.15", "0.2", "off"])
+    parser.add_argument("--min-score", default="-5", help="Relevance cutoff of the adaptive runs, or 'off'")
+    parser.add_argument("--passes", type=int, default=2, help="Times the question set is asked")
+    args = parser.parse_args()
+
+    topics = split_topics(read_guidelines(args.path))
+    topic_names = list(topics)[:args.who_topics] if args.who_topics else list(topics)
+    text = "".join(f"\n\n{'=' * 40}\n{name}\n{'=' * 40}\n{topics[name]}" for name in topic_names)
+    payloads = who_chunk_payloads(text)
+    questions = [template.format(topic=name.replace("-", " ").lower())
+                 for name in topic_names for template in TEMPLATES]
+    question_topics = [name for name in topic_names for _ in TEMPLATES]
+
+    embedder, reranker = load_embedder(), load_reranker()
+    groups = dense_candidates(embedder, payloads, questions, args.candidates, args.top_k)
+
+    # As before: every candidate scored on every pass, nothing cached or cut off
+    baseline_run, baseline = run(reranker, groups, None, None, 0, args.passes)
+    results = {"chunks": len(payloads), "questions": len(questions), "candidates": args.candidates,
+               "top_k": args.top_k, "passes": args.passes,
+               "full_rerank": {**baseline_run, **quality(baseline, baseline, question_topics)}, "adaptive": []}
+    for margin in args.margins:
+        adaptive_run, ranked = run(reranker, groups, optional_setting(margin), optional_setting(args.min_score),
+                                   50000, args.passes)
+        saved = (1 - adaptive_run["rerank_seconds"] / baseline_run["rerank_seconds"]
+                 if baseline_run["rerank_seconds"] else None)
+        results["adaptive"].append({**adaptive_run, "rerank_time_saved": round(saved, 3) if saved is not None else None,
+                                    **quality(ranked, baseline, question_topics)})
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+"""Question set and latency percentiles shared by the /ask benchmarks."""
+
+QUESTIONS = [
+    "What is my hemoglobin level?",
+    "How is type 2 diabetes managed?",
+    "What are the symptoms of anaemia?",
+    "How much physical activity do adults need?",
+    "What does my report say about my blood pressure?",
+    "How is malaria transmitted?",
+    "What are the risk factors for pre-eclampsia?",
+    "Which vaccines protect against measles?",
+]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    # Nearest-rank percentile of a non-empty list
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
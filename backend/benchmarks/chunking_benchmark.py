@@ -0,0 +1,138 @@
+"""Structure-aware chunking versus the old fixed-width slicing, on the WHO guidelines file.
+
+Indexes the file both ways and reports chunk counts, chunk quality, index size, and search
+latency (with and without a topic pre-filter for structured chunks):
+    python benchmarks/chunking_benchmark.py --path who_data/who_az_guidelines.txt --queries 200
+
+The in-memory Qdrant ignores payload indexes, so filtered searches there are a linear scan;
+pass --qdrant-url to measure against a server (temporary `chunking_bench_*` collections are used).
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, Filter, FieldCondition, MatchAny, PointStruct, VectorParams
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_common import percentile  # noqa: E402
+from chunking import CHUNK_MAX_TOKENS, chunk_document, chunk_fixed, estimate_tokens, split_sections  # noqa: E402
+
+QUESTIONS = [
+    "What are the symptoms of anaemia?",
+    "How is malaria transmitted?",
+    "What are the risk factors for asthma?",
+    "How can arsenic exposure be prevented?",
+    "Which treatments exist for botulism?",
+    "How common is unsafe abortion?",
+    "How much physical activity do adults need?",
+    "How is blood safety ensured in transfusions?",
+]
+
+
+def chunk_quality(chunks, sources: dict) -> dict:
+    # `sources` maps a chunk's topic to the text its offset points into
+    def cut_mid_word(c) -> bool:
+        source = sources[c.topic]
+        return 0 < c.offset < len(source) and source[c.offset - 1].isalnum() and source[c.offset].isalnum()
+
+    tokens = [estimate_tokens(c.text) for c in chunks]
+    return {
+        "chunks": len(chunks),
+        "mean_tokens": round(statistics.mean(tokens), 1),
+        "max_tokens": max(tokens),
+        # Input past the embedder's 128 word pieces is silently truncated
+        "over_model_limit": sum(t > 128 for t in tokens),
+        "cut_mid_word": sum(cut_mid_word(c) for c in chunks),
+        "contains_topic_banner": sum("==========" in c.text for c in chunks),
+    }
+
+
+def build_index(qdrant: QdrantClient, name: str, chunks, vectors) -> dict:
+    qdrant.create_collection(name, vectors_config=VectorParams(size=vectors.shape[1], distance=Distance.COSINE))
+    start = time.perf_counter()
+    points = [PointStruct(id=i, vector=vector.tolist(), payload={"text": c.text, "offset": c.offset,
+                                                                  **({"topic": c.topic} if c.topic else {})})
+              for i, (c, vector) in enumerate(zip(chunks, vectors))]
+    for i in range(0, len(points), 256):
+        qdrant.upsert(name, points=points[i:i+256])
+    payload_bytes = sum(len(json.dumps(p.payload).encode()) for p in points)
+    return {
+        "upsert_seconds": round(time.perf_counter() - start, 3),
+        "vector_bytes": int(vectors.nbytes),
+        "payload_bytes": payload_bytes,
+        "index_bytes": int(vectors.nbytes) + payload_bytes,
+    }
+
+
+def search_latency(qdrant: QdrantClient, name: str, q_vectors, runs: int, filters=None) -> dict:
+    latencies = []
+    for i in range(runs):
+        q = q_vectors[i % len(q_vectors)]
+        query_filter = filters[i % len(filters)] if filters else None
+        start = time.perf_counter()
+        qdrant.query_points(name, query=q.tolist(), limit=5, query_filter=query_filter, with_payload=True)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": round(percentile(latencies, 50), 3), "p99_ms": round(percentile(latencies, 99), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare structure-aware and fixed-width chunking.")
+    parser.add_argument("--path", default="who_data/who_az_guidelines.txt")
+    parser.add_argument("--size", type=int, default=500, help="fixed-width slice size in characters")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--model", default="all-MiniLM-L12-v2")
+    parser.add_argument("--qdrant-url", default=None, help="Qdrant server to use instead of an in-memory one")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    with open(args.path, "r", encoding="utf-8") as f:
+        text = f.read()
+    embedder = SentenceTransformer(args.model, device="cpu")
+    qdrant = QdrantClient(url=args.qdrant_url) if args.qdrant_url else QdrantClient(":memory:")
+    q_vectors = embedder.encode(QUESTIONS, convert_to_numpy=True)
+    sections = dict(split_sections(text))
+    sections[None] = text  # fixed-width offsets point into the whole file
+    topics = [topic for topic in sections if topic]
+
+    results = {"chunk_max_tokens": CHUNK_MAX_TOKENS, "topics": len(topics)}
+    # The old indexer sliced the whole file, banners included
+    for kind, chunker in (("fixed", lambda: chunk_fixed(text, args.size)), ("structured", lambda: chunk_document(text))):
+        name = f"chunking_bench_{kind}"
+        if qdrant.collection_exists(name):
+            qdrant.delete_collection(name)
+        start = time.perf_counter()
+        chunks = chunker()
+        chunk_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        vectors = embedder.encode([c.text for c in chunks], batch_size=64, convert_to_numpy=True)
+        results[kind] = {
+            **chunk_quality(chunks, sections),
+            "chunk_seconds": round(chunk_seconds, 4),
+            "embed_seconds": round(time.perf_counter() - start, 2),
+            **build_index(qdrant, name, chunks, vectors),
+            "search": search_latency(qdrant, name, q_vectors, args.queries),
+        }
+
+    # Topic pre-filter: each question restricted to the three topics whose titles match it best
+    qdrant.create_payload_index("chunking_bench_structured", "topic", field_schema="keyword", wait=True)
+    title_vectors = embedder.encode([t.replace("-", " ") for t in topics], convert_to_numpy=True,
+                                    normalize_embeddings=True)
+    filters = []
+    for q in q_vectors:
+        best = (title_vectors @ (q / (q ** 2).sum() ** 0.5)).argsort()[::-1][:3]
+        filters.append(Filter(must=[FieldCondition(key="topic", match=MatchAny(any=[topics[i] for i in best]))]))
+    results["structured"]["search_topic_filtered"] = search_latency(qdrant, "chunking_bench_structured",
+                                                                    q_vectors, args.queries, filters)
+    for kind in ("fixed", "structured"):
+        qdrant.delete_collection(f"chunking_bench_{kind}")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
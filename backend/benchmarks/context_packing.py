@@ -0,0 +1,131 @@
+"""Prompt size and /ask latency with the context packer off and on.
+
+Starts the app twice offline (in-memory Qdrant, fake LLM; see end_to_end.py), with
+CONTEXT_PACKING=off and =on, uploads the same synthetic report to each, and asks every question:
+    python benchmarks/context_packing.py --budget 512 --top-k 6 --prompt-ms-per-1k 400 --requests 64
+
+The fake model waits --prompt-ms-per-1k for every 1000 prompt tokens before its first token,
+standing in for the prompt-processing time of a hosted model, so shorter prompts show up in the
+latency as they would with Gemini. The answer cache is off, so every request builds a prompt.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench_common import QUESTIONS, percentile
+from end_to_end import BACKEND_DIR, upload_reports, wait_for, write_guidelines_subset
+
+
+async def ask_all(base_url: str, session_id: str, total: int, concurrency: int, timeout: float,
+                  top_k: int = 3) -> dict:
+    latencies, prompt_tokens, errors = [], [], 0
+    next_request = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def user():
+            nonlocal next_request, errors
+            while next_request < total:
+                i = next_request
+                next_request += 1
+                start = time.perf_counter()
+                r = await client.post("/ask", json={"question": QUESTIONS[i % len(QUESTIONS)],
+                                                    "candidates": max(4, top_k), "report_top_k": top_k,
+                                                    "who_top_k": top_k},
+                                      headers={"X-Session-ID": session_id})
+                if r.status_code != 200:
+                    errors += 1
+                    continue
+                latencies.append((time.perf_counter() - start) * 1000)
+                prompt_tokens.append(r.json()["prompt_tokens"])
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "prompt_tokens_mean": round(statistics.fmean(prompt_tokens), 1) if prompt_tokens else None,
+        "prompt_tokens_max": max(prompt_tokens, default=None),
+        **{f"p{pct}_ms": round(percentile(latencies, pct), 1) if latencies else None for pct in (50, 95, 99)},
+    }
+
+
+def run_config(packing: str, env: dict, args, workdir: str) -> dict:
+    env = {**env, "CONTEXT_PACKING": packing, "EMBEDDING_CACHE_DIR": os.path.join(workdir, f"cache_{packing}")}
+    base_url = f"http://127.0.0.1:{args.port}"
+    with open(os.path.join(workdir, f"server_{packing}.log"), "w") as log:
+        proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+                                 "--log-level", "warning"],
+                                cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=log)
+        try:
+            if wait_for(f"{base_url}/health/ready", time.monotonic() + args.ready_timeout, proc) is None:
+                return {"context_packing": packing, "error": "server did not become ready"}
+            upload = asyncio.run(upload_reports(base_url, workdir, [args.report_pages], args.timeout))[0]
+            session_id = f"bench-upload-{args.report_pages}"
+            asyncio.run(ask_all(base_url, session_id, len(QUESTIONS), 1, args.timeout))  # warm-up
+            result = asyncio.run(ask_all(base_url, session_id, args.requests, args.concurrency, args.timeout,
+                                         args.top_k))
+            return {"context_packing": packing, "report_chunks": upload["chunks"], **result}
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt size and /ask latency, context packing off and on.")
+    parser.add_argument("--guidelines", default=os.path.join(BACKEND_DIR, "..", "who_data", "who_az_guidelines.txt"))
+    parser.add_argument("--who-topics", type=int, default=40, help="First N WHO topics to index (0: all)")
+    parser.add_argument("--report-pages", type=int, default=10)
+    parser.add_argument("--budget", type=int, default=512, help="CONTEXT_TOKEN_BUDGET for the packed run")
+    parser.add_argument("--top-k", type=int, default=3, help="Reranked chunks kept per source (report/who_top_k)")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-first-token-ms", type=float, default=300)
+    parser.add_argument("--prompt-ms-per-1k", type=float, default=400)
+    parser.add_argument("--port", type=int, default=8300)
+    parser.add_argument("--ready-timeout", type=float, default=600.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="medrag_packing_") as workdir:
+        guidelines = args.guidelines
+        if args.who_topics:
+            guidelines = os.path.join(workdir, "who_guidelines.txt")
+            write_guidelines_subset(args.guidelines, args.who_topics, guidelines)
+        env = {
+            **os.environ,
+            "QDRANT_URL": ":memory:",
+            "LLM_BACKEND": "fake",
+            "FAKE_LLM_FIRST_TOKEN_MS": str(args.llm_first_token_ms),
+            "FAKE_LLM_TOKEN_MS": "5",
+            "FAKE_LLM_PROMPT_MS_PER_1K_TOKENS": str(args.prompt_ms_per_1k),
+            "CONTEXT_TOKEN_BUDGET": str(args.budget),
+            "WHO_GUIDELINES_PATH": guidelines,
+            "LOCAL_INDEX_DIR": os.path.join(workdir, "local_index"),
+            "UPLOAD_SPOOL_DIR": workdir,
+            "ANSWER_CACHE_SIZE": "0",
+            "LOG_LEVEL": "WARNING",
+        }
+        results = [run_config(packing, env, args, workdir) for packing in ("off", "on")]
+
+    before, after = results
+    if before.get("prompt_tokens_mean") and after.get("prompt_tokens_mean"):
+        print(f"prompt tokens {before['prompt_tokens_mean']} -> {after['prompt_tokens_mean']}, "
+              f"p50 {before['p50_ms']} -> {after['p50_ms']} ms", file=sys.stderr)
+    print(json.dumps({"budget": args.budget, "top_k": args.top_k, "prompt_ms_per_1k": args.prompt_ms_per_1k,
+                      "runs": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""Offline end-to-end benchmark: cold start, WHO indexing, /upload and /ask, with JSON results.
+
+Needs no network or API keys: Qdrant runs in-process (QDRANT_URL=:memory:) and the LLM is the
+deterministic fake from llm.py (LLM_BACKEND=fake), with a configurable latency:
+    python benchmarks/end_to_end.py --output bench.json [--baseline previous.json]
+
+Phases, each against fresh caches in a temporary directory:
+  who_index  sync of the WHO guidelines into an in-memory Qdrant, in a process of its own (chunks/s)
+  cold_start `uvicorn main:app` from spawn to /health/live answering and to /health/ready
+  upload     /upload of synthetic PDFs of growing size, until each ingestion job is done (pages/s)
+  ask        /ask at several concurrency levels, answer cache off (RPS, p50/p95/p99)
+plus the server's peak RSS after each phase. --who-topics limits the corpus for quicker runs.
+With --baseline, each headline number is also reported relative to an earlier results file.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from bench_common import QUESTIONS, percentile  # noqa: E402
+from process_stats import memory_stats, peak_rss_mb  # noqa: E402
+
+REPORT_LINES = [
+    "Haemoglobin: {v:.1f} g/dL (reference 12.0-15.5)",
+    "Fasting glucose: {v:.0f} mg/dL; HbA1c {h:.1f}%",
+    "Blood pressure {s:.0f}/{d:.0f} mmHg, heart rate {r:.0f} bpm",
+    "Total cholesterol {v:.0f} mg/dL, LDL {h:.0f} mg/dL",
+    "Assessment: patient advised on diet, physical activity and follow-up in {r:.0f} days.",
+]
+# Headline numbers compared against --baseline, and whether higher is better
+HEADLINES = {
+    ("who_index", "chunks_per_second"): True,
+    ("cold_start", "import_seconds"): False,
+    ("cold_start", "ready_seconds"): False,
+    ("server", "peak_rss_mb"): False,
+}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_guidelines_subset(source: str, topics: int, path: str):
+    from who_index import read_guidelines, split_topics
+
+    sections = list(split_topics(read_guidelines(source)).items())[:topics]
+    with open(path, "w", encoding="utf-8") as f:
+        for title, text in sections:
+            f.write(f"\n\n{'=' * 40}\n{title}\n{'=' * 40}\n{text}")
+
+
+def write_report_pdf(path: str, pages: int, lines_per_page: int = 40):
+    import fitz  # PyMuPDF, as used by pdf_extract.py
+
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        lines = [f"Patient report, page {p + 1} of {pages}"]
+        for i in range(lines_per_page):
+            line = REPORT_LINES[(p + i) % len(REPORT_LINES)]
+            lines.append(line.format(v=90 + (p * 7 + i * 3) % 80, h=5 + (p + i) % 4, s=110 + (p + i) % 40,
+                                     d=70 + (p * 3 + i) % 20, r=60 + (p + i * 5) % 40))
+        page.insert_text((48, 56), "\n".join(lines), fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+# === Phases ===
+def who_index_worker(path: str) -> dict:
+    # Runs in a process of its own, so model loading and indexing don't count towards the server's RSS
+    from qdrant_client import QdrantClient
+
+    from embedding_store import EmbeddingStore
+    from models import EMBEDDER_MODEL_NAME, EMBEDDING_DIM, load_embedder, model_id
+    from vector_db import ensure_collection
+    from who_index import sync_who_guidelines
+
+    start = time.perf_counter()
+    embedder = load_embedder()
+    load_seconds = time.perf_counter() - start
+    qdrant = QdrantClient(location=":memory:")
+    ensure_collection(qdrant, "medical_docs", EMBEDDING_DIM)
+    store = EmbeddingStore(model_id(EMBEDDER_MODEL_NAME), EMBEDDING_DIM)
+    cold = sync_who_guidelines(qdrant, "medical_docs", embedder, store=store, path=path)
+    # Same file, empty Qdrant: every vector now comes from the embedding store
+    qdrant = QdrantClient(location=":memory:")
+    ensure_collection(qdrant, "medical_docs", EMBEDDING_DIM)
+    cached = sync_who_guidelines(qdrant, "medical_docs", embedder, store=store, path=path)
+    return {
+        "model_load_seconds": round(load_seconds, 2),
+        "topics": len(cold.topics),
+        "chunks": cold.chunks_indexed,
+        "seconds": round(cold.seconds, 2),
+        "chunks_per_second": round(cold.chunks_indexed / cold.seconds, 1) if cold.seconds else None,
+        "from_embedding_store_seconds": round(cached.seconds, 2),
+        "from_embedding_store_chunks_per_second":
+            round(cached.chunks_indexed / cached.seconds, 1) if cached.seconds else None,
+        "failed_topics": cold.failed,
+    }
+
+
+def run_who_index(env: dict, path: str) -> dict:
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--who-index-worker", path],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1:]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def wait_for(url: str, deadline: float, proc: subprocess.Popen) -> float | None:
+    while time.monotonic() < deadline and proc.poll() is None:
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return time.monotonic()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    return None
+
+
+async def upload_reports(base_url: str, workdir: str, sizes: list[int], timeout: float,
+                         session_prefix: str = "bench-upload") -> list[dict]:
+    results = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+        for pages in sizes:
+            path = os.path.join(workdir, f"report_{pages}p.pdf")
+            write_report_pdf(path, pages)
+            headers = {"X-Session-ID": f"{session_prefix}-{pages}"}
+            start = time.perf_counter()
+            with open(path, "rb") as f:
+                r = await client.post("/upload", files={"file": (os.path.basename(path), f, "application/pdf")},
+                                      headers=headers)
+            r.raise_for_status()
+            job = r.json()
+            while True:
+                status = (await client.get(job["status_url"], headers=headers)).json()
+                if status["status"] not in ("queued", "running"):
+                    break
+                await asyncio.sleep(0.05)
+            seconds = time.perf_counter() - start
+            results.append({
+                "pages": pages,
+                "mb": round(os.path.getsize(path) / 2**20, 2),
+                "status": status["status"],
+                "chunks": status["chunks_indexed"],
+                "seconds": round(seconds, 3),
+                "pages_per_second": round(pages / seconds, 2),
+                "chunks_per_second": round(status["chunks_indexed"] / seconds, 1),
+            })
+    return results
+
+
+async def ask_level(base_url: str, session_id: str, concurrency: int, total: int, timeout: float) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    next_request = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def user():
+            nonlocal next_request, errors
+            while next_request < total:
+                i = next_request
+                next_request += 1
+                start = time.perf_counter()
+                r = await client.post("/ask", json={"question": QUESTIONS[i % len(QUESTIONS)]},
+                                      headers={"X-Session-ID": session_id})
+                if r.status_code == 200:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        **{f"p{pct}_ms": round(percentile(latencies, pct), 1) if latencies else None for pct in (50, 95, 99)},
+    }
+
+
+def run_server(env: dict, args, workdir: str, results: dict):
+    base_url = f"http://127.0.0.1:{args.port}"
+    log = open(os.path.join(workdir, "server.log"), "w")
+    spawned = time.monotonic()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+                             "--log-level", "warning"],
+                            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=log)
+    try:
+        deadline = spawned + args.ready_timeout
+        live = wait_for(f"{base_url}/health/live", deadline, proc)
+        ready = wait_for(f"{base_url}/health/ready", deadline, proc)
+        if ready is None:
+            results["cold_start"] = {"error": "server did not become ready, see server.log"}
+            return
+        readiness = httpx.get(f"{base_url}/health/ready").json()
+        results["cold_start"] = {
+            "live_seconds": round(live - spawned, 2),
+            "ready_seconds": round(ready - spawned, 2),
+            "import_seconds": readiness["import_seconds"],
+            "components_ready_at": readiness["seconds_since_import"],
+        }
+        results["server"] = {"after_cold_start": memory_stats(proc.pid)}
+
+        # The first upload also starts the PDF extraction processes; kept apart from the size series
+        results["upload_first"] = asyncio.run(upload_reports(base_url, workdir, [1], args.timeout, "bench-first"))[0]
+        results["upload"] = asyncio.run(upload_reports(base_url, workdir, args.upload_pages, args.timeout))
+        results["server"]["after_upload"] = memory_stats(proc.pid)
+
+        # Questions go to the session holding the largest report, so both sources return context
+        session_id = f"bench-upload-{max(args.upload_pages)}" if args.upload_pages else "bench-ask"
+        asyncio.run(ask_level(base_url, session_id, 1, len(QUESTIONS), args.timeout))  # first-request warm-up
+        results["ask"] = [asyncio.run(ask_level(base_url, session_id, c, args.requests, args.timeout))
+                          for c in args.concurrency]
+        results["server"]["after_ask"] = memory_stats(proc.pid)
+        results["server"]["peak_rss_mb"] = peak_rss_mb(proc.pid)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+
+
+def compare(results: dict, baseline: dict) -> dict:
+    # Relative change of each headline number; positive is better
+    deltas = {}
+    headlines = dict(HEADLINES)
+    for level in results.get("upload", []):
+        headlines[(f"upload@{level['pages']}", "pages_per_second")] = True
+    for level in results.get("ask", []):
+        c = level["concurrency"]
+        headlines.update({(f"ask@{c}", "rps"): True, (f"ask@{c}", "p95_ms"): False})
+
+    def lookup(r: dict, phase: str, key: str):
+        # "ask@16" is the /ask level with concurrency 16, "upload@50" the 50-page upload
+        if "@" in phase:
+            series, level_key = phase.split("@")
+            field = "concurrency" if series == "ask" else "pages"
+            level = next((x for x in r.get(series, []) if x[field] == int(level_key)), {})
+            return level.get(key)
+        return (r.get(phase) or {}).get(key)
+
+    for (phase, key), higher_is_better in headlines.items():
+        now, before = lookup(results, phase, key), lookup(baseline, phase, key)
+        if now is None or not before:
+            continue
+        change = (now - before) / before
+        deltas[f"{phase}.{key}"] = {"baseline": before, "now": now,
+                                    "improvement_pct": round(100 * (change if higher_is_better else -change), 1)}
+    return deltas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark (in-memory Qdrant, fake LLM).")
+    parser.add_argument("--output", help="Write the results JSON here (default: stdout only)")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument("--guidelines", default=os.path.join(BACKEND_DIR, "..", "who_data", "who_az_guidelines.txt"))
+    parser.add_argument("--who-topics", type=int, default=40, help="First N WHO topics to index (0: all)")
+    parser.add_argument("--upload-pages", type=int, nargs="*", default=[1, 10, 50], help="Synthetic PDF sizes")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=64, help="/ask requests per concurrency level")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300)
+    parser.add_argument("--llm-token-ms", type=float, default=5)
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--ready-timeout", type=float, default=600.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--who-index-worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.who_index_worker:
+        print(json.dumps(who_index_worker(args.who_index_worker)))
+        return
+
+    results = {
+        "commit": git_commit(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": {"python": platform.python_version(), "cpus": os.cpu_count(), "machine": platform.machine()},
+        "settings": {k: v for k, v in vars(args).items() if k not in ("who_index_worker", "output", "baseline")},
+    }
+    with tempfile.TemporaryDirectory(prefix="medrag_bench_") as workdir:
+        guidelines = args.guidelines
+        if args.who_topics:
+            guidelines = os.path.join(workdir, "who_guidelines.txt")
+            write_guidelines_subset(args.guidelines, args.who_topics, guidelines)
+        env = {
+            **os.environ,
+            "QDRANT_URL": ":memory:",
+            "LLM_BACKEND": "fake",
+            "FAKE_LLM_FIRST_TOKEN_MS": str(args.llm_first_token_ms),
+            "FAKE_LLM_TOKEN_MS": str(args.llm_token_ms),
+            "WHO_GUIDELINES_PATH": guidelines,
+            "ANSWER_CACHE_SIZE": "0",
+            "ANSWER_CACHE_PATH": "",
+            "LOG_LEVEL": "WARNING",
+        }
+        # Fresh caches per phase, so neither one starts warm
+        results["who_index"] = run_who_index({**env, "EMBEDDING_CACHE_DIR": os.path.join(workdir, "who_cache")},
+                                             guidelines)
+        print(f"who_index: {results['who_index']}", file=sys.stderr)
+        run_server({**env, "EMBEDDING_CACHE_DIR": os.path.join(workdir, "server_cache"),
+                    "LOCAL_INDEX_DIR": os.path.join(workdir, "local_index"),
+                    "UPLOAD_SPOOL_DIR": workdir}, args, workdir, results)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            results["vs_baseline"] = compare(results, json.load(f))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
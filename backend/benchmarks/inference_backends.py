@@ -0,0 +1,127 @@
+"""Latency, memory and accuracy of the embedder/cross-encoder inference backends.
+
+Every backend is loaded in its own process so RSS numbers don't overlap; outputs are compared
+against the fp32 PyTorch ("torch") backend:
+    python benchmarks/inference_backends.py --backends torch int8 onnx onnx-int8 --runs 50
+Set INFERENCE_THREADS to the value you intend to deploy with.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import compare_embeddings, compare_scores, load_embedder, load_reranker  # noqa: E402
+
+QUESTIONS = [
+    "What is my hemoglobin level?",
+    "How is type 2 diabetes managed?",
+    "What are the symptoms of anaemia?",
+    "How is malaria transmitted?",
+    "What are the risk factors for pre-eclampsia?",
+    "Which vaccines protect against measles?",
+    "Is an HbA1c of 7.2% too high?",
+    "How can asthma attacks be prevented?",
+]
+PASSAGES = [
+    "Anaemia is a condition in which the number of red blood cells or the haemoglobin concentration is lower than normal.",
+    "Malaria is transmitted to people through the bites of infected female Anopheles mosquitoes.",
+    "Type 2 diabetes can be managed with a healthy diet, regular physical activity, medication and regular screening.",
+    "Pre-eclampsia is more common in first pregnancies and in women with chronic hypertension or diabetes.",
+    "Measles can be prevented with two doses of a safe and effective vaccine.",
+    "Haemoglobin 10.9 g/dL (reference range 12.0-15.5). HbA1c 7.2%. Fasting glucose 142 mg/dL.",
+    "Using a spacer device makes it easier to use an aerosol inhaler and helps the medicine reach the lungs.",
+    "Ambient air pollution is estimated to have caused 4.2 million premature deaths worldwide in 2019.",
+]
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed_ms(fn, runs: int) -> dict:
+    fn()  # warm-up
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": round(statistics.median(samples), 2), "mean_ms": round(statistics.mean(samples), 2)}
+
+
+def run_backend(backend: str, runs: int) -> dict:
+    rss_start = rss_mb()
+    start = time.perf_counter()
+    embedder = load_embedder(backend=backend)
+    reranker = load_reranker(backend=backend)
+    load_seconds = time.perf_counter() - start
+    rss_loaded = rss_mb()
+
+    pairs = [(q, p) for q in QUESTIONS for p in PASSAGES]
+    result = {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 2),
+        "models_rss_mb": round(rss_loaded - rss_start, 1),
+        # The shapes /ask produces: one question, a batch of chunks at ingestion, an 8-pair rerank pool
+        "embed_question": timed_ms(lambda: embedder.encode([QUESTIONS[0]], convert_to_numpy=True), runs),
+        "embed_batch_8": timed_ms(lambda: embedder.encode(PASSAGES, batch_size=8, convert_to_numpy=True), runs),
+        "rerank_8_pairs": timed_ms(lambda: reranker.predict(pairs[:8], batch_size=8), runs),
+        "embeddings": embedder.encode(QUESTIONS + PASSAGES, convert_to_numpy=True).tolist(),
+        "scores": np.asarray(reranker.predict(pairs, batch_size=len(pairs))).tolist(),
+    }
+    result["peak_rss_mb"] = round(rss_mb(), 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CPU inference backends against fp32 PyTorch.")
+    parser.add_argument("--backends", nargs="+", default=["torch", "int8", "onnx", "onnx-int8"])
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_backend(args.worker, args.runs)))
+        return
+
+    results = {}
+    for backend in dict.fromkeys(["torch", *args.backends]):
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", backend, "--runs", str(args.runs)],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"{backend}: failed\n{proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else ''}")
+            continue
+        results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    reference = results.get("torch")
+    if reference is None:
+        raise SystemExit("The torch reference backend failed to run.")
+    report = []
+    for backend, r in results.items():
+        row = {key: r[key] for key in ("backend", "load_seconds", "models_rss_mb", "peak_rss_mb",
+                                       "embed_question", "embed_batch_8", "rerank_8_pairs")}
+        row["speedup_vs_torch"] = {
+            key: round(reference[key]["p50_ms"] / r[key]["p50_ms"], 2)
+            for key in ("embed_question", "embed_batch_8", "rerank_8_pairs")
+        }
+        row["embedding_accuracy"] = compare_embeddings(np.array(reference["embeddings"]), np.array(r["embeddings"]))
+        row["rerank_accuracy"] = compare_scores(np.array(reference["scores"]), np.array(r["scores"]), len(PASSAGES))
+        report.append(row)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Concurrent load test for /ask.
+
+Usage (against a running server):
+    python benchmarks/load_test.py --url http://localhost:8000 --concurrency 1 8 32 --requests 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from bench_common import QUESTIONS, percentile
+
+
+async def run_level(url: str, concurrency: int, total: int, timeout: float) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    next_request = 0
+
+    async def client(http: httpx.AsyncClient):
+        nonlocal next_request, errors
+        while next_request < total:
+            i = next_request
+            next_request += 1
+            start = time.perf_counter()
+            try:
+                response = await http.post(f"{url}/ask", json={"question": QUESTIONS[i % len(QUESTIONS)]})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as http:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else None,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Measure /ask latency under concurrent clients.")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    print(f"{'clients':>8} {'ok':>6} {'errors':>7} {'rps':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    for concurrency in args.concurrency:
+        r = await run_level(args.url, concurrency, args.requests, args.timeout)
+        p50 = f"{r['p50_ms']:.0f}" if r["p50_ms"] is not None else "-"
+        p99 = f"{r['p99_ms']:.0f}" if r["p99_ms"] is not None else "-"
+        print(f"{r['concurrency']:>8} {r['requests']:>6} {r['errors']:>7} {r['rps']:>8.1f} {p50:>9} {p99:>9}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+"""Time-to-first-token for /ask/stream versus time-to-answer for /ask.
+
+Start the server with the fake model to get repeatable numbers:
+    LLM_BACKEND=fake FAKE_LLM_FIRST_TOKEN_MS=300 FAKE_LLM_TOKEN_MS=20 uvicorn main:app --port 8000
+    python benchmarks/ttft.py --url http://localhost:8000 --runs 20
+
+tests/test_streaming.py checks the same ordering in-process, without a server.
+"""
+import argparse
+import json
+import statistics
+import time
+
+import httpx
+
+
+def stream_once(http: httpx.Client, url: str, question: str) -> dict:
+    start = time.perf_counter()
+    timings = {"meta": None, "first_token": None, "done": None}
+    tokens = []
+    with http.stream("POST", f"{url}/ask/stream", json={"question": question}) as response:
+        response.raise_for_status()
+        event = None
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                now = time.perf_counter() - start
+                if event == "meta" and timings["meta"] is None:
+                    timings["meta"] = now
+                elif event == "token":
+                    tokens.append(json.loads(line[len("data: "):])["text"])
+                    if timings["first_token"] is None:
+                        timings["first_token"] = now
+                elif event in ("done", "error"):
+                    timings["done"] = now
+    return timings
+
+
+def blocking_once(http: httpx.Client, url: str, question: str) -> float:
+    start = time.perf_counter()
+    http.post(f"{url}/ask", json={"question": question}).raise_for_status()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare streaming TTFT with blocking /ask latency.")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    streamed, blocking = [], []
+    with httpx.Client(timeout=120.0) as http:
+        for i in range(args.runs):
+            # Distinct questions so the answer cache doesn't short-circuit generation
+            streamed.append(stream_once(http, args.url, f"What are the symptoms of anaemia? ({i} stream)"))
+            blocking.append(blocking_once(http, args.url, f"What are the symptoms of anaemia? ({i} blocking)"))
+
+    def median_ms(values):
+        values = [v for v in values if v is not None]
+        return f"{statistics.median(values) * 1000:.0f} ms" if values else "-"
+
+    print(f"/ask/stream  meta:        {median_ms([t['meta'] for t in streamed])}")
+    print(f"/ask/stream  first token: {median_ms([t['first_token'] for t in streamed])}")
+    print(f"/ask/stream  complete:    {median_ms([t['done'] for t in streamed])}")
+    print(f"/ask         complete:    {median_ms(blocking)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""WHO fact-sheet fetcher throughput, against a local stand-in for www.who.int.
+
+Serves every page in who_data/data_loader.py from a threaded HTTP server with a simulated
+latency and ETag/Last-Modified validators, then runs the fetcher:
+    python benchmarks/who_fetch.py --latency-ms 150 --concurrency 1 8 16 --changed 10
+
+For each concurrency: a cold fetch (every page downloaded), a warm re-run (every page a 304),
+and a re-run after `--changed` pages were edited on the server. Reports pages/s and outcomes.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "who_data"))
+from data_loader import Fetcher, players  # noqa: E402
+
+PARAGRAPH = ("Fact sheet paragraph {i} about {topic}: key facts, symptoms, treatment and prevention, "
+             "with the WHO response and the figures reported by member states [1]. ")
+
+
+class StandInSite:
+    """The fact-sheet pages, keyed by URL path, with a revision counter per page."""
+
+    def __init__(self, paragraphs: int):
+        self.paragraphs = paragraphs
+        self.revisions = {urlsplit(url).path: 0 for url in players.values()}
+        self.last_modified = formatdate(time.time(), usegmt=True)
+        self.requests = {"200": 0, "304": 0}
+        self._lock = threading.Lock()
+
+    def page(self, path: str) -> tuple[bytes, str]:
+        topic = path.rsplit("/", 1)[-1]
+        body = "".join(f"<p>{PARAGRAPH.format(i=i, topic=topic)}</p>\n" for i in range(self.paragraphs))
+        html = f"<html><body><h1>{topic}</h1>\n{body}<p>Revision {self.revisions[path]}.</p></body></html>"
+        data = html.encode()
+        return data, '"' + hashlib.sha1(data).hexdigest() + '"'
+
+    def change(self, count: int):
+        for path in list(self.revisions)[:count]:
+            self.revisions[path] += 1
+        self.last_modified = formatdate(time.time(), usegmt=True)
+
+
+def make_handler(site: StandInSite, latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so the fetcher's connection pool is exercised
+
+        def do_GET(self):
+            time.sleep(latency)
+            path = urlsplit(self.path).path
+            if path not in site.revisions:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            data, etag = site.page(path)
+            if self.headers.get("If-None-Match") == etag:
+                with site._lock:
+                    site.requests["304"] += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            with site._lock:
+                site.requests["200"] += 1
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", site.last_modified)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def summarize(run: dict) -> dict:
+    return {
+        "pages": run["pages"],
+        "seconds": run["seconds"],
+        "pages_per_second": run["pages_per_second"],
+        **{outcome: len(run[outcome]) for outcome in ("added", "changed", "unchanged", "failed")},
+    }
+
+
+def run_fetcher(workdir: str, base_url: str, concurrency: int) -> dict:
+    fetcher = Fetcher(workdir, base_url=base_url, concurrency=concurrency)
+    run = fetcher.run(players)
+    fetcher.write_guidelines(players, os.path.join(workdir, "who_az_guidelines.txt"))
+    return summarize(run)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the WHO fetcher against a local stand-in server.")
+    parser.add_argument("--latency-ms", type=float, default=100, help="Simulated server latency per request")
+    parser.add_argument("--paragraphs", type=int, default=40, help="Paragraphs per page")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 16])
+    parser.add_argument("--changed", type=int, default=10, help="Pages edited before the incremental run")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    site = StandInSite(args.paragraphs)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(site, args.latency_ms / 1000))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    results = {"pages": len(players), "latency_ms": args.latency_ms, "runs": {}}
+    for concurrency in args.concurrency:
+        with tempfile.TemporaryDirectory() as workdir:
+            cold = run_fetcher(workdir, base_url, concurrency)
+            warm = run_fetcher(workdir, base_url, concurrency)
+            site.change(args.changed)
+            incremental = run_fetcher(workdir, base_url, concurrency)
+        results["runs"][concurrency] = {"cold": cold, "warm": warm, "incremental": incremental}
+        print(f"concurrency={concurrency}: cold {cold['pages_per_second']} pages/s, "
+              f"warm {warm['pages_per_second']} pages/s, incremental {incremental['changed']} changed", file=sys.stderr)
+    results["server_responses"] = site.requests
+    server.shutdown()
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,132 @@
+"""Throughput and memory of the gunicorn multi-worker mode, from 1 to N workers.
+
+Starts `gunicorn -c gunicorn.conf.py main:app` once per worker count, waits until every
+worker is warmed up, then keeps CONCURRENCY /ask requests in flight for DURATION seconds:
+    LLM_BACKEND=fake python benchmarks/worker_scaling.py --workers 1 2 4 --concurrency 16
+Needs a Qdrant server (QDRANT_URL) with the WHO guidelines indexed; ":memory:" can't be shared
+between workers. The answer cache is disabled so every request runs retrieval and reranking.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from bench_common import QUESTIONS, percentile  # noqa: E402
+from process_stats import child_pids, memory_stats  # noqa: E402
+
+
+def wait_until_ready(base_url: str, workers: int, master_pid: int, timeout: float) -> bool:
+    # Every worker warms up on its own, so poll until each of them reports ready
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        pids = child_pids(master_pid)
+        if len(pids) == workers:
+            ready = set()
+            for _ in range(workers * 8):
+                try:
+                    # A fresh connection each time, so requests spread over the workers
+                    stats = httpx.get(f"{base_url}/stats/memory", timeout=5).json()
+                except (httpx.HTTPError, ValueError):
+                    break
+                if stats.get("ready"):
+                    ready.add(stats["pid"])
+            if ready >= set(pids):
+                return True
+        time.sleep(1)
+    return False
+
+
+async def load(base_url: str, concurrency: int, duration: float) -> dict:
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        async def user(n: int):
+            nonlocal errors
+            i = n
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                r = await client.post("/ask", json={"question": QUESTIONS[i % len(QUESTIONS)]},
+                                      headers={"X-Session-ID": f"bench-{n}"})
+                if r.status_code == 200:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                else:
+                    errors += 1
+                i += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50), 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95), 1) if latencies else None,
+    }
+
+
+def run_workers(workers: int, args) -> dict:
+    env = {**os.environ, "WEB_CONCURRENCY": str(workers), "PORT": str(args.port), "ANSWER_CACHE_SIZE": "0"}
+    env.setdefault("LLM_BACKEND", "fake")
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+                            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        started = time.perf_counter()
+        if not wait_until_ready(base_url, workers, proc.pid, args.ready_timeout):
+            return {"workers": workers, "error": "workers did not become ready"}
+        ready_seconds = time.perf_counter() - started
+        result = {"workers": workers, "ready_seconds": round(ready_seconds, 1),
+                  **asyncio.run(load(base_url, args.concurrency, args.duration))}
+
+        master = memory_stats(proc.pid)
+        worker_stats = [memory_stats(pid) for pid in child_pids(proc.pid)]
+        result["memory"] = {
+            "master_pss_mb": master.get("pss_mb"),
+            "workers_pss_mb": [w.get("pss_mb") for w in worker_stats],
+            "workers_private_mb": [w.get("private_mb") for w in worker_stats],
+            "total_pss_mb": round(master.get("pss_mb", 0) + sum(w.get("pss_mb", 0) for w in worker_stats), 1),
+        }
+        return result
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure /ask throughput and memory from 1 to N gunicorn workers.")
+    parser.add_argument("--workers", type=int, nargs="+", default=list(range(1, (os.cpu_count() or 1) + 1)))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--ready-timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    results = [run_workers(n, args) for n in args.workers]
+    base = next((r for r in results if r["workers"] == 1 and "memory" in r), None)
+    for r in results:
+        if base is None or "memory" not in r:
+            continue
+        r["speedup_vs_1"] = round(r["throughput_rps"] / base["throughput_rps"], 2) if base["throughput_rps"] else None
+        if r["workers"] > 1:
+            # What each worker beyond the first adds to the machine's real (proportional) footprint
+            extra = (r["memory"]["total_pss_mb"] - base["memory"]["total_pss_mb"]) / (r["workers"] - 1)
+            r["memory"]["per_extra_worker_mb"] = round(extra, 1)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import os
+import re
+from dataclasses import dataclass
+
+# === Chunking Settings ===
+# Budgets are in estimated model tokens; all-MiniLM-L12-v2 truncates input at 128 word pieces
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "96"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))  # about one sentence of fact-sheet prose
+# Part of the WHO manifest hash, so changing the chunker re-indexes every topic
+CHUNKER_VERSION = f"structured-v1-{CHUNK_MAX_TOKENS}-{CHUNK_OVERLAP_TOKENS}"
+
+# data_loader.py writes every fact sheet as "====\n<topic>\n====\n<text>"
+TOPIC_BANNER = re.compile(r"^={10,}\n(.+?)\n={10,}$", re.MULTILINE)
+PARAGRAPH = re.compile(r"[^\n]+")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+WORD = re.compile(r"\S+")
+TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+@dataclass
+class Chunk:
+    text: str
+    offset: int              # character offset of the chunk within its section
+    topic: str | None = None
+
+    def payload(self) -> dict:
+        payload = {"offset": self.offset}
+        if self.topic is not None:
+            payload["topic"] = self.topic
+        return payload
+
+
+@dataclass
+class Span:
+    start: int
+    end: int
+    tokens: int
+    new_paragraph: bool
+
+
+def estimate_tokens(text: str) -> int:
+    # Words and punctuation marks: close to WordPiece counts for English prose, no tokenizer needed
+    return len(TOKEN.findall(text))
+
+
+def split_sections(text: str) -> list[tuple[str | None, str]]:
+    # (topic, body) pairs in file order; text before the first banner has no topic
+    banners = list(TOPIC_BANNER.finditer(text))
+    sections = []
+    preamble = text[:banners[0].start()] if banners else text
+    if preamble.strip():
+        sections.append((None, preamble.strip()))
+    for banner, next_banner in zip(banners, banners[1:] + [None]):
+        body = text[banner.end():next_banner.start() if next_banner else len(text)].strip()
+        sections.append((banner.group(1).strip(), body))
+    return sections
+
+
+def _spans(text: str, max_tokens: int):
+    # Sentences within paragraphs; a sentence over budget is cut at word boundaries
+    for paragraph in PARAGRAPH.finditer(text):
+        first = True
+        pos = paragraph.start()
+        breaks = [m for m in SENTENCE_BREAK.finditer(text, paragraph.start(), paragraph.end())]
+        bounds = [(pos, b.start()) for pos, b in zip([pos] + [b.end() for b in breaks], breaks)]
+        bounds.append((breaks[-1].end() if breaks else pos, paragraph.end()))
+        for start, end in bounds:
+            if start >= end:
+                continue
+            tokens = estimate_tokens(text[start:end])
+            if tokens <= max_tokens:
+                yield Span(start, end, tokens, first)
+                first = False
+                continue
+            piece_start, piece_tokens, piece_end = None, 0, start
+            for word in WORD.finditer(text, start, end):
+                word_tokens = estimate_tokens(word.group())
+                if piece_start is not None and piece_tokens + word_tokens > max_tokens:
+                    yield Span(piece_start, piece_end, piece_tokens, first)
+                    first = False
+                    piece_start, piece_tokens = None, 0
+                if piece_start is None:
+                    piece_start = word.start()
+                piece_tokens += word_tokens
+                piece_end = word.end()
+            if piece_start is not None:
+                yield Span(piece_start, piece_end, piece_tokens, first)
+                first = False
+
+
+def chunk_section(text: str, topic: str | None = None, max_tokens: int = CHUNK_MAX_TOKENS,
+                  overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> list[Chunk]:
+    """Pack whole sentences into chunks of at most `max_tokens` estimated tokens.
+
+    Chunks prefer to end at paragraph breaks once they are three-quarters full. Within a
+    paragraph, consecutive chunks share up to `overlap_tokens` of trailing sentences.
+    """
+    chunks: list[Chunk] = []
+    current: list[Span] = []
+    current_tokens = 0
+
+    def emit():
+        chunks.append(Chunk(text[current[0].start:current[-1].end], current[0].start, topic))
+
+    for span in _spans(text, max_tokens):
+        paragraph_break = span.new_paragraph and current_tokens >= max_tokens * 0.75
+        if current and (current_tokens + span.tokens > max_tokens or paragraph_break):
+            emit()
+            tail: list[Span] = []
+            if not span.new_paragraph:
+                tail_tokens = 0
+                for previous in reversed(current):
+                    if tail_tokens + previous.tokens > overlap_tokens:
+                        break
+                    tail.insert(0, previous)
+                    tail_tokens += previous.tokens
+            current = tail if sum(s.tokens for s in tail) + span.tokens <= max_tokens else []
+            current_tokens = sum(s.tokens for s in current)
+        current.append(span)
+        current_tokens += span.tokens
+    if current:
+        emit()
+    return chunks
+
+
+def chunk_document(text: str, max_tokens: int = CHUNK_MAX_TOKENS,
+                   overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> list[Chunk]:
+    # Topic banners always end a chunk; every chunk is tagged with the topic it came from
+    return [chunk
+            for topic, body in split_sections(text)
+            for chunk in chunk_section(body, topic, max_tokens, overlap_tokens)]
+
+
+def chunk_fixed(text: str, size: int = 500) -> list[Chunk]:
+    # The previous fixed-width slicing, kept as the baseline for benchmarks/chunking_benchmark.py
+    return [Chunk(text[i:i+size], i) for i in range(0, len(text), size)]
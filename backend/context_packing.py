@@ -0,0 +1,151 @@
+import os
+import re
+from dataclasses import dataclass, field, replace
+
+from chunking import estimate_tokens
+
+# === Context Packing Settings ===
+# CONTEXT_PACKING=on: reranked chunks are de-duplicated, overlapping chunks of one document are
+# merged, and the best-scoring material is packed into CONTEXT_TOKEN_BUDGET estimated tokens
+# (both sources together) before it goes into the prompt; "off" sends every reranked chunk
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "on") == "on"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "512"))
+# Word-set Jaccard similarity above which two chunks count as the same text (WHO topics repeat passages)
+CONTEXT_DUPLICATE_SIMILARITY = float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", "0.8"))
+# Chunks of one document at most this many characters apart are merged (chunk boundaries skip whitespace)
+CONTEXT_MERGE_GAP_CHARS = 2
+
+WORDS = re.compile(r"\w+")
+
+
+@dataclass
+class ContextChunk:
+    text: str
+    score: float
+    source: str                 # "report" or "who"
+    document: str | None = None  # WHO topic or report id; overlapping chunks of one document are merged
+    offset: int | None = None   # character offset within the document (see chunking.Chunk)
+    tokens: int = 0
+    words: frozenset = field(default=frozenset(), repr=False)
+
+    def __post_init__(self):
+        self.tokens = estimate_tokens(self.text)
+        self.words = frozenset(WORDS.findall(self.text.lower()))
+
+    @classmethod
+    def from_payload(cls, payload: dict, score: float, source: str) -> "ContextChunk":
+        document = payload.get("topic") if source == "who" else payload.get("report_id")
+        return cls(payload["text"], score, source, document, payload.get("offset"))
+
+    @property
+    def end(self) -> int | None:
+        return self.offset + len(self.text) if self.offset is not None else None
+
+
+@dataclass
+class PackedContext:
+    chunks: list[ContextChunk]
+    tokens: int = 0
+    duplicates: int = 0
+    merged: int = 0
+    over_budget: int = 0
+
+    def texts(self, source: str) -> list[str]:
+        return [chunk.text for chunk in self.chunks if chunk.source == source]
+
+
+def similarity(a: ContextChunk, b: ContextChunk) -> float:
+    if not a.words or not b.words:
+        return float(a.text == b.text)
+    return len(a.words & b.words) / len(a.words | b.words)
+
+
+def drop_duplicates(chunks: list[ContextChunk], threshold: float = CONTEXT_DUPLICATE_SIMILARITY) -> list[ContextChunk]:
+    # Best-scoring first, so of each group of near-identical chunks the best one is kept
+    kept: list[ContextChunk] = []
+    for chunk in sorted(chunks, key=lambda c: c.score, reverse=True):
+        if not any(similarity(chunk, other) >= threshold for other in kept):
+            kept.append(chunk)
+    return kept
+
+
+def merge_adjacent(chunks: list[ContextChunk]) -> list[ContextChunk]:
+    """Merge chunks of the same document that overlap or touch into one span of its text.
+
+    Consecutive chunks share their overlap sentences, so merging drops that repeated text;
+    a merged chunk keeps the best score of its parts.
+    """
+    merged: list[ContextChunk] = []
+    by_document: dict[tuple[str, str], list[ContextChunk]] = {}
+    for chunk in chunks:
+        if chunk.document is None or chunk.offset is None:
+            merged.append(chunk)
+        else:
+            by_document.setdefault((chunk.source, chunk.document), []).append(chunk)
+    for group in by_document.values():
+        group.sort(key=lambda c: c.offset)
+        current = group[0]
+        for chunk in group[1:]:
+            if chunk.offset > current.end + CONTEXT_MERGE_GAP_CHARS:
+                merged.append(current)
+                current = chunk
+            elif chunk.end > current.end:
+                if chunk.offset >= current.end:
+                    text = f"{current.text} {chunk.text}"
+                else:
+                    text = current.text + chunk.text[current.end - chunk.offset:]
+                current = ContextChunk(text, max(current.score, chunk.score), current.source,
+                                       current.document, current.offset)
+            elif chunk.score > current.score:
+                # Contained in the current span
+                current = replace(current, score=chunk.score)
+        merged.append(current)
+    return merged
+
+
+def truncate(chunk: ContextChunk, max_tokens: int) -> ContextChunk:
+    # Cut at the last word boundary that fits the budget
+    text = chunk.text
+    while text and estimate_tokens(text) > max_tokens:
+        text = text[:max(0, int(len(text) * max_tokens / max(estimate_tokens(text), 1)) - 1)].rsplit(" ", 1)[0]
+    return ContextChunk(text, chunk.score, chunk.source, chunk.document, chunk.offset)
+
+
+def span_tokens(chunks: list[ContextChunk]) -> int:
+    return sum(chunk.tokens for chunk in merge_adjacent(chunks))
+
+
+def pack_context(chunks: list[ContextChunk], budget: int = CONTEXT_TOKEN_BUDGET,
+                 threshold: float = CONTEXT_DUPLICATE_SIMILARITY) -> PackedContext:
+    """Choose the context for one question from its reranked chunks of every source.
+
+    Near-duplicates are dropped, then the highest-scoring chunks are taken while they fit
+    `budget` estimated tokens. A chunk overlapping one already taken only costs the tokens it
+    adds, and the chunks taken are merged into spans of their documents. A best chunk larger
+    than the whole budget is truncated rather than leaving the prompt empty.
+    """
+    unique = drop_duplicates(chunks, threshold)
+    packed = PackedContext([], duplicates=len(chunks) - len(unique))
+    selected: list[ContextChunk] = []
+    for chunk in unique:
+        same_document = [c for c in selected if c.document is not None and
+                         (c.source, c.document) == (chunk.source, chunk.document)]
+        cost = span_tokens(same_document + [chunk]) - span_tokens(same_document) if same_document else chunk.tokens
+        if packed.tokens + cost <= budget:
+            selected.append(chunk)
+            packed.tokens += cost
+        elif not selected and budget > 0:
+            chunk = truncate(chunk, budget)
+            selected.append(chunk)
+            packed.tokens += chunk.tokens
+        else:
+            packed.over_budget += 1
+    packed.chunks = sorted(merge_adjacent(selected), key=lambda c: c.score, reverse=True)
+    packed.merged = len(selected) - len(packed.chunks)
+    packed.tokens = sum(chunk.tokens for chunk in packed.chunks)
+    return packed
+
+
+def unpacked_context(chunks: list[ContextChunk]) -> PackedContext:
+    # CONTEXT_PACKING=off: every reranked chunk, as before
+    return PackedContext(list(chunks), tokens=sum(chunk.tokens for chunk in chunks))
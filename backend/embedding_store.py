@@ -0,0 +1,126 @@
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import threading
+import uuid
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# === Embedding Store Settings ===
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings")
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")  # "float32" or "float16"
+
+# Fixed namespace so point ids are stable across processes, machines and deploys
+POINT_ID_NAMESPACE = uuid.UUID("6f1c0a52-8d1e-4c55-9a4e-3b0f6e2d7a19")
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def point_id(text: str, namespace: str) -> str:
+    # Same content in the same namespace always maps to the same Qdrant point,
+    # so re-indexing overwrites instead of duplicating
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{namespace}:{content_hash(text)}"))
+
+
+class EmbeddingStore:
+    """Append-only, memory-mapped cache of embeddings keyed by content hash.
+
+    Each model gets its own directory holding `vectors.bin` (rows of `dim` floats)
+    and `index.txt` (one content hash per row, in the same order).
+    """
+
+    def __init__(self, model_name: str, dim: int, root: str = EMBEDDING_CACHE_DIR,
+                 dtype: str = EMBEDDING_CACHE_DTYPE):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.dir = os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name), f"{dim}-{self.dtype.name}")
+        self.vectors_path = os.path.join(self.dir, "vectors.bin")
+        self.index_path = os.path.join(self.dir, "index.txt")
+        self._lock = threading.Lock()
+        self._rows: dict[str, int] = {}
+        self._matrix = None
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        # Hold the same lock as add(): repairing a torn append must not truncate rows another
+        # process is writing right now
+        with open(self.vectors_path, "ab") as vectors_file:
+            fcntl.flock(vectors_file, fcntl.LOCK_EX)
+            self._load_locked()
+
+    def _load_locked(self):
+        row_bytes = self.dim * self.dtype.itemsize
+        n_vectors = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        hashes = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                hashes = [line.strip() for line in f if line.strip()]
+        # A crash between the two appends leaves one file longer than the other; trust the shorter
+        count = min(n_vectors, len(hashes))
+        if count != len(hashes) or count != n_vectors:
+            logger.warning(f"Embedding store at {self.dir} was truncated, keeping {count} consistent rows.")
+            with open(self.vectors_path, "a+b") as f:
+                f.truncate(count * row_bytes)
+            with open(self.index_path, "w", encoding="utf-8") as f:
+                f.writelines(h + "\n" for h in hashes[:count])
+        self._rows = {h: i for i, h in enumerate(hashes[:count])}
+        self._remap()
+
+    def _remap(self):
+        count = len(self._rows)
+        self._matrix = (
+            np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(count, self.dim))
+            if count else np.zeros((0, self.dim), dtype=self.dtype)
+        )
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get(self, hashes: list[str]) -> dict[str, np.ndarray]:
+        with self._lock:
+            return {h: np.asarray(self._matrix[self._rows[h]], dtype=np.float32)
+                    for h in hashes if h in self._rows}
+
+    def add(self, hashes: list[str], vectors: np.ndarray):
+        with self._lock, open(self.vectors_path, "ab") as vectors_file:
+            # Other worker processes append to the same files: take turns, and pick up their
+            # rows before appending so row numbers stay in step with the index
+            fcntl.flock(vectors_file, fcntl.LOCK_EX)
+            if os.path.getsize(self.vectors_path) != len(self._rows) * self.dim * self.dtype.itemsize:
+                self._load_locked()
+            new = [(h, v) for h, v in zip(hashes, vectors) if h not in self._rows]
+            # Drop duplicates within the batch itself
+            new = list({h: v for h, v in new}.items())
+            if not new:
+                return
+            # Vectors first, then the index: a partial write is detected and repaired on the next load
+            vectors_file.write(np.stack([v for _, v in new]).astype(self.dtype).tobytes())
+            vectors_file.flush()
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.writelines(h + "\n" for h, _ in new)
+            start = len(self._rows)
+            for i, (h, _) in enumerate(new):
+                self._rows[h] = start + i
+            self._remap()
+
+    def encode(self, embedder, texts: list[str], batch_size: int = 64) -> np.ndarray:
+        """Return embeddings for `texts`, running the model only on cache misses."""
+        hashes = [content_hash(t) for t in texts]
+        cached = self.get(hashes)
+        missing = [i for i, h in enumerate(hashes) if h not in cached]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            fresh = embedder.encode([texts[i] for i in missing], batch_size=batch_size, convert_to_numpy=True)
+            self.add([hashes[i] for i in missing], fresh)
+            cached.update({hashes[i]: np.asarray(v, dtype=np.float32) for i, v in zip(missing, fresh)})
+        return np.stack([cached[h] for h in hashes]) if texts else np.zeros((0, self.dim), dtype=np.float32)
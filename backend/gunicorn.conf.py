@@ -0,0 +1,29 @@
+"""Multi-worker serving: `gunicorn -c gunicorn.conf.py main:app` (run from backend/).
+
+The master imports the app once, sets up the Qdrant collection and loads the model weights
+(main.preload()), then forks WEB_CONCURRENCY workers that share those pages copy-on-write.
+Each worker warms up its own models, connections and WHO indexes in the background.
+A single `uvicorn main:app` process remains the default and needs none of this.
+"""
+import os
+
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# Each worker gets an equal share of the cores for its forward passes; read by models.py at import
+os.environ.setdefault("INFERENCE_THREADS", str(max(1, (os.cpu_count() or 1) // workers)))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+
+
+def on_starting(server):
+    # preload_app has already imported main in the master; finish its one-time setup before forking
+    import main
+    main.preload()
+
+
+def post_fork(server, worker):
+    from models import after_fork
+    after_fork()
@@ -0,0 +1,144 @@
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+
+from qdrant_client.models import PointStruct
+
+from embedding_store import point_id
+from observability import stage
+
+logger = logging.getLogger(__name__)
+
+# === Ingestion Settings ===
+# All knobs can be overridden from the environment (e.g. `fly secrets set EMBED_BATCH_SIZE=128`)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))        # texts per embedder forward pass
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "128"))     # points per Qdrant upsert request
+UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", "4"))     # upsert requests in flight at once
+UPSERT_MAX_RETRIES = int(os.getenv("UPSERT_MAX_RETRIES", "5"))
+UPSERT_BACKOFF_BASE = float(os.getenv("UPSERT_BACKOFF_BASE", "0.5"))  # seconds, doubled on every retry
+# Payload fields that scope a chunk's point id: the same text under another source/session/topic is a different point
+ID_NAMESPACE_FIELDS = ("source", "session_id", "topic")
+
+
+@dataclass
+class IndexStats:
+    chunks: int = 0
+    indexed: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+    failed_ids: set = field(default_factory=set)
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.indexed / self.seconds if self.seconds > 0 else 0.0
+
+
+def chunk_point_id(text: str, payload: dict) -> str:
+    return point_id(text, ":".join(str(payload[k]) for k in ID_NAMESPACE_FIELDS if k in payload))
+
+
+def upsert_with_retry(qdrant, collection_name: str, points: list[PointStruct],
+                      max_retries: int = UPSERT_MAX_RETRIES, backoff_base: float = UPSERT_BACKOFF_BASE):
+    # Exponential backoff with jitter instead of a fixed sleep between batches
+    for attempt in range(max_retries + 1):
+        try:
+            qdrant.upsert(collection_name=collection_name, points=points, wait=True)
+            return
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff_base * (2 ** attempt) + random.uniform(0, backoff_base)
+            logger.warning(f"Upsert of {len(points)} points failed ({e}), retrying in {delay:.2f}s "
+                           f"(attempt {attempt + 1}/{max_retries})...")
+            time.sleep(delay)
+
+
+def index_chunks(qdrant, collection_name: str, embedder, chunks: list[str], payload: dict,
+                 label: str = "chunks", store=None, chunk_payloads: list[dict] | None = None,
+                 stage_prefix: str = "index", embed_executor=None,
+                 embed_batch_size: int = EMBED_BATCH_SIZE,
+                 upsert_batch_size: int = UPSERT_BATCH_SIZE,
+                 concurrency: int = UPSERT_CONCURRENCY) -> IndexStats:
+    """Embed `chunks` in batches and upsert them to Qdrant.
+
+    Embedding runs on the calling thread, or on `embed_executor` if given (the app's bounded
+    inference pool, shared with the query path), while up to `concurrency` upserts are in
+    flight on a thread pool, so model forward passes overlap with network round trips.
+    With an EmbeddingStore, cached chunks skip the model entirely. Point ids are derived
+    from the content, so identical chunks collapse into one point and re-runs are idempotent.
+    `chunk_payloads`, if given, holds extra payload fields for each chunk. Embedding and upsert
+    times are recorded as the `<stage_prefix>_embed` and `<stage_prefix>_upsert` stages.
+    """
+    payloads = ([{**payload, **extra} for extra in chunk_payloads] if chunk_payloads is not None
+                else [payload] * len(chunks))
+    items: dict[str, tuple[str, dict]] = {}
+    for text, p in zip(chunks, payloads):
+        items.setdefault(chunk_point_id(text, p), (text, p))
+    items = list(items.items())
+    stats = IndexStats(chunks=len(items))
+    if not items:
+        return stats
+
+    start = time.perf_counter()
+    hits_before, misses_before = (store.hits, store.misses) if store is not None else (0, 0)
+    pending = set()
+    buffer: list[PointStruct] = []
+
+    def collect(done):
+        for future in done:
+            batch_len = len(future.batch_ids)
+            try:
+                future.result()
+                stats.indexed += batch_len
+                logger.debug(f"Indexed {stats.indexed} / {stats.chunks} {label}...")
+            except Exception as e:
+                stats.failed += batch_len
+                stats.failed_ids.update(future.batch_ids)
+                logger.error(f"Error upserting {batch_len} {label} after {UPSERT_MAX_RETRIES} retries: {e}")
+
+    def upsert(points):
+        with stage(f"{stage_prefix}_upsert"):
+            upsert_with_retry(qdrant, collection_name, points)
+
+    def embed(texts):
+        if store is not None:
+            return store.encode(embedder, texts, batch_size=embed_batch_size)
+        return embedder.encode(texts, batch_size=embed_batch_size, convert_to_numpy=True)
+
+    def submit(executor, points):
+        # Backpressure: never keep more than `concurrency` batches in memory/in flight
+        nonlocal pending
+        while len(pending) >= concurrency:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+        future = executor.submit(upsert, points)
+        future.batch_ids = [p.id for p in points]
+        pending.add(future)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="qdrant-upsert") as executor:
+        for i in range(0, len(items), embed_batch_size):
+            batch = items[i:i+embed_batch_size]
+            texts = [text for _, (text, _) in batch]
+            with stage(f"{stage_prefix}_embed"):
+                vectors = embed(texts) if embed_executor is None else embed_executor.submit(embed, texts).result()
+            buffer.extend(
+                PointStruct(id=pid, vector=v.tolist(), payload={"text": text, **p})
+                for v, (pid, (text, p)) in zip(vectors, batch)
+            )
+            while len(buffer) >= upsert_batch_size:
+                submit(executor, buffer[:upsert_batch_size])
+                buffer = buffer[upsert_batch_size:]
+        if buffer:
+            submit(executor, buffer)
+        collect(wait(pending).done)
+
+    stats.seconds = time.perf_counter() - start
+    if store is not None:
+        logger.info(f"Embedding store: {store.hits - hits_before} cached, {store.misses - misses_before} encoded "
+                    f"({len(store)} vectors on disk)")
+    logger.info(f"Indexed {stats.indexed} {label} ({stats.failed} failed) in {stats.seconds:.1f}s "
+                f"— {stats.chunks_per_second:.1f} chunks/s")
+    return stats
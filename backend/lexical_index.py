@@ -0,0 +1,223 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter, OrderedDict
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from chunking import CHUNKER_VERSION
+from embedding_store import content_hash
+from local_index import LOCAL_INDEX_DIR, LocalHit, replace_directory, staging_directory
+from locks import file_lock
+from sessions import report_filter
+from who_index import WHO_GUIDELINES_PATH, read_guidelines, who_chunk_payloads
+
+logger = logging.getLogger(__name__)
+
+# === Lexical Index Settings ===
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+REPORT_LEXICAL_CACHE_SIZE = int(os.getenv("REPORT_LEXICAL_CACHE_SIZE", "256"))  # sessions kept in memory
+LEXICAL_VERSION = "bm25-v1"
+# Payload a report chunk carries when only BM25 finds it: what dense hits are cited and packed by
+REPORT_PAYLOAD_FIELDS = ["text", "source", "offset", "report_id", "page"]
+
+# Terms keep inner hyphens and dots ("pre-eclampsia", "hba1c", "covid-19", "2.5"); the parts
+# of a compound term are indexed as well, so "eclampsia" still matches
+TERM = re.compile(r"[a-z0-9]+(?:[-.'][a-z0-9]+)*")
+TERM_PARTS = re.compile(r"[-.']")
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i in is it its my of on or
+should that the their there these this those to was what when where which who why will with
+you your
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    terms = []
+    for match in TERM.finditer(text.lower()):
+        term = match.group()
+        if term in STOPWORDS:
+            continue
+        terms.append(term)
+        if TERM_PARTS.search(term):
+            terms.extend(part for part in TERM_PARTS.split(term) if len(part) > 1 and part not in STOPWORDS)
+    return terms
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of chunks, with postings in flat NumPy arrays.
+
+    Postings for term `t` are `doc_ids[offsets[t]:offsets[t + 1]]` (with term frequencies in
+    `tfs` at the same positions), so a query costs one vectorised update per query term.
+    """
+
+    def __init__(self, terms: list[str], offsets: np.ndarray, doc_ids: np.ndarray, tfs: np.ndarray,
+                 doc_lens: np.ndarray, payloads: list[dict]):
+        self.vocab = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.payloads = payloads
+        self.avg_doc_len = float(doc_lens.mean()) if len(doc_lens) else 0.0
+        self.topics = sorted({p["topic"] for p in payloads if "topic" in p})
+        topic_ids = {topic: i for i, topic in enumerate(self.topics)}
+        self._row_topics = np.array([topic_ids.get(p.get("topic"), -1) for p in payloads], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.payloads)
+
+    @classmethod
+    def build(cls, payloads: list[dict]) -> "BM25Index":
+        postings: dict[str, list[tuple[int, int]]] = {}
+        doc_lens = np.zeros(len(payloads), dtype=np.int32)
+        for doc, payload in enumerate(payloads):
+            counts = Counter(tokenize(payload["text"]))
+            doc_lens[doc] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc, tf))
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[t]) for t in terms])
+        doc_ids = np.fromiter((doc for t in terms for doc, _ in postings[t]), dtype=np.int32, count=int(offsets[-1]))
+        tfs = np.fromiter((tf for t in terms for _, tf in postings[t]), dtype=np.float32, count=int(offsets[-1]))
+        return cls(terms, offsets, doc_ids, tfs, doc_lens, payloads)
+
+    def save(self, directory: str, meta: dict):
+        tmp = staging_directory(directory)
+        np.savez(os.path.join(tmp, "postings.npz"), offsets=self.offsets, doc_ids=self.doc_ids, tfs=self.tfs,
+                 doc_lens=self.doc_lens)
+        with open(os.path.join(tmp, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump(list(self.vocab), f, ensure_ascii=False)
+        with open(os.path.join(tmp, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump(self.payloads, f, ensure_ascii=False)
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({**meta, "count": len(self), "terms": len(self.vocab)}, f)
+        replace_directory(tmp, directory)
+
+    @classmethod
+    def open(cls, directory: str) -> tuple["BM25Index | None", dict]:
+        try:
+            with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(os.path.join(directory, "terms.json"), "r", encoding="utf-8") as f:
+                terms = json.load(f)
+            with open(os.path.join(directory, "chunks.json"), "r", encoding="utf-8") as f:
+                payloads = json.load(f)
+            with np.load(os.path.join(directory, "postings.npz")) as arrays:
+                index = cls(terms, arrays["offsets"], arrays["doc_ids"], arrays["tfs"], arrays["doc_lens"], payloads)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Lexical index at {directory} is missing or unreadable ({e}).")
+            return None, {}
+        return index, meta
+
+    def search(self, query: str, limit: int, topics: list[str] | None = None) -> list[LocalHit]:
+        if not len(self) or limit <= 0:
+            return []
+        n_docs = len(self)
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is None:
+                continue
+            start, end = self.offsets[t], self.offsets[t + 1]
+            docs, tf = self.doc_ids[start:end], self.tfs[start:end]
+            df = end - start
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lens[docs] / self.avg_doc_len)
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        if topics:
+            topic_ids = [self.topics.index(t) for t in topics if t in self.topics]
+            scores[~np.isin(self._row_topics, topic_ids)] = 0.0
+
+        matched = np.flatnonzero(scores > 0)
+        if not len(matched):
+            return []
+        k = min(limit, len(matched))
+        best = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        best = best[np.argsort(-scores[best])]
+        return [LocalHit(int(row), float(scores[row]), self.payloads[row]) for row in best]
+
+
+def reciprocal_rank_fusion(*rankings: list[str], k: int = RRF_K) -> list[str]:
+    # Each list contributes 1 / (k + rank) per item; only ranks matter, so BM25 and cosine
+    # scores never have to be put on the same scale
+    fused: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)
+
+
+def open_who_lexical_index(path: str = WHO_GUIDELINES_PATH, root: str = LOCAL_INDEX_DIR) -> BM25Index:
+    """Open the persisted WHO BM25 index, rebuilding it if the guidelines file or chunker changed."""
+    directory = os.path.join(root, "who_bm25")
+    text = read_guidelines(path)
+    fingerprint = content_hash(f"{LEXICAL_VERSION}\n{CHUNKER_VERSION}\n{text}")
+
+    with file_lock(f"{directory}.lock"):
+        index, meta = BM25Index.open(directory)
+        if index is not None and meta.get("fingerprint") == fingerprint:
+            logger.info(f"WHO lexical index loaded: {len(index)} chunks, {len(index.vocab)} terms.")
+            return index
+
+        start = time.perf_counter()
+        index = BM25Index.build(who_chunk_payloads(text))
+        index.save(directory, {"fingerprint": fingerprint})
+        logger.info(f"WHO lexical index built: {len(index)} chunks, {len(index.vocab)} terms "
+                    f"in {time.perf_counter() - start:.2f}s.")
+        return index
+
+
+class ReportLexicalIndexes:
+    """Per-session BM25 indexes over report chunks, built on demand from the points in Qdrant.
+
+    Keyed by (session, report version), so a re-upload simply misses and rebuilds. Report
+    text is patient data, so these live in memory only (LRU-bounded) and are never written to disk.
+    """
+
+    def __init__(self, aqdrant, collection_name: str, max_sessions: int = REPORT_LEXICAL_CACHE_SIZE):
+        self.aqdrant = aqdrant
+        self.collection_name = collection_name
+        self.max_sessions = max_sessions
+        self._indexes: OrderedDict[tuple[str, str], asyncio.Task] = OrderedDict()
+
+    async def get(self, session_id: str, report_version: str) -> BM25Index | None:
+        # Nothing stable to index: no report yet, lookup failed, or an upload is in progress
+        if report_version in ("none", "unknown", "indexing"):
+            return None
+        key = (session_id, report_version)
+        task = self._indexes.get(key)
+        if task is None:
+            # Concurrent questions for the same report share one build
+            task = asyncio.ensure_future(self._build(session_id))
+            self._indexes[key] = task
+            while len(self._indexes) > self.max_sessions:
+                self._indexes.popitem(last=False)
+        else:
+            self._indexes.move_to_end(key)
+        try:
+            return await asyncio.shield(task)
+        except Exception as e:
+            logger.error(f"Error building lexical index for session {session_id}: {e}")
+            self._indexes.pop(key, None)
+            return None
+
+    async def _build(self, session_id: str) -> BM25Index:
+        payloads, offset = [], None
+        while True:
+            points, offset = await self.aqdrant.scroll(collection_name=self.collection_name,
+                                                       scroll_filter=report_filter(session_id), limit=512,
+                                                       offset=offset, with_payload=REPORT_PAYLOAD_FIELDS,
+                                                       with_vectors=False)
+            payloads.extend(p.payload for p in points if p.payload and "text" in p.payload)
+            if offset is None:
+                break
+        return await run_in_threadpool(BM25Index.build, payloads)
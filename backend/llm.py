@@ -0,0 +1,71 @@
+import asyncio
+import os
+from typing import AsyncIterator
+
+from chunking import estimate_tokens
+
+# === LLM Backends ===
+# LLM_BACKEND=gemini (default) talks to Google; LLM_BACKEND=fake is a local stand-in that
+# streams a canned answer with configurable latency, for tests and benchmarks
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash")
+FAKE_LLM_FIRST_TOKEN_MS = float(os.getenv("FAKE_LLM_FIRST_TOKEN_MS", "300"))
+FAKE_LLM_TOKEN_MS = float(os.getenv("FAKE_LLM_TOKEN_MS", "20"))
+# Extra time to first token per 1000 prompt tokens, as a real model spends on reading the prompt
+FAKE_LLM_PROMPT_MS_PER_1K_TOKENS = float(os.getenv("FAKE_LLM_PROMPT_MS_PER_1K_TOKENS", "0"))
+
+
+class GeminiLLM:
+    def __init__(self, api_key: str, model_name: str = GEMINI_MODEL_NAME):
+        from google.generativeai import configure, GenerativeModel
+
+        configure(api_key=api_key)
+        self.model = GenerativeModel(model_name)
+
+    async def generate(self, prompt: str) -> str:
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class FakeStreamingLLM:
+    """Deterministic local model: waits `first_token_ms` (plus `prompt_ms_per_1k_tokens` for the
+    prompt's size), then emits one word every `token_ms`."""
+
+    def __init__(self, answer: str = "This is a placeholder answer generated by the fake local model.",
+                 first_token_ms: float = FAKE_LLM_FIRST_TOKEN_MS, token_ms: float = FAKE_LLM_TOKEN_MS,
+                 prompt_ms_per_1k_tokens: float = FAKE_LLM_PROMPT_MS_PER_1K_TOKENS):
+        self.answer = answer
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.prompt_ms_per_1k_tokens = prompt_ms_per_1k_tokens
+        self.calls = 0
+
+    async def generate(self, prompt: str) -> str:
+        return "".join([token async for token in self.stream(prompt)])
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        self.calls += 1
+        prompt_ms = self.prompt_ms_per_1k_tokens * estimate_tokens(prompt) / 1000
+        await asyncio.sleep((self.first_token_ms + prompt_ms) / 1000)
+        words = self.answer.split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.token_ms / 1000)
+            yield word if i == len(words) - 1 else word + " "
+
+
+def make_llm(backend: str = LLM_BACKEND):
+    if backend == "fake":
+        return FakeStreamingLLM()
+    if backend != "gemini":
+        raise RuntimeError(f"❌ Unknown LLM_BACKEND '{backend}', expected 'gemini' or 'fake'.")
+    gemini_api_key = os.getenv("GEMINI_API_KEY")
+    if not gemini_api_key:
+        raise RuntimeError("❌ GEMINI_API_KEY not set in environment.")
+    return GeminiLLM(gemini_api_key)
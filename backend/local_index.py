@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from chunking import CHUNKER_VERSION
+from embedding_store import content_hash
+from locks import file_lock
+from who_index import WHO_GUIDELINES_PATH, read_guidelines, who_chunk_payloads
+
+logger = logging.getLogger(__name__)
+
+# === Local Vector Index Settings ===
+# WHO_BACKEND=local serves WHO retrieval from this in-process index instead of Qdrant
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", ".cache/local_index")
+# Exact NumPy search below this many vectors; above it an HNSW graph (needs `pip install hnswlib`)
+LOCAL_INDEX_HNSW_THRESHOLD = int(os.getenv("LOCAL_INDEX_HNSW_THRESHOLD", "50000"))
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+
+def staging_directory(directory: str) -> str:
+    # Indexes are built into a sibling directory and swapped in by replace_directory(),
+    # so readers never see a half-written index
+    tmp = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    return tmp
+
+
+def replace_directory(tmp: str, directory: str):
+    old = f"{directory}.old-{os.getpid()}"
+    if os.path.exists(directory):
+        os.replace(directory, old)
+    os.replace(tmp, directory)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+@dataclass
+class LocalHit:
+    # Same shape as a Qdrant ScoredPoint as far as retrieval code is concerned
+    id: int
+    score: float
+    payload: dict
+
+
+class LocalVectorIndex:
+    """Read-only cosine index over a static corpus, stored as plain files in one directory.
+
+    `vectors.npy` holds L2-normalised float32 rows and is memory-mapped, so every worker
+    process searches the same page-cache copy; `chunks.json` holds the payloads in row order.
+    """
+
+    def __init__(self, directory: str, meta: dict, vectors: np.ndarray, payloads: list[dict]):
+        self.directory = directory
+        self.meta = meta
+        self.vectors = vectors
+        self.payloads = payloads
+        self.topics = sorted({p["topic"] for p in payloads if "topic" in p})
+        topic_ids = {topic: i for i, topic in enumerate(self.topics)}
+        self._row_topics = np.array([topic_ids.get(p.get("topic"), -1) for p in payloads], dtype=np.int32)
+        self._hnsw = self._load_hnsw() if meta.get("hnsw") else None
+
+    def __len__(self):
+        return len(self.payloads)
+
+    @staticmethod
+    def write(directory: str, meta: dict, vectors: np.ndarray, payloads: list[dict]):
+        tmp = staging_directory(directory)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        np.save(os.path.join(tmp, "vectors.npy"), vectors)
+        with open(os.path.join(tmp, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump(payloads, f, ensure_ascii=False)
+        meta = {**meta, "count": len(payloads), "dim": int(vectors.shape[1]) if len(vectors) else 0,
+                "hnsw": len(payloads) >= LOCAL_INDEX_HNSW_THRESHOLD and _hnswlib() is not None}
+        if meta["hnsw"]:
+            graph = _hnswlib().Index(space="ip", dim=meta["dim"])
+            graph.init_index(max_elements=len(payloads), M=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION)
+            graph.add_items(vectors, np.arange(len(payloads)))
+            graph.save_index(os.path.join(tmp, "hnsw.bin"))
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        replace_directory(tmp, directory)
+
+    @classmethod
+    def open(cls, directory: str) -> "LocalVectorIndex | None":
+        try:
+            with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(os.path.join(directory, "chunks.json"), "r", encoding="utf-8") as f:
+                payloads = json.load(f)
+            vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r") if payloads \
+                else np.zeros((0, meta.get("dim", 0)), dtype=np.float32)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Local index at {directory} is missing or unreadable ({e}).")
+            return None
+        return cls(directory, meta, vectors, payloads)
+
+    def _load_hnsw(self):
+        hnswlib = _hnswlib()
+        if hnswlib is None:
+            logger.warning("Local index was built with HNSW but hnswlib is not installed, using exact search.")
+            return None
+        graph = hnswlib.Index(space="ip", dim=self.meta["dim"])
+        graph.load_index(os.path.join(self.directory, "hnsw.bin"), max_elements=len(self))
+        graph.set_ef(HNSW_EF_SEARCH)
+        return graph
+
+    def search(self, q_vec, limit: int, topics: list[str] | None = None) -> list[LocalHit]:
+        if not len(self) or limit <= 0:
+            return []
+        q = np.asarray(q_vec, dtype=np.float32)
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+
+        if topics:
+            # A topic subset is small enough to scan exactly, with or without a graph
+            topic_ids = [self.topics.index(t) for t in topics if t in self.topics]
+            rows = np.flatnonzero(np.isin(self._row_topics, topic_ids))
+            scores = self.vectors[rows] @ q
+        elif self._hnsw is not None:
+            labels, distances = self._hnsw.knn_query(q, k=min(limit, len(self)))
+            # "ip" space returns 1 - dot product
+            return [LocalHit(int(row), float(1.0 - d), self.payloads[row])
+                    for row, d in zip(labels[0], distances[0])]
+        else:
+            rows = None
+            scores = self.vectors @ q
+
+        k = min(limit, len(scores))
+        if k == 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        row_ids = best if rows is None else rows[best]
+        return [LocalHit(int(row), float(score), self.payloads[row]) for row, score in zip(row_ids, scores[best])]
+
+
+def _hnswlib():
+    # Optional dependency, only needed for corpora above LOCAL_INDEX_HNSW_THRESHOLD
+    try:
+        import hnswlib
+    except ImportError:
+        return None
+    return hnswlib
+
+
+def open_who_index(embedder, model_name: str, store=None, path: str = WHO_GUIDELINES_PATH,
+                   root: str = LOCAL_INDEX_DIR) -> LocalVectorIndex:
+    """Open the local WHO index, rebuilding it first if the guidelines file, chunker or model changed."""
+    directory = os.path.join(root, "who", re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+    text = read_guidelines(path)
+    fingerprint = content_hash(f"{model_name}\n{CHUNKER_VERSION}\n{text}")
+
+    # Workers starting together build the index once; the others wait and then load it
+    with file_lock(f"{directory}.lock"):
+        index = LocalVectorIndex.open(directory)
+        if index is not None and index.meta.get("fingerprint") == fingerprint:
+            logger.info(f"Local WHO index loaded: {len(index)} chunks, {len(index.topics)} topics"
+                        f"{' (HNSW)' if index._hnsw is not None else ''}.")
+            return index
+
+        start = time.perf_counter()
+        payloads = who_chunk_payloads(text)
+        texts = [p["text"] for p in payloads]
+        if store is not None:
+            vectors = store.encode(embedder, texts)
+        elif texts:
+            vectors = embedder.encode(texts, batch_size=64, convert_to_numpy=True)
+        else:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+        LocalVectorIndex.write(directory, {"fingerprint": fingerprint, "model": model_name}, vectors, payloads)
+        logger.info(f"Local WHO index built: {len(payloads)} chunks in {time.perf_counter() - start:.1f}s.")
+        return LocalVectorIndex.open(directory)
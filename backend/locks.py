@@ -0,0 +1,108 @@
+import fcntl
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from qdrant_client.models import Distance, PointStruct
+
+from embedding_store import POINT_ID_NAMESPACE
+from vector_db import ensure_collection
+
+logger = logging.getLogger(__name__)
+
+# === Locks ===
+LOCK_SETTLE_SECONDS = float(os.getenv("LOCK_SETTLE_SECONDS", "0.5"))
+
+
+def locks_collection_name(collection_name: str) -> str:
+    return f"{collection_name}_locks"
+
+
+class QdrantLease:
+    """Best-effort lock shared by every worker and machine: a lease point in `<collection>_locks`.
+
+    Qdrant has no compare-and-set, so a claim is written, given LOCK_SETTLE_SECONDS for competing
+    claims to land, and read back; the claim that is stored wins. Only guard work that is safe
+    (just wasteful) to run twice. While held, a heartbeat thread renews the claim every `ttl` / 3
+    seconds until release(), so `ttl` can be short: a holder that dies stops renewing and its
+    lease expires `ttl` seconds later, however long the guarded work would have taken.
+    """
+
+    def __init__(self, qdrant, collection_name: str, name: str, ttl: float):
+        self.qdrant = qdrant
+        self.collection_name = locks_collection_name(collection_name)
+        self.name = name
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.point_id = str(uuid.uuid5(POINT_ID_NAMESPACE, f"lock:{name}"))
+        self._collection_ready = False
+        self._stop = threading.Event()
+        self._heartbeat: threading.Thread | None = None
+
+    def holder(self) -> dict | None:
+        # A claim without an owner (malformed, or written by an older version) counts as expired
+        points = self.qdrant.retrieve(collection_name=self.collection_name, ids=[self.point_id], with_payload=True)
+        claim = (points[0].payload or {}) if points else {}
+        if claim.get("owner") and claim.get("expires_at", 0) > time.time():
+            return claim
+        return None
+
+    def acquire(self) -> bool:
+        if not self._collection_ready:
+            ensure_collection(self.qdrant, self.collection_name, 1, distance=Distance.DOT)
+            self._collection_ready = True
+        holder = self.holder()
+        if holder is not None and holder.get("owner") != self.owner:
+            return False
+        self._claim()
+        time.sleep(LOCK_SETTLE_SECONDS)
+        holder = self.holder()
+        if holder is None or holder.get("owner") != self.owner:
+            return False
+        if self._heartbeat is None:
+            self._stop.clear()
+            self._heartbeat = threading.Thread(target=self._renew_forever, name=f"lease-{self.name}", daemon=True)
+            self._heartbeat.start()
+        return True
+
+    def _claim(self):
+        claim = {"name": self.name, "owner": self.owner, "expires_at": time.time() + self.ttl}
+        self.qdrant.upsert(collection_name=self.collection_name, wait=True,
+                           points=[PointStruct(id=self.point_id, vector=[1.0], payload=claim)])
+
+    def _renew_forever(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                holder = self.holder()
+                if holder is not None and holder.get("owner") != self.owner:
+                    logger.warning(f"Lease {self.name} was taken over by {holder.get('owner')}.")
+                    return
+                self._claim()
+            except Exception as e:
+                # Retried on the next beat; the claim only lapses if renewals keep failing for `ttl`
+                logger.warning(f"Error renewing lease {self.name}: {e}")
+
+    def release(self):
+        if self._heartbeat is not None:
+            self._stop.set()
+            self._heartbeat.join()
+            self._heartbeat = None
+        holder = self.holder()
+        if holder is not None and holder.get("owner") == self.owner:
+            self.qdrant.delete(collection_name=self.collection_name, points_selector=[self.point_id])
+
+
+@contextmanager
+def file_lock(path: str):
+    # Exclusive across the worker processes of one machine; blocks until acquired
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -1,27 +1,62 @@
-from fastapi import FastAPI, UploadFile, File, Form
+import time
+# Import-to-ready time is measured from here (see readiness.py and GET /health/ready)
+IMPORT_STARTED = time.perf_counter()
+
+from dotenv import load_dotenv
+# Load .env before importing our modules, which read their settings at import time
+load_dotenv()
+
+from fastapi import FastAPI, UploadFile, File, Form, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-import fitz  # PyMuPDF
-import uuid
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 import os
-from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient
-from sentence_transformers import CrossEncoder
+import gc
+import logging
+import json
+import asyncio
+import threading
+from contextlib import aclosing
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 # Fixed imports for Qdrant client version 1.14.3
 from qdrant_client.models import (
-    Distance, 
-    VectorParams, 
+    Distance,
     Filter, 
     MatchValue, 
-    FilterSelector, 
-    PointStruct,
-    FieldCondition  # This should be available in 1.14.3
+    FieldCondition,  # This should be available in 1.14.3
+    QueryRequest
 )
-from qdrant_client.http.exceptions import UnexpectedResponse
-from google.generativeai import configure, GenerativeModel
-import time
+from embedding_store import EmbeddingStore
+from answer_cache import AnswerCache
+from vector_db import (
+    LOCAL_QDRANT_URL, connect_qdrant, connect_async_qdrant, ensure_collection, ensure_payload_index,
+    qdrant_settings, quantization_config, search_params
+)
+from models import (
+    EMBEDDER_MODEL_NAME, EMBEDDING_DIM, RERANKER_MODEL_NAME, LazyModel, load_embedder, load_reranker, model_id,
+    preload_models
+)
+from who_index import TopicIndex, load_manifest, sync_who_guidelines_locked, topics_condition, who_filter
+from local_index import open_who_index
+from lexical_index import ReportLexicalIndexes, open_who_lexical_index, reciprocal_rank_fusion
+from batching import MicroBatcher, EMBED_MAX_BATCH_SIZE, RERANK_MAX_BATCH_SIZE
+from adaptive_rerank import AdaptiveReranker, Candidates
+from llm import make_llm
+from chunking import estimate_tokens
+from context_packing import CONTEXT_PACKING, ContextChunk, pack_context, unpacked_context
+from sessions import SessionRegistry, report_filter, session_id_header, sessions_collection_name
+from report_jobs import ReportIngestor, UploadRejected, upload_jobs_collection_name
+from readiness import Readiness
+from process_stats import memory_stats
+from observability import (
+    PROMPT_TOKENS, TIMING_HEADER, TimingMiddleware, configure_logging, record_stage, render_metrics,
+    request_stages_ms, stage
+)
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # === Setup ===
 app = FastAPI()
@@ -29,246 +64,562 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"]
 )
-load_dotenv()
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-if not gemini_api_key:
-    raise RuntimeError("❌ GEMINI_API_KEY not set in environment.")
-
-configure(api_key=gemini_api_key)
-model = GenerativeModel("gemini-1.5-flash")
-# This line loads the SentenceTransformer model on startup, which is memory-intensive
-embedder = SentenceTransformer("all-MiniLM-L12-v2", device='cpu')
+# Per-route latency histograms and per-stage timings (see observability.py and GET /metrics)
+app.add_middleware(TimingMiddleware)
+# Gemini by default; LLM_BACKEND=fake swaps in a local streaming stand-in (see llm.py)
+llm = make_llm()
+# The embedder and cross-encoder are memory-intensive and slow to load, so they are loaded by
+# the warm-up task (or on first use) instead of at import; INFERENCE_BACKEND selects PyTorch
+# fp32, dynamic int8, or ONNX Runtime (see models.py)
+embedder = LazyModel("embedder", lambda: load_embedder(EMBEDDER_MODEL_NAME))
 
-reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+reranker = LazyModel("reranker", lambda: load_reranker(RERANKER_MODEL_NAME))
 
 collection_name = "medical_docs"
-# This dimension is derived from the globally loaded embedder
-vector_dim = embedder.get_sentence_embedding_dimension() or 384
+# Configured rather than read from the model, which isn't loaded yet; checked once it is
+vector_dim = EMBEDDING_DIM
+
+# On-disk embedding cache so re-indexing the static WHO corpus needs no forward passes
+embedding_store = EmbeddingStore(model_id(EMBEDDER_MODEL_NAME), vector_dim)
 
 # --- Qdrant Client updated to use environment variables and increased timeout ---
-qdrant_url = os.getenv("QDRANT_URL")
-if not qdrant_url:
-    # Raise an error if QDRANT_URL is not set, as it's now required
-    raise RuntimeError("❌ QDRANT_URL environment variable not set. Please set it to your Qdrant instance URL (e.g., your Qdrant Cloud URL).")
+qdrant = connect_qdrant()
 
-qdrant_api_key = os.getenv("QDRANT_API_KEY") # Optional, depending on your Qdrant setup
+# Async client for the request path; it keeps one pooled HTTP connection per worker
+aqdrant = connect_async_qdrant()
 
-qdrant = QdrantClient(
-    url=qdrant_url,
-    api_key=qdrant_api_key,
-    timeout=60.0 # Increased timeout for potentially long operations like initial indexing
-)
-# Print client version for debugging
-try:
-    import qdrant_client
-    print(f"Qdrant client version: {qdrant_client.__version__}")
-except AttributeError:
-    print("Qdrant client version: Unable to determine version")
-print("Qdrant client connected successfully")
-
-try:
-    # Attempt to get the collection to see if it exists
-    qdrant.get_collection(collection_name=collection_name)
-    print(f"Qdrant collection '{collection_name}' already exists.")
-except UnexpectedResponse as e:
-    # If it doesn't exist (e.g., 404 Not Found), recreate it
-    print(f"Qdrant collection '{collection_name}' not found, attempting to recreate.")
-    qdrant.recreate_collection(
-        collection_name=collection_name,
-        vectors_config=VectorParams(size=vector_dim, distance=Distance.COSINE)
-    )
-    print(f"Qdrant collection '{collection_name}' recreated successfully.")
-except Exception as e:
-    # Catch any other unexpected errors during collection check/recreation
-    raise RuntimeError(f"Error checking/creating Qdrant collection: {e}")
-
-# --- Create payload index for 'source' field ---
-# This ensures that filtering by 'source' is efficient and doesn't throw errors
-try:
-    # Create index using the client method directly (use string instead of enum)
-    qdrant.create_payload_index(
-        collection_name=collection_name,
-        field_name="source",
-        field_schema="keyword"  # Use string value instead of FieldType.KEYWORD
-    )
-    print(f"Payload index for 'source' field created or already exists in collection '{collection_name}'.")
-except UnexpectedResponse as e:
-    if "already exists" in str(e): # Common error message if index exists
-        print(f"Payload index for 'source' field already exists in collection '{collection_name}'.")
-    else:
-        print(f"Warning: Could not create payload index for 'source' field (UnexpectedResponse): {e}")
-except Exception as e:
-    # Catch any other general exceptions during index creation
-    print(f"Warning: Could not create payload index for 'source' field: {e}")
 
+def setup_qdrant(client=qdrant):
+    # QDRANT_QUANTIZATION=int8 stores scalar-quantized vectors alongside the originals (see vector_db.py)
+    ensure_collection(client, collection_name, vector_dim, quantization=quantization_config())
 
-# === WHO Indexing ===
-WHO_GUIDELINES_PATH = "who_data/who_az_guidelines.txt"
+    # --- Payload indexes for the fields we filter on ('topic' drives incremental WHO re-indexing and topic pre-filtering) ---
+    ensure_payload_index(client, collection_name, "source")
+    ensure_payload_index(client, collection_name, "topic")
+    # Per-session reports: searches and deletes are scoped by session_id, idle reports expire by last_active
+    ensure_payload_index(client, collection_name, "session_id")
+    ensure_payload_index(client, collection_name, "last_active", field_schema="float")
+    # Every session's current report version and upload job status, shared by all workers
+    # (see sessions.py and report_jobs.py)
+    ensure_collection(client, sessions_collection_name(collection_name), 1, distance=Distance.DOT)
+    ensure_collection(client, upload_jobs_collection_name(collection_name), 1, distance=Distance.DOT)
 
-def is_who_data_indexed():
-    try:
-        # Use Qdrant's count method for a more efficient check of existence
-        count_result = qdrant.count(
-            collection_name=collection_name,
-            count_filter=Filter(  # Fixed: use count_filter instead of query_filter
-                must=[FieldCondition(key="source", match=MatchValue(value="who"))]
-            ),
-            exact=True # Request exact count
-        )
-        return count_result.count > 0
-    except Exception as e:
-        # Log the error for debugging but return False to trigger indexing if unsure
-        print(f"Error checking if WHO data is indexed: {e}")
-        return False
-
-def index_who_guidelines():
-    if not os.path.exists(WHO_GUIDELINES_PATH):
-        print(f"Error: WHO guidelines file not found at {WHO_GUIDELINES_PATH}.")
-        return
-
-    print("Starting WHO guidelines indexing...")
-    with open(WHO_GUIDELINES_PATH, "r", encoding="utf-8") as f:
-        text = f.read()
-
-    chunks = [text[i:i+500] for i in range(0, len(text), 500)]
-    print(f"Generated {len(chunks)} chunks for WHO data.")
-
-    # This encoding happens on startup, contributing to high memory usage
-    vectors = [embedder.encode(chunk).tolist() for chunk in chunks]
-    print("Encoded WHO chunks into vectors.")
-
-    points = [
-        PointStruct(id=str(uuid.uuid4()), vector=v, payload={"text": c, "source": "who"})
-        for v, c in zip(vectors, chunks)
-    ]
-    
-    # Upsert in batches
-    batch_size = 50 # Reduced batch size for upserts to reduce load on Qdrant
-    for i in range(0, len(points), batch_size):
-        batch = points[i:i+batch_size]
+
+def load_models():
+    embedder.load()
+    reranker.load()
+    dim = embedder.get_sentence_embedding_dimension()
+    if dim and dim != vector_dim:
+        raise RuntimeError(f"Embedder produces {dim}-dim vectors but EMBEDDING_DIM is {vector_dim}.")
+    # The first forward pass is much slower than the rest; pay for it here rather than in a request
+    embedder.encode(["warm-up"], convert_to_numpy=True)
+    reranker.predict([("warm-up", "warm-up")])
+
+
+# === Inference Executor ===
+# Model forward passes are CPU-bound; run them on a small bounded pool so the event loop
+# keeps serving other requests (torch releases the GIL inside forward passes)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+
+
+# === Micro-batching ===
+# Concurrent /ask requests share forward passes: single queries and (question, chunk) pairs are
+# queued for up to BATCH_MAX_WAIT_MS and run as one batch per model
+def embed_batch(texts: list[str]):
+    return embedder.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+
+def rerank_batch(pairs: list[tuple[str, str]]):
+    return reranker.predict(pairs, batch_size=len(pairs))
+
+
+embed_batcher = MicroBatcher("embed", embed_batch, inference_executor, max_batch_size=EMBED_MAX_BATCH_SIZE)
+rerank_batcher = MicroBatcher("rerank", rerank_batch, inference_executor, max_batch_size=RERANK_MAX_BATCH_SIZE)
+# Pairs go to the rerank batcher only when the dense scores leave the ranking open and no cached
+# score exists; chunks under the relevance cutoff are dropped (see adaptive_rerank.py)
+adaptive_reranker = AdaptiveReranker(rerank_batcher)
+
+
+# === Startup and Health ===
+# The app serves as soon as it is imported; a background task connects Qdrant, loads the
+# models and brings the WHO indexes up, and /health/ready reports when that is done.
+# Endpoints that need any of it wait up to READY_WAIT_TIMEOUT, then answer 503.
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+readiness = Readiness(["qdrant", "models", "who_index"], started=IMPORT_STARTED)
+require_ready = readiness.dependency()
+warmup_task: asyncio.Task | None = None
+
+
+async def warm_up_component(component: str, fn):
+    if readiness.status[component] == "ready":
+        return  # done once for all workers by the pre-fork master (see preload())
+    # Retried until it works: Qdrant may still be starting, a model download may fail transiently
+    while True:
+        readiness.mark(component, "loading")
         try:
-            qdrant.upsert(collection_name=collection_name, points=batch)
-            print(f"Indexed {min(i + batch_size, len(points))} / {len(points)} WHO chunks...")
-        except Exception as upsert_e:
-            print(f"Error upserting batch {i//batch_size + 1}: {upsert_e}")
-            # Decide how to handle this - retry, skip, or re-raise
-            # For now, we'll just log and continue, but in production, you might want more robust retry logic
-        time.sleep(0.1) # Add a small delay to relieve pressure on Qdrant Cloud (if free tier/rate limited)
-
-    print("WHO guidelines indexing complete!")
-
-def rerank_chunks(question: str, chunks: list[str], top_k=3) -> list[str]:
-    if not chunks:
-        return []
+            await asyncio.to_thread(fn)
+            readiness.mark(component, "ready")
+            return
+        except Exception as e:
+            readiness.mark(component, "failed", str(e))
+            logger.warning(f"Warm-up of {component} failed, retrying in {WARMUP_RETRY_SECONDS:.0f}s: {e}")
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+
+
+async def warm_up():
+    # Qdrant setup and model loading are independent; the WHO indexes need both
+    await asyncio.gather(warm_up_component("qdrant", setup_qdrant), warm_up_component("models", load_models))
+    await warm_up_component("who_index", load_who_indexes)
+    logger.info(f"Worker {os.getpid()} memory: {memory_stats()}")
+
+
+def preload():
+    """One-time initialisation in a pre-fork master (gunicorn.conf.py sets preload_app).
+
+    The Qdrant collection is set up once rather than once per worker, and the model weights are
+    loaded before fork so all workers share them copy-on-write. Each worker still runs warm_up()
+    for the rest; the WHO sync in there is serialised by its lease.
+    """
+    if qdrant_settings()[0] == LOCAL_QDRANT_URL:
+        raise RuntimeError("❌ QDRANT_URL=:memory: keeps data inside one process; serve it with a single uvicorn worker.")
+    # A client of its own, closed before fork: workers must not inherit its open connections
+    client = connect_qdrant()
+    try:
+        setup_qdrant(client)
+    finally:
+        client.close()
+    readiness.mark("qdrant", "ready")
+    preload_models(embedder, reranker)
+    # Never collect what exists now, so the collector doesn't touch (and un-share) those pages in the workers
+    gc.freeze()
+    logger.info(f"Preloaded in {readiness.elapsed():.1f}s, master memory: {memory_stats()}")
 
-    pairs = [(question, chunk) for chunk in chunks]
-    scores = reranker.predict(pairs)
 
-    # Sort chunks based on scores descending
-    ranked = sorted(zip(chunks, scores), key=lambda x: x[1], reverse=True)
-    top_chunks = [chunk for chunk, _ in ranked[:top_k]]
-    
-    return top_chunks
+@app.on_event("startup")
+async def startup():
+    global warmup_task
+    sessions.start()
+    warmup_task = asyncio.create_task(warm_up(), name="warm-up")
 
 
-# This block runs on every application startup, causing repeated memory spikes and processing
-if not is_who_data_indexed():
-    index_who_guidelines()
+@app.on_event("shutdown")
+async def shutdown():
+    if warmup_task is not None:
+        warmup_task.cancel()
+    answer_cache.save()
+    await sessions.close()
+    report_ingestor.shutdown()
+    await embed_batcher.close()
+    await rerank_batcher.close()
+    await aqdrant.close()
+    inference_executor.shutdown(wait=False)
 
 
-# === Upload Report Endpoint ===
-@app.post("/upload")
-async def upload_report(file: UploadFile = File(...)):
+@app.get("/health/live")
+async def liveness():
+    # The process is up and serving; never depends on models or Qdrant, so restarts aren't triggered by warm-up
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness_probe():
+    return JSONResponse(status_code=200 if readiness.ready else 503, content=readiness.to_dict())
+
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text format: medrag_stage_seconds{stage=...} and medrag_http_request_seconds{route=...}
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats/memory")
+async def memory_usage():
+    # This worker only; under gunicorn private_mb is roughly what each extra worker costs
+    return {"pid": os.getpid(), "ready": readiness.ready, **memory_stats()}
+
+
+@app.get("/stats/inference")
+async def inference_stats():
+    return {"embed": embed_batcher.stats(), "rerank": rerank_batcher.stats(), "rerank_pairs": adaptive_reranker.stats()}
+
+
+@app.get("/stats/cache")
+async def cache_stats():
+    return answer_cache.stats()
+
+
+async def rerank_chunks(question: str, payloads: list[dict], source: str, top_k=3,
+                        dense_scores: dict[str, float] | None = None) -> list[ContextChunk]:
+    if not payloads:
+        return []
+
+    with stage("rerank"):
+        ranked = (await adaptive_reranker.rerank([Candidates(question, payloads, top_k, dense_scores or {})]))[0]
+
+    # Best first, at most top_k, none under the relevance cutoff
+    return [ContextChunk.from_payload(payload, score, source) for payload, score in ranked]
+
+
+# === WHO Indexing ===
+# WHO_BACKEND=qdrant (default): WHO chunks live in Qdrant next to the reports. Only topics
+# added or changed since the last sync are embedded (and those come from the embedding store
+# when possible); run `python who_index.py` to re-sync without restarting.
+# WHO_BACKEND=local: WHO search runs in-process on a memory-mapped index (see local_index.py),
+# saving a network round trip per question; reports stay in Qdrant either way.
+WHO_BACKEND = os.getenv("WHO_BACKEND", "qdrant")
+# "background": the warm-up task syncs the Qdrant WHO index, one worker at a time (QdrantLease);
+# a worker that finds another one syncing gets ready on what is already indexed and syncs later;
+# "off": syncing is left to `python who_index.py` and the app serves whatever is indexed
+WHO_INDEX_ON_STARTUP = os.getenv("WHO_INDEX_ON_STARTUP", "background")
+
+# --- Topic pre-filtering ---
+# "auto": WHO searches are restricted to the topics whose titles best match the question
+# (when any match well enough); "off": only topics passed explicitly in the request are used
+TOPIC_PREFILTER = os.getenv("TOPIC_PREFILTER", "off")
+TOPIC_MATCH_LIMIT = int(os.getenv("TOPIC_MATCH_LIMIT", "3"))
+TOPIC_MATCH_MIN_SIMILARITY = float(os.getenv("TOPIC_MATCH_MIN_SIMILARITY", "0.5"))
+
+# --- Hybrid retrieval ---
+# Dense candidates are fused with BM25 candidates (reciprocal-rank fusion) before reranking, so
+# exact terms the embedder misses ("HbA1c", drug names) still reach the cross-encoder
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "on") == "on"
+FIRST_STAGE_CANDIDATES = int(os.getenv("FIRST_STAGE_CANDIDATES", "20"))  # per source and retriever
+
+# Set by load_who_indexes() during warm-up
+local_who = None
+who_lexical = None
+who_topics = TopicIndex([], np.zeros((0, 0), dtype=np.float32))
+
+
+def who_topic_names() -> list[str]:
+    if WHO_BACKEND == "local":
+        return local_who.topics
+    if WHO_INDEX_ON_STARTUP == "background":
+        report = sync_who_guidelines_locked(qdrant, collection_name, embedder, store=embedding_store, wait=False)
+        if report is not None:
+            return report.topics
+        # Another worker is syncing. If an earlier sync left an indexed corpus, serve that now and
+        # sync in the background once the lease is free; only a first index is waited for
+        try:
+            manifest = load_manifest(qdrant, collection_name)
+        except Exception:
+            manifest = {}  # no sync has created it yet
+        if not manifest:
+            return sync_who_guidelines_locked(qdrant, collection_name, embedder, store=embedding_store).topics
+        threading.Thread(target=finish_who_sync, name="who-sync", daemon=True).start()
+        return list(manifest)
     try:
-        doc = fitz.open(stream=await file.read(), filetype="pdf")
-        text = "\n".join(page.get_text() for page in doc)
+        return list(load_manifest(qdrant, collection_name))
     except Exception as e:
-        return JSONResponse(status_code=400, content={"error": f"Error reading PDF: {e}"})
+        logger.error(f"Error reading the WHO manifest, run `python who_index.py` to index the guidelines: {e}")
+        return []
 
-    chunks = [text[i:i+500] for i in range(0, len(text), 500)]
-    vectors = [embedder.encode(chunk).tolist() for chunk in chunks]
 
-    # Clear old report data
+def finish_who_sync():
+    global who_topics
     try:
-        qdrant.delete(
-            collection_name=collection_name,
-            points_selector=FilterSelector(
-                filter=Filter(
-                    must=[FieldCondition(key="source", match=MatchValue(value="report"))]
-                )
-            )
-        )
-        print("Old report data cleared from Qdrant.")
-    except UnexpectedResponse as e:
-        # This can happen if the filter doesn't match any points, which is fine
-        print(f"No old report data to clear or unexpected response during delete: {e}")
+        topic_names = sync_who_guidelines_locked(qdrant, collection_name, embedder, store=embedding_store).topics
+        if TOPIC_PREFILTER == "auto":
+            who_topics = TopicIndex.build(topic_names, embedder)
     except Exception as e:
-        print(f"Error clearing old report data: {e}")
-        pass  # Continue even if there's an error clearing old data
+        logger.error(f"Error in the background WHO sync: {e}")
+
+
+def load_who_indexes():
+    global local_who, who_lexical, who_topics
+    if WHO_BACKEND == "local":
+        local_who = open_who_index(embedder, model_id(EMBEDDER_MODEL_NAME), store=embedding_store)
+    topic_names = who_topic_names()
+    if HYBRID_RETRIEVAL:
+        who_lexical = open_who_lexical_index()
+    if TOPIC_PREFILTER == "auto":
+        who_topics = TopicIndex.build(topic_names, embedder)
+
+
+def source_filter(source: str) -> Filter:
+    return Filter(must=[FieldCondition(key="source", match=MatchValue(value=source))])
+
 
-    report_points = [
-        PointStruct(id=str(uuid.uuid4()), vector=v, payload={"text": c, "source": "report"})
-        for v, c in zip(vectors, chunks)
-    ]
+# === Sessions and Answer Cache ===
+# Every session has its own report; answers are scoped to the session and the version of its
+# report, which each worker re-reads from the shared session record every SESSION_VERSION_TTL
+sessions = SessionRegistry(aqdrant, collection_name)
+answer_cache = AnswerCache()
+# BM25 over each session's current report, built from its Qdrant points on first use
+report_lexical = ReportLexicalIndexes(aqdrant, collection_name)
 
+
+# === Upload Report Endpoint ===
+# Uploads are spooled to disk and ingested by a background job (see report_jobs.py);
+# the response carries a job id to poll, and the report becomes searchable page batch by page batch
+report_ingestor = ReportIngestor(qdrant, aqdrant, collection_name, embedder, sessions, answer_cache,
+                                 inference_executor=inference_executor)
+
+
+@app.post("/upload", status_code=202, dependencies=[Depends(require_ready)])
+async def upload_report(file: UploadFile = File(...), session_id: str = Depends(session_id_header)):
     try:
-        qdrant.upsert(collection_name=collection_name, points=report_points)
-        return {"message": "✅ Report uploaded and indexed successfully!"}
-    except Exception as e:
-        return JSONResponse(status_code=500, content={"error": f"Failed to index report: {e}"})
+        job = await report_ingestor.submit(session_id, file)
+    except UploadRejected as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return {
+        "message": "📄 Report received, indexing in the background.",
+        "job_id": job.job_id,
+        "status_url": f"/upload/jobs/{job.job_id}",
+        "pages_total": job.pages_total,
+    }
+
+
+@app.get("/upload/jobs/{job_id}")
+async def upload_job_status(job_id: str, session_id: str = Depends(session_id_header)):
+    # Answered by any worker: job status is stored in Qdrant as the job runs
+    job = await report_ingestor.get(job_id)
+    if job is None or job.session_id != session_id:
+        return JSONResponse(status_code=404, content={"error": "Unknown upload job."})
+    return job.to_dict()
 
 
 # === Ask Question Endpoint ===
-class QuestionRequest(BaseModel):
+SOURCES = ("report", "who")
+# "batched": one Qdrant batch query and one rerank pass for both sources (default)
+# "per_source": a separate search and rerank per source, run concurrently
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "batched")
+# /ask/batch: questions per request, and LLM calls in flight per batch
+ASK_BATCH_MAX_QUESTIONS = int(os.getenv("ASK_BATCH_MAX_QUESTIONS", "500"))
+ASK_BATCH_LLM_CONCURRENCY = int(os.getenv("ASK_BATCH_LLM_CONCURRENCY", "8"))
+
+
+class AskOptions(BaseModel):
+    # Retrieval tuning: candidates per source sent to the reranker, and chunks kept per source after
+    # reranking. With hybrid retrieval the fused first stage is precise enough for a pool of 4.
+    candidates: int = Field(4, ge=1, le=50)
+    report_top_k: int = Field(3, ge=0, le=20)
+    who_top_k: int = Field(3, ge=0, le=20)
+    # WHO topics to search (e.g. ["malaria"]); None leaves the choice to TOPIC_PREFILTER
+    topics: list[str] | None = Field(None, max_length=20)
+
+
+class QuestionRequest(AskOptions):
     question: str
 
-@app.post("/ask")
-async def ask_question(data: QuestionRequest):
-    q_vec = embedder.encode(data.question).tolist()
 
-    # --- Query Report ---
-    report_context = ""
+class BatchQuestionRequest(AskOptions):
+    questions: list[str] = Field(..., min_length=1, max_length=ASK_BATCH_MAX_QUESTIONS)
+
+
+def search_filter(source: str, session_id: str, topics: list[str] | None = None) -> Filter:
+    if source == "report":
+        return report_filter(session_id)
+    if topics:
+        return who_filter(topics_condition(topics))
+    return source_filter(source)
+
+
+def question_topics(data: AskOptions, q_embedding: np.ndarray) -> list[str] | None:
+    if data.topics:
+        return data.topics
+    if TOPIC_PREFILTER == "auto":
+        return who_topics.match(q_embedding, TOPIC_MATCH_LIMIT, TOPIC_MATCH_MIN_SIMILARITY) or None
+    return None
+
+
+def point_payloads(points) -> list[dict]:
+    return [p.payload for p in points if p.payload and "text" in p.payload]
+
+
+def point_scores(points) -> dict[str, float]:
+    # Dense similarity by chunk text, for the adaptive reranker
+    return {p.payload["text"]: p.score for p in points if p.payload and "text" in p.payload}
+
+
+def first_stage_limit(candidates: int) -> int:
+    return max(candidates, FIRST_STAGE_CANDIDATES) if HYBRID_RETRIEVAL else candidates
+
+
+async def fuse_candidates(question: str, dense: list[dict], source: str, session_id: str, report_version: str,
+                          candidates: int, topics: list[str] | None = None) -> list[dict]:
+    # Dense ranking fused with the BM25 ranking of the same source, cut to the rerank pool size;
+    # the payloads come along so the context packer knows where each chunk sits in its document
+    if not HYBRID_RETRIEVAL:
+        return dense[:candidates]
+    if source == "who":
+        with stage("who_lexical_search"):
+            lexical = who_lexical.search(question, first_stage_limit(candidates), topics)
+    else:
+        with stage("report_lexical_search"):
+            index = await report_lexical.get(session_id, report_version)
+            lexical = index.search(question, first_stage_limit(candidates)) if index is not None else []
+    lexical = point_payloads(lexical)
+    payloads = {payload["text"]: payload for payload in lexical + dense}
+    fused = reciprocal_rank_fusion([p["text"] for p in dense], [p["text"] for p in lexical])
+    return [payloads[text] for text in fused[:candidates]]
+
+
+async def retrieve_context(question: str, q_vec: list[float], source: str, session_id: str, report_version: str,
+                           candidates: int = 4, top_k: int = 3, topics: list[str] | None = None) -> list[ContextChunk]:
     try:
-        report_results = qdrant.query_points(
-            collection_name=collection_name,
-            query=q_vec,
-            limit=5,
-            with_payload=True,
-            query_filter=Filter(
-                must=[FieldCondition(key="source", match=MatchValue(value="report"))]
-            )
-        )
-        report_chunks = [p.payload["text"] for p in report_results.points if p.payload and "text" in p.payload]
-        report_context = "\n".join(rerank_chunks(data.question, report_chunks, top_k=3))
-        print(type(report_chunks))
+        with stage(f"{source}_search"):
+            if source == "who" and WHO_BACKEND == "local":
+                points = local_who.search(q_vec, first_stage_limit(candidates), topics)
+            else:
+                results = await aqdrant.query_points(
+                    collection_name=collection_name,
+                    query=q_vec,
+                    limit=first_stage_limit(candidates),
+                    with_payload=True,
+                    query_filter=search_filter(source, session_id, topics),
+                    search_params=search_params()
+                )
+                points = results.points
+        chunks = await fuse_candidates(question, point_payloads(points), source, session_id, report_version,
+                                       candidates, topics)
+        return await rerank_chunks(question, chunks, source, top_k=top_k, dense_scores=point_scores(points))
     except Exception as e:
-        print(f"Error querying report context from Qdrant: {e}")
-        report_context = ""
+        logger.error(f"Error querying {source} context from Qdrant: {e}")
+        return []
 
-    # --- Query WHO ---
-    who_context = ""
-    try:
-        who_results = qdrant.query_points(
-            collection_name=collection_name,
-            query=q_vec,
-            limit=5,
-            with_payload=True,
-            query_filter=Filter(
-                must=[FieldCondition(key="source", match=MatchValue(value="who"))]
-            )
-        )
-        who_chunks = [p.payload["text"] for p in who_results.points if p.payload and "text" in p.payload]
-        who_context = "\n".join(rerank_chunks(data.question, who_chunks, top_k=3))
 
+async def retrieve_contexts_per_source(question: str, q_vec: list[float], session_id: str, report_version: str,
+                                       candidates: int, top_k: dict[str, int],
+                                       topics: list[str] | None = None) -> dict[str, list[ContextChunk]]:
+    chunks = await asyncio.gather(*(
+        retrieve_context(question, q_vec, source, session_id, report_version, candidates, top_k[source], topics)
+        for source in SOURCES
+    ))
+    return dict(zip(SOURCES, chunks))
+
+
+async def retrieve_contexts_batched(questions: list[str], q_vecs: list[list[float]], session_id: str,
+                                    report_version: str, candidates: int, top_k: dict[str, int],
+                                    topics: list[list[str] | None]) -> list[dict[str, list[ContextChunk]]]:
+    # One round trip: the filtered searches of every question and Qdrant-backed source travel in a single batch query
+    qdrant_sources = [source for source in SOURCES if not (source == "who" and WHO_BACKEND == "local")]
+    searches = [(i, source) for i in range(len(questions)) for source in qdrant_sources]
+    # Both sources share one round trip, so their time is recorded together as "search"
+    with stage("search" if len(qdrant_sources) > 1 else f"{qdrant_sources[0]}_search"):
+        try:
+            responses = await aqdrant.query_batch_points(
+                collection_name=collection_name,
+                requests=[
+                    QueryRequest(query=q_vecs[i], filter=search_filter(source, session_id, topics[i]),
+                                 limit=first_stage_limit(candidates), params=search_params(), with_payload=True)
+                    for i, source in searches
+                ]
+            )
+        except Exception as e:
+            logger.error(f"Error querying context from Qdrant: {e}")
+            responses = [None] * len(searches)
+    points = {search: r.points if r else [] for search, r in zip(searches, responses)}
+    if WHO_BACKEND == "local":
+        with stage("who_search"):
+            for i, q_vec in enumerate(q_vecs):
+                points[(i, "who")] = local_who.search(q_vec, first_stage_limit(candidates), topics[i])
+    keys = [(i, source) for i in range(len(questions)) for source in SOURCES]
+    # As in retrieve_context, a failure after the search leaves the questions without context
+    try:
+        fused = await asyncio.gather(*(
+            fuse_candidates(questions[i], point_payloads(points[(i, source)]), source, session_id, report_version,
+                            candidates, topics[i])
+            for i, source in keys
+        ))
+
+        # One rerank pass: the candidates of every question and source that need scoring go together
+        groups = [Candidates(questions[i], payloads, top_k[source], point_scores(points[(i, source)]))
+                  for (i, source), payloads in zip(keys, fused)]
+        with stage("rerank"):
+            ranked = await adaptive_reranker.rerank(groups)
     except Exception as e:
-        print(f"Error querying WHO context from Qdrant: {e}")
-        who_context = ""
-    print(report_context)
-    print(who_context)
-    # --- Prompt ---
+        logger.error(f"Error reranking context: {e}")
+        ranked = [[] for _ in keys]
+
+    contexts = [{} for _ in questions]
+    for (i, source), chunks in zip(keys, ranked):
+        contexts[i][source] = [ContextChunk.from_payload(payload, score, source) for payload, score in chunks]
+    return contexts
+
+
+def answer_scope(data: AskOptions, session_id: str, report_version: str) -> str:
+    topics = ",".join(sorted(data.topics)) if data.topics else "*"
+    return f"{session_id}|{report_version}|{data.candidates}|{data.report_top_k}|{data.who_top_k}|{topics}"
+
+
+@dataclass
+class PreparedAnswer:
+    scope: str
+    cached: str | None = None
+    q_embedding: np.ndarray | None = None
+    prompt: str = ""
+    report_chunks: list[str] | None = None
+    who_chunks: list[str] | None = None
+    prompt_tokens: int = 0  # estimated, see chunking.estimate_tokens
+    cacheable: bool = True
+
+
+async def prepare_answers(questions: list[str], options: AskOptions, session_id: str) -> list[PreparedAnswer]:
+    # Everything up to the LLM call, for one question or a whole batch: cache lookups,
+    # embedding, retrieval, reranking, prompts
+    report_version = await sessions.report_version(session_id)
+    scope = answer_scope(options, session_id, report_version)
+    await sessions.touch(session_id)
+    prepared = [PreparedAnswer(scope, cached=answer_cache.get_exact(scope, question)) for question in questions]
+
+    pending = [i for i, p in enumerate(prepared) if p.cached is None]
+    with stage("embed"):
+        q_embeddings = await embed_batcher.submit_many([questions[i] for i in pending])
+    for i, q_embedding in zip(pending, q_embeddings):
+        prepared[i].q_embedding = q_embedding
+        prepared[i].cached = answer_cache.get_semantic(scope, q_embedding)
+    pending = [i for i in pending if prepared[i].cached is None]
+    if not pending:
+        return prepared
+
+    q_vecs = [prepared[i].q_embedding.tolist() for i in pending]
+    top_k = {"report": options.report_top_k, "who": options.who_top_k}
+    topics = [question_topics(options, prepared[i].q_embedding) for i in pending]
+
+    if RETRIEVAL_MODE == "per_source":
+        contexts = await asyncio.gather(*(
+            retrieve_contexts_per_source(questions[i], q_vec, session_id, report_version, options.candidates,
+                                         top_k, q_topics)
+            for i, q_vec, q_topics in zip(pending, q_vecs, topics)
+        ))
+    else:
+        contexts = await retrieve_contexts_batched([questions[i] for i in pending], q_vecs, session_id,
+                                                   report_version, options.candidates, top_k, topics)
+    for i, context in zip(pending, contexts):
+        with stage("context_pack"):
+            reranked = context["report"] + context["who"]
+            packed = pack_context(reranked) if CONTEXT_PACKING else unpacked_context(reranked)
+        prepared[i].report_chunks, prepared[i].who_chunks = packed.texts("report"), packed.texts("who")
+        with stage("prompt_build"):
+            prepared[i].prompt = build_prompt(questions[i], "\n".join(prepared[i].report_chunks),
+                                              "\n".join(prepared[i].who_chunks))
+        prepared[i].prompt_tokens = estimate_tokens(prepared[i].prompt)
+        PROMPT_TOKENS.observe(prepared[i].prompt_tokens)
+        # While a report is still being ingested, answers reflect a partial report
+        prepared[i].cacheable = report_version != "indexing"
+    return prepared
+
+
+async def prepare_answer(data: QuestionRequest, session_id: str) -> PreparedAnswer:
+    return (await prepare_answers([data.question], data, session_id))[0]
+
+
+async def generate_answer(question: str, prepared: PreparedAnswer) -> str:
+    if prepared.cached is not None:
+        return prepared.cached
+    with stage("llm"):
+        answer = await llm.generate(prepared.prompt)
+    if prepared.cacheable:
+        answer_cache.put(prepared.scope, question, answer, prepared.q_embedding)
+    return answer
+
+
+def build_prompt(question: str, report_context: str, who_context: str) -> str:
     prompt = f"""You are a helpful health assistant.
 
-The user asked: "{data.question}"
+The user asked: "{question}"
 
 === Context from Patient Report ===
 {report_context if report_context else "No relevant information found in patient report."}
@@ -288,8 +639,126 @@ Please answer the question based only on the provided context. Follow these guid
 If the answer cannot be found in the provided relevant context from either the patient report or WHO guidelines,
 reply: "Sorry, I couldn't find relevant information in the available context to answer that specific question."
 """
+    return prompt
+
+
+@app.post("/ask", dependencies=[Depends(require_ready)])
+async def ask_question(data: QuestionRequest, session_id: str = Depends(session_id_header)):
+    prepared = await prepare_answer(data, session_id)
     try:
-        response = model.generate_content(prompt)
-        return {"answer": response.text}
+        answer = await generate_answer(data.question, prepared)
     except Exception as e:
-        return JSONResponse(status_code=500, content={"error": f"Gemini error: {e}"})
\ No newline at end of file
+        return JSONResponse(status_code=500, content={"error": f"Gemini error: {e}"})
+    # 0 for answers served from the cache, which sent no prompt
+    return {"answer": answer, "prompt_tokens": prepared.prompt_tokens}
+
+
+# === Batch Ask Endpoint ===
+async def answer_batch(questions: list[str], options: AskOptions, session_id: str):
+    """Yields {"index", "question", "cached", "prompt_tokens", "answer" | "error"} per question, as answers complete.
+
+    The batch shares one embedding submission, one Qdrant batch query and one rerank pass
+    (see prepare_answers); LLM calls run at most ASK_BATCH_LLM_CONCURRENCY at a time.
+    Used by POST /ask/batch and the offline ask_batch.py CLI.
+    """
+    prepared = await prepare_answers(questions, options, session_id)
+    llm_slots = asyncio.Semaphore(ASK_BATCH_LLM_CONCURRENCY)
+
+    async def answer(i: int) -> dict:
+        result = {"index": i, "question": questions[i], "cached": prepared[i].cached is not None,
+                  "prompt_tokens": prepared[i].prompt_tokens}
+        try:
+            if prepared[i].cached is not None:
+                result["answer"] = prepared[i].cached
+            else:
+                async with llm_slots:
+                    result["answer"] = await generate_answer(questions[i], prepared[i])
+        except Exception as e:
+            result["error"] = f"Gemini error: {e}"
+        return result
+
+    tasks = [asyncio.create_task(answer(i)) for i in range(len(questions))]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Stopped early (client gone): don't keep generating answers nobody reads
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/ask/batch", dependencies=[Depends(require_ready)])
+async def ask_batch(data: BatchQuestionRequest, request: Request, session_id: str = Depends(session_id_header)):
+    # Newline-delimited JSON, one line per question in completion order; `index` points into `questions`
+    async def lines():
+        async with aclosing(answer_batch(data.questions, data, session_id)) as results:
+            async for result in results:
+                if await request.is_disconnected():
+                    logger.info("Client disconnected, cancelling batch.")
+                    return
+                yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# === Streaming Ask Endpoint ===
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def done_event() -> dict:
+    # The headers went out before retrieval started, so the stage timings travel here instead
+    return {"timings_ms": request_stages_ms()} if TIMING_HEADER else {}
+
+
+@app.post("/ask/stream", dependencies=[Depends(require_ready)])
+async def ask_question_stream(data: QuestionRequest, request: Request, session_id: str = Depends(session_id_header)):
+    # Server-Sent Events: `meta` once retrieval is done, then `token` events as the model
+    # produces text, then `done` (or `error`). A client disconnect stops generation.
+    async def events():
+        try:
+            prepared = await prepare_answer(data, session_id)
+        except Exception as e:
+            # The 200 and its headers are already sent, so the failure has to travel as an event
+            logger.error(f"Error preparing streamed answer: {e}")
+            yield sse_event("error", {"error": f"Retrieval error: {e}"})
+            return
+        yield sse_event("meta", {
+            "cached": prepared.cached is not None,
+            "report_chunks": len(prepared.report_chunks or []),
+            "who_chunks": len(prepared.who_chunks or []),
+            "prompt_tokens": prepared.prompt_tokens,
+        })
+        if prepared.cached is not None:
+            yield sse_event("token", {"text": prepared.cached})
+            yield sse_event("done", done_event())
+            return
+
+        parts = []
+        stream = llm.stream(prepared.prompt)
+        started = time.perf_counter()
+        try:
+            async for token in stream:
+                if await request.is_disconnected():
+                    logger.info("Client disconnected, cancelling generation.")
+                    return
+                if not parts:
+                    record_stage("llm_first_token", time.perf_counter() - started)
+                parts.append(token)
+                yield sse_event("token", {"text": token})
+            record_stage("llm", time.perf_counter() - started)
+        except Exception as e:
+            yield sse_event("error", {"error": f"Gemini error: {e}"})
+            return
+        finally:
+            # Closing the generator tears down the upstream model stream as well
+            await stream.aclose()
+        if prepared.cacheable:
+            answer_cache.put(prepared.scope, data.question, "".join(parts), prepared.q_embedding)
+        yield sse_event("done", done_event())
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+readiness.imported()
@@ -0,0 +1,183 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# === Inference Backends ===
+# INFERENCE_BACKEND picks how the embedder and cross-encoder run on CPU:
+#   "torch"     full-precision PyTorch (default)
+#   "int8"      PyTorch with dynamic int8 quantization of every Linear layer (no extra dependencies)
+#   "onnx"      ONNX Runtime, fp32 graph
+#   "onnx-int8" ONNX Runtime, int8-quantized graph published with the model
+# The ONNX backends need `pip install "sentence-transformers[onnx]"` (sentence-transformers >= 4.1).
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+# Threads per forward pass; with INFERENCE_WORKERS passes in parallel, cores / INFERENCE_WORKERS is a good start
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))  # 0 = library default
+ONNX_EMBEDDER_FILE = os.getenv("ONNX_EMBEDDER_FILE", "")
+ONNX_RERANKER_FILE = os.getenv("ONNX_RERANKER_FILE", "")
+# AVX2 is available on every fly.io CPU; use the avx512_vnni file on hosts that have it
+ONNX_INT8_FILE = "onnx/model_qint8_avx2.onnx"
+INFERENCE_BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+
+EMBEDDER_MODEL_NAME = "all-MiniLM-L12-v2"
+RERANKER_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# Known up front so collections and caches can be set up before the embedder is loaded
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))
+
+
+def model_id(model_name: str, backend: str = INFERENCE_BACKEND) -> str:
+    # Caches of model outputs are keyed by this, so vectors from different backends never mix
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+def _check_backend(backend: str):
+    if backend not in INFERENCE_BACKENDS:
+        raise RuntimeError(f"❌ Unknown INFERENCE_BACKEND '{backend}', expected one of {', '.join(INFERENCE_BACKENDS)}.")
+
+
+def _set_torch_threads():
+    if INFERENCE_THREADS:
+        import torch
+        torch.set_num_threads(INFERENCE_THREADS)
+
+
+def _onnx_model_kwargs(file_name: str) -> dict:
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    if INFERENCE_THREADS:
+        options.intra_op_num_threads = INFERENCE_THREADS
+        options.inter_op_num_threads = 1
+    kwargs = {"provider": "CPUExecutionProvider", "session_options": options}
+    if file_name:
+        kwargs["file_name"] = file_name
+    return kwargs
+
+
+def _quantize_dynamic(module):
+    import torch
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def load_embedder(model_name: str = EMBEDDER_MODEL_NAME, backend: str = INFERENCE_BACKEND):
+    from sentence_transformers import SentenceTransformer
+
+    _check_backend(backend)
+    if backend.startswith("onnx"):
+        file_name = ONNX_EMBEDDER_FILE or (ONNX_INT8_FILE if backend == "onnx-int8" else "")
+        return SentenceTransformer(model_name, device="cpu", backend="onnx",
+                                   model_kwargs=_onnx_model_kwargs(file_name))
+    _set_torch_threads()
+    embedder = SentenceTransformer(model_name, device="cpu")
+    if backend == "int8":
+        _quantize_dynamic(embedder)
+    return embedder
+
+
+def load_reranker(model_name: str = RERANKER_MODEL_NAME, backend: str = INFERENCE_BACKEND):
+    from sentence_transformers import CrossEncoder
+
+    _check_backend(backend)
+    if backend.startswith("onnx"):
+        file_name = ONNX_RERANKER_FILE or (ONNX_INT8_FILE if backend == "onnx-int8" else "")
+        return CrossEncoder(model_name, device="cpu", backend="onnx", model_kwargs=_onnx_model_kwargs(file_name))
+    _set_torch_threads()
+    reranker = CrossEncoder(model_name, device="cpu")
+    if backend == "int8":
+        _quantize_dynamic(reranker.model)
+    return reranker
+
+
+class LazyModel:
+    """Loads a model on first use, or when the warm-up task calls `load()`; safe across threads.
+
+    Attribute access is forwarded to the loaded model, so it can be passed anywhere a model is expected.
+    """
+
+    def __init__(self, name: str, loader):
+        self.name = name
+        self._loader = loader
+        self._model = None
+        self._lock = threading.Lock()
+        self.load_seconds: float | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    self._model = self._loader()
+                    self.load_seconds = time.perf_counter() - start
+                    logger.info(f"Loaded {self.name} ({INFERENCE_BACKEND}) in {self.load_seconds:.1f}s")
+        return self._model
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+
+# === Pre-fork Loading ===
+# Under gunicorn with preload_app (see gunicorn.conf.py) the master loads the weights and the
+# workers it forks share those pages copy-on-write instead of each loading a copy
+_worker_threads = 0
+
+
+def preload_models(*models: LazyModel) -> bool:
+    """Load model weights in a pre-fork master; returns False when the backend can't be shared.
+
+    Loading runs single-threaded: an OpenMP pool started before fork deadlocks in the workers,
+    which get their threads back from `after_fork()`.
+    """
+    global INFERENCE_THREADS, _worker_threads
+    if INFERENCE_BACKEND.startswith("onnx"):
+        # Session thread pools don't survive a fork
+        logger.info("ONNX Runtime sessions can't be shared across fork; each worker loads its own models.")
+        return False
+    import torch
+
+    _worker_threads = INFERENCE_THREADS or torch.get_num_threads()
+    INFERENCE_THREADS = 1
+    try:
+        for model in models:
+            model.load()
+    finally:
+        INFERENCE_THREADS = _worker_threads
+    return True
+
+
+def after_fork():
+    if _worker_threads:
+        import torch
+        torch.set_num_threads(_worker_threads)
+
+
+# === Accuracy Checks ===
+# Used by benchmarks/inference_backends.py to compare a backend's outputs with fp32 torch
+def compare_embeddings(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    ref = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cand = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosine = (ref * cand).sum(axis=1)
+    # Retrieval only cares about rankings: does every query still rank the documents the same way?
+    same_top1 = float(np.mean((ref @ ref.T).argmax(axis=1) == (cand @ cand.T).argmax(axis=1)))
+    return {"min_cosine": round(float(cosine.min()), 5), "mean_cosine": round(float(cosine.mean()), 5),
+            "same_nearest_neighbour": round(same_top1, 4)}
+
+
+def compare_scores(reference: np.ndarray, candidate: np.ndarray, group_size: int) -> dict:
+    # Scores come in groups of `group_size` passages per query; compare the order within each group
+    ref = np.asarray(reference, dtype=np.float64).reshape(-1, group_size)
+    cand = np.asarray(candidate, dtype=np.float64).reshape(-1, group_size)
+    ref_ranks = ref.argsort(axis=1).argsort(axis=1)
+    cand_ranks = cand.argsort(axis=1).argsort(axis=1)
+    n = group_size
+    spearman = 1 - 6 * ((ref_ranks - cand_ranks) ** 2).sum(axis=1) / (n * (n ** 2 - 1)) if n > 1 else np.ones(len(ref))
+    return {"max_abs_diff": round(float(np.abs(ref - cand).max()), 4),
+            "same_top1": round(float(np.mean(ref.argmax(axis=1) == cand.argmax(axis=1))), 4),
+            "mean_spearman": round(float(spearman.mean()), 4)}
@@ -0,0 +1,191 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# === Observability Settings ===
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+# TIMING_HEADER=on adds the stages of each request to its response as a Server-Timing header
+# (and to the `done` event of /ask/stream, whose headers go out before retrieval starts)
+TIMING_HEADER = os.getenv("TIMING_HEADER", "off") == "on"
+# Seconds: from cache lookups and local searches up to LLM calls and whole uploads
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Estimated tokens per LLM prompt, instructions included
+TOKEN_BUCKETS = (250, 500, 750, 1000, 1250, 1500, 2000, 3000, 4000, 8000)
+
+
+def configure_logging(level: str = LOG_LEVEL):
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+class Histogram:
+    """Prometheus-style histogram with one series per combination of label values.
+
+    Rendered in the text exposition format by `render_metrics()`; kept per process, so with
+    several gunicorn workers each scrape sees the worker that answered it.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series: dict[tuple[str, ...], list] = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(counts), total, count)
+                            for labels, (counts, total, count) in self._series.items())
+        for labels, counts, total, count in series:
+            base = dict(zip(self.labelnames, labels))
+            for bound, n in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels({**base, 'le': repr(bound)})} {n}")
+            lines.append(f"{self.name}_bucket{_format_labels({**base, 'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(base)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(base)} {count}")
+        return lines
+
+
+class Counter:
+    """Prometheus-style counter with one series per combination of label values."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount: float, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, labels)))} {value:g}")
+        return lines
+
+
+REGISTRY: list[Histogram | Counter] = []
+
+STAGE_SECONDS = Histogram(
+    "medrag_stage_seconds",
+    "Time spent in each stage of answering a question or ingesting a report.",
+    ("stage",),
+)
+REQUEST_SECONDS = Histogram(
+    "medrag_http_request_seconds",
+    "HTTP request latency, until the response body is complete.",
+    ("method", "route", "status"),
+)
+RERANK_PAIRS = Counter(
+    "medrag_rerank_pairs_total",
+    "(question, chunk) pairs by what the adaptive reranker did with them.",
+    ("outcome",),
+)
+PROMPT_TOKENS = Histogram(
+    "medrag_prompt_tokens",
+    "Estimated size of each prompt sent to the LLM, in tokens.",
+    buckets=TOKEN_BUCKETS,
+)
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# === Stage Timing ===
+# The stages of the request being handled; asyncio tasks and to_thread calls inherit the context,
+# so stages timed in gathered sub-tasks still land on their request
+_request_stages: ContextVar[dict[str, float] | None] = ContextVar("request_stages", default=None)
+
+
+def record_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, name)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def request_stages_ms() -> dict[str, float]:
+    return {name: round(seconds * 1000, 2) for name, seconds in (_request_stages.get() or {}).items()}
+
+
+def server_timing(stages: dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in stages.items())
+
+
+class TimingMiddleware:
+    """ASGI middleware: times every HTTP request by route, and collects the stages it goes through."""
+
+    def __init__(self, app, timing_header: bool = TIMING_HEADER):
+        self.app = app
+        self.timing_header = timing_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stages: dict[str, float] = {}
+        token = _request_stages.set(stages)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.timing_header and stages:
+                    headers = [*message.get("headers", []), (b"server-timing", server_timing(stages).encode())]
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            # The route template ("/upload/jobs/{job_id}"), not the raw path, to keep series bounded
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"],
+                                    getattr(route, "path", "unmatched"), str(status))
+            _request_stages.reset(token)
@@ -0,0 +1,21 @@
+# Kept free of heavy imports: this module is loaded by the PDF extraction worker processes
+import time
+
+import fitz  # PyMuPDF
+
+
+def page_count(path: str) -> int:
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def extract_pages(path: str, start: int, stop: int) -> list[str]:
+    with fitz.open(path) as doc:
+        return [doc[i].get_text() for i in range(start, min(stop, doc.page_count))]
+
+
+def extract_pages_timed(path: str, start: int, stop: int) -> tuple[list[str], float]:
+    # The metrics live in the parent process, so the worker only reports how long it took
+    started = time.perf_counter()
+    pages = extract_pages(path, start, stop)
+    return pages, time.perf_counter() - started
@@ -0,0 +1,46 @@
+# Fields of /proc/<pid>/smaps_rollup, in kB
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def memory_stats(pid: int | str = "self") -> dict:
+    """Resident memory of a process split into shared and private pages, in MB (Linux only).
+
+    Pss charges each shared page to the processes sharing it, so summing Pss over a master and
+    its workers gives their real footprint; Private is roughly what one more worker costs.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in SMAPS_FIELDS:
+                    fields[name] = int(value.split()[0]) / 1024
+    except (OSError, ValueError):
+        return {}
+    return {
+        "rss_mb": round(fields.get("Rss", 0.0), 1),
+        "pss_mb": round(fields.get("Pss", 0.0), 1),
+        "shared_mb": round(fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0), 1),
+        "private_mb": round(fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0), 1),
+    }
+
+
+def child_pids(pid: int) -> list[int]:
+    # Direct children, e.g. the workers of a gunicorn master
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "r") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def peak_rss_mb(pid: int | str = "self") -> float | None:
+    # High-water mark of the resident set since the process started (VmHWM), in MB
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except (OSError, ValueError):
+        pass
+    return None
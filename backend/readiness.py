@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import os
+import time
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# === Readiness Settings ===
+# Requests that need the models or indexes wait this long for warm-up before getting a 503
+READY_WAIT_TIMEOUT = float(os.getenv("READY_WAIT_TIMEOUT", "60"))
+
+
+class Readiness:
+    """Tracks the components the app needs before it can answer questions.
+
+    Each component goes pending -> loading -> ready (or failed, with the error kept for the
+    readiness probe); the time from module import to each state change is recorded.
+    """
+
+    def __init__(self, components: list[str], started: float):
+        self.started = started
+        self.status = {component: "pending" for component in components}
+        self.errors: dict[str, str] = {}
+        self.seconds: dict[str, float] = {}
+        self.import_seconds: float | None = None
+        self.ready_seconds: float | None = None
+        self._ready = asyncio.Event()
+
+    @property
+    def ready(self) -> bool:
+        return all(status == "ready" for status in self.status.values())
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def imported(self):
+        self.import_seconds = self.elapsed()
+        logger.info(f"App imported in {self.import_seconds:.2f}s, warming up in the background.")
+
+    def mark(self, component: str, status: str, error: str | None = None):
+        self.status[component] = status
+        self.seconds[component] = round(self.elapsed(), 3)
+        if error is not None:
+            self.errors[component] = error
+        else:
+            self.errors.pop(component, None)
+        if self.ready and not self._ready.is_set():
+            self.ready_seconds = self.elapsed()
+            self._ready.set()
+            logger.info(f"✅ Ready {self.ready_seconds:.2f}s after import started "
+                        f"({', '.join(f'{c} at {s:.1f}s' for c, s in self.seconds.items())}).")
+
+    async def wait(self, timeout: float = READY_WAIT_TIMEOUT) -> bool:
+        if self.ready:
+            return True
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def to_dict(self) -> dict:
+        return {
+            "status": "ready" if self.ready else "starting",
+            "components": self.status,
+            "errors": self.errors,
+            "seconds_since_import": self.seconds,
+            "import_seconds": round(self.import_seconds, 3) if self.import_seconds is not None else None,
+            "import_to_ready_seconds": round(self.ready_seconds, 3) if self.ready_seconds is not None else None,
+        }
+
+    def dependency(self):
+        # FastAPI dependency for endpoints that need the models and indexes
+        async def require_ready():
+            if not await self.wait():
+                raise HTTPException(status_code=503, detail="Service is warming up, try again shortly.",
+                                    headers={"Retry-After": "5"})
+        return require_ready
@@ -0,0 +1,329 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, fields
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from qdrant_client.models import FieldCondition, Filter, FilterSelector, MatchValue, PointStruct, Range
+
+from chunking import chunk_section
+from embedding_store import POINT_ID_NAMESPACE
+from ingestion import index_chunks
+from observability import record_stage, stage
+from pdf_extract import extract_pages_timed, page_count
+from sessions import report_filter
+
+logger = logging.getLogger(__name__)
+
+# === Report Ingestion Settings ===
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", tempfile.gettempdir())
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", "100"))
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "2"))
+PAGES_PER_TASK = int(os.getenv("PAGES_PER_TASK", "8"))
+# Page batches extracted ahead of indexing; together with PAGES_PER_TASK this bounds memory
+MAX_PAGE_TASKS_IN_FLIGHT = int(os.getenv("MAX_PAGE_TASKS_IN_FLIGHT", str(PDF_EXTRACT_WORKERS * 2)))
+JOB_RETENTION = 200
+# Seconds a finished job's status stays readable, from any worker, in `<collection>_upload_jobs`
+UPLOAD_JOB_TTL = float(os.getenv("UPLOAD_JOB_TTL", str(24 * 3600)))
+SPOOL_CHUNK_BYTES = 1 << 20
+
+
+class UploadRejected(Exception):
+    pass
+
+
+def upload_jobs_collection_name(collection_name: str) -> str:
+    return f"{collection_name}_upload_jobs"
+
+
+def job_point_id(job_id: str) -> str:
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"upload-job:{job_id}"))
+
+
+@dataclass
+class IngestJob:
+    job_id: str
+    session_id: str
+    report_id: str
+    path: str
+    pages_total: int
+    status: str = "queued"  # queued | running | done | failed | cancelled
+    pages_processed: int = 0
+    chunks_indexed: int = 0
+    chunks_failed: int = 0
+    created: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+    error: str | None = None
+    cancelled: bool = False
+    task: asyncio.Task | None = field(default=None, repr=False)
+
+    @property
+    def report_version(self) -> str:
+        # Unique per upload, even of the same file: a worker that read the old version just before
+        # a re-upload may have cached answers or a BM25 index from the half-replaced report under it
+        return f"{self.report_id}-{self.job_id[:8]}"
+
+    def to_payload(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.name != "task"}
+
+    @classmethod
+    def from_payload(cls, payload: dict) -> "IngestJob":
+        return cls(**{f.name: payload[f.name] for f in fields(cls) if f.name in payload})
+
+    def to_dict(self) -> dict:
+        elapsed = ((self.finished or time.time()) - self.started) if self.started else 0.0
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "pages_total": self.pages_total,
+            "pages_processed": self.pages_processed,
+            "chunks_indexed": self.chunks_indexed,
+            "chunks_failed": self.chunks_failed,
+            "elapsed_seconds": round(elapsed, 3),
+            "pages_per_second": round(self.pages_processed / elapsed, 2) if elapsed else 0.0,
+            "chunks_per_second": round(self.chunks_indexed / elapsed, 2) if elapsed else 0.0,
+            "error": self.error,
+        }
+
+
+async def spool_upload(file: UploadFile) -> tuple[str, str]:
+    # Stream the upload to disk in 1 MB pieces instead of holding the whole PDF in memory
+    digest = hashlib.sha256()
+    size = 0
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=UPLOAD_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while data := await file.read(SPOOL_CHUNK_BYTES):
+                size += len(data)
+                if size > MAX_UPLOAD_MB * 1024 * 1024:
+                    raise UploadRejected(f"PDF is larger than {MAX_UPLOAD_MB:.0f} MB.")
+                digest.update(data)
+                await run_in_threadpool(out.write, data)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def job_filter(job: IngestJob) -> Filter:
+    # The report points one job has written
+    return Filter(must=[*report_filter(job.session_id).must,
+                        FieldCondition(key="job_id", match=MatchValue(value=job.job_id))])
+
+
+class ReportIngestor:
+    """Runs report uploads as background jobs: spool, extract pages in a process pool,
+    and chunk/embed/upsert page batches as they arrive so the report is searchable early.
+
+    A job runs in the worker that received the upload, but its status is written to
+    `<collection>_upload_jobs` as it goes, so any worker can answer the status poll. The job
+    owning a session is named in the session record (see sessions.py); a job that finds
+    another one named there has been superseded by a newer upload and stops.
+    """
+
+    def __init__(self, qdrant, aqdrant, collection_name: str, embedder, sessions, answer_cache,
+                 inference_executor=None):
+        self.qdrant = qdrant
+        self.aqdrant = aqdrant
+        self.collection_name = collection_name
+        self.jobs_collection = upload_jobs_collection_name(collection_name)
+        self.embedder = embedder
+        # Report chunks are embedded on the same bounded pool as questions, so uploads share its cap
+        self.inference_executor = inference_executor
+        self.sessions = sessions
+        self.answer_cache = answer_cache
+        self.jobs: OrderedDict[str, IngestJob] = OrderedDict()
+        self._active: dict[str, IngestJob] = {}
+        self._pool: ProcessPoolExecutor | None = None
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn, not fork: the parent holds torch thread pools that don't survive a fork
+            self._pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def submit(self, session_id: str, file: UploadFile) -> IngestJob:
+        path, file_hash = await spool_upload(file)
+        try:
+            pages_total = await run_in_threadpool(page_count, path)
+        except Exception as e:
+            os.remove(path)
+            raise UploadRejected(f"Error reading PDF: {e}")
+
+        job = IngestJob(job_id=uuid.uuid4().hex, session_id=session_id, report_id=file_hash[:16],
+                        path=path, pages_total=pages_total)
+        previous = self._active.get(session_id)
+        self._active[session_id] = job
+        self.jobs[job.job_id] = job
+        await self._prune()
+        # Stored before the response goes out, so the first poll finds it whichever worker it reaches
+        await self._save(job, wait=True)
+        # The session is claimed now rather than when the job starts, so the latest upload wins even
+        # while this one waits for an older job. Answers generated while the old report is being
+        # replaced must never be reused; every worker sees "indexing" within SESSION_VERSION_TTL.
+        try:
+            await self.sessions.set_report_version(session_id, "indexing", job_id=job.job_id)
+        except Exception as e:
+            logger.error(f"Error claiming session {session_id} for upload job {job.job_id}: {e}")
+        self.answer_cache.invalidate(f"{session_id}|")
+        job.task = asyncio.create_task(self._run(job, previous), name=f"ingest-{job.job_id}")
+        return job
+
+    async def get(self, job_id: str) -> IngestJob | None:
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        try:
+            points = await self.aqdrant.retrieve(collection_name=self.jobs_collection, ids=[job_point_id(job_id)],
+                                                 with_payload=True)
+        except Exception as e:
+            logger.error(f"Error reading upload job {job_id}: {e}")
+            return None
+        return IngestJob.from_payload(points[0].payload) if points and points[0].payload else None
+
+    async def _save(self, job: IngestJob, wait: bool = False):
+        try:
+            await self.aqdrant.upsert(collection_name=self.jobs_collection, wait=wait,
+                                      points=[PointStruct(id=job_point_id(job.job_id), vector=[1.0],
+                                                          payload=job.to_payload())])
+        except Exception as e:
+            logger.error(f"Error saving the status of upload job {job.job_id}: {e}")
+
+    async def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(self.jobs) - JOB_RETENTION)]:
+            del self.jobs[job_id]
+        try:
+            await self.aqdrant.delete(collection_name=self.jobs_collection, points_selector=FilterSelector(
+                filter=Filter(must=[FieldCondition(key="finished", range=Range(lt=time.time() - UPLOAD_JOB_TTL))])))
+        except Exception as e:
+            logger.error(f"Error removing old upload jobs: {e}")
+
+    async def _superseded(self, job: IngestJob) -> bool:
+        # A newer upload for the session, possibly in another worker, has claimed it
+        owner = await self.sessions.current_job(job.session_id)
+        return owner is not None and owner != job.job_id
+
+    async def _run(self, job: IngestJob, previous: IngestJob | None):
+        # A newer upload for the same session supersedes the running one; in this worker, wait
+        # for it to stop so none of its upserts land after our delete. A job in another worker
+        # stops at its next page batch, and removes whatever it wrote itself.
+        if previous is not None and previous.task is not None:
+            previous.cancelled = True
+            await asyncio.gather(previous.task, return_exceptions=True)
+
+        scope_prefix = f"{job.session_id}|"
+        pending: deque = deque()
+        try:
+            # Superseded while it waited for an older job to stop
+            if await self._superseded(job):
+                job.status = "cancelled"
+                return
+            # Clear this session's old report data; other sessions' reports are untouched
+            try:
+                await self.aqdrant.delete(collection_name=self.collection_name,
+                                          points_selector=FilterSelector(filter=report_filter(job.session_id)))
+            except Exception as e:
+                logger.error(f"Error clearing old report data: {e}")  # Continue even if there's an error clearing old data
+            job.status = "running"
+            job.started = time.time()
+            await self._save(job)
+            await self._ingest_pages(job, pending)
+            if job.cancelled or await self._superseded(job):
+                job.status = "cancelled"
+            elif job.chunks_failed:
+                job.status = "failed"
+                job.error = f"Failed to index {job.chunks_failed} report chunks."
+            else:
+                job.status = "done"
+                await self.sessions.set_report_version(job.session_id, job.report_version, job_id=job.job_id)
+        except Exception as e:
+            job.status = "failed"
+            job.error = f"Failed to index report: {e}"
+        finally:
+            for _, future in pending:
+                future.cancel()
+            if job.status != "done":
+                await self._discard(job)
+            job.finished = time.time()
+            await self._save(job, wait=True)
+            self.answer_cache.invalidate(scope_prefix)
+            if self._active.get(job.session_id) is job:
+                del self._active[job.session_id]
+            try:
+                os.remove(job.path)
+            except OSError:
+                pass
+            logger.info(f"Report job {job.job_id} {job.status}: {job.to_dict()}")
+
+    async def _discard(self, job: IngestJob):
+        # A failed or cancelled job leaves nothing searchable behind, and the session leaves
+        # "indexing": its version is re-read from what is left (normally nothing, so "none"),
+        # unless a newer job has claimed the session
+        try:
+            await self.aqdrant.delete(collection_name=self.collection_name,
+                                      points_selector=FilterSelector(filter=job_filter(job)))
+        except Exception as e:
+            logger.error(f"Error removing the partial report of job {job.job_id}: {e}")
+        await self.sessions.reload(job.session_id, job.job_id)
+
+    async def _ingest_pages(self, job: IngestJob, pending: deque):
+        loop = asyncio.get_running_loop()
+        pool = self._process_pool()
+        ranges = [(start, min(start + PAGES_PER_TASK, job.pages_total))
+                  for start in range(0, job.pages_total, PAGES_PER_TASK)]
+        payload = {"source": "report", "session_id": job.session_id, "report_id": job.report_id,
+                   "job_id": job.job_id, "last_active": time.time()}
+        next_range = 0
+        # The last chunk of a batch may continue on the next page, so its text is carried over
+        # and re-chunked with the next batch; `carry_offset` is where it starts in the document
+        carry, carry_offset = "", 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < MAX_PAGE_TASKS_IN_FLIGHT:
+                start, stop = ranges[next_range]
+                pending.append((ranges[next_range], loop.run_in_executor(pool, extract_pages_timed, job.path, start, stop)))
+                next_range += 1
+            (start, stop), future = pending.popleft()
+            pages, extract_seconds = await future
+            record_stage("upload_extract", extract_seconds)
+            if job.cancelled or await self._superseded(job):
+                job.cancelled = True
+                return
+
+            text = carry + ("\n" if start > 0 else "") + "\n".join(pages)
+            with stage("upload_chunk"):
+                chunks = chunk_section(text)
+            base_offset = carry_offset
+            if chunks and stop < job.pages_total:
+                last = chunks.pop()
+                carry, carry_offset = text[last.offset:], base_offset + last.offset
+            else:
+                carry = ""
+            if chunks:
+                stats = await run_in_threadpool(index_chunks, self.qdrant, self.collection_name, self.embedder,
+                                                [chunk.text for chunk in chunks], payload=payload,
+                                                label="report chunks", stage_prefix="upload",
+                                                embed_executor=self.inference_executor,
+                                                chunk_payloads=[{"offset": base_offset + chunk.offset}
+                                                                for chunk in chunks])
+                job.chunks_indexed += stats.indexed
+                job.chunks_failed += stats.failed
+            job.pages_processed = stop
+            await self._save(job)
+
+    def shutdown(self):
+        for job in self._active.values():
+            job.cancelled = True
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
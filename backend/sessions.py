@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+import re
+import time
+import uuid
+from dataclasses import dataclass
+
+from fastapi import Header, HTTPException
+from qdrant_client.models import Filter, FieldCondition, FilterSelector, MatchValue, PointStruct, Range
+
+from embedding_store import POINT_ID_NAMESPACE
+
+logger = logging.getLogger(__name__)
+
+# === Session Settings ===
+# Each browser/tenant gets its own report slot, identified by the X-Session-ID header
+DEFAULT_SESSION_ID = "default"
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(24 * 3600)))            # seconds of inactivity before expiry
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "600"))
+SESSION_TOUCH_INTERVAL = float(os.getenv("SESSION_TOUCH_INTERVAL", "300"))  # min seconds between last_active writes
+# Seconds a worker trusts its copy of a session's report version before reading the shared record again
+SESSION_VERSION_TTL = float(os.getenv("SESSION_VERSION_TTL", "2"))
+
+
+def session_id_header(x_session_id: str | None = Header(default=None)) -> str:
+    # FastAPI dependency: reads and validates X-Session-ID, falling back to the shared default slot
+    if x_session_id is None:
+        return DEFAULT_SESSION_ID
+    if not SESSION_ID_PATTERN.match(x_session_id):
+        raise HTTPException(status_code=400, detail="Invalid X-Session-ID header.")
+    return x_session_id
+
+
+def report_filter(session_id: str) -> Filter:
+    return Filter(must=[
+        FieldCondition(key="source", match=MatchValue(value="report")),
+        FieldCondition(key="session_id", match=MatchValue(value=session_id)),
+    ])
+
+
+def sessions_collection_name(collection_name: str) -> str:
+    return f"{collection_name}_sessions"
+
+
+def session_point_id(session_id: str) -> str:
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"session:{session_id}"))
+
+
+def session_record_filter(session_id: str) -> Filter:
+    return Filter(must=[FieldCondition(key="session_id", match=MatchValue(value=session_id))])
+
+
+@dataclass
+class SessionState:
+    report_version: str
+    last_touch: float = 0.0
+    checked: float = 0.0  # time.monotonic() of the last read of the shared record
+
+
+class SessionRegistry:
+    """Each worker's view of the sessions that have reports: current report version and activity.
+
+    The version lives in a session record in `<collection>_sessions`, written by whichever
+    worker ingests the report, and every worker re-reads it once its copy is older than
+    SESSION_VERSION_TTL; answer cache scopes and report BM25 indexes are keyed by it, so a
+    re-upload in one worker retires them in all of them within that time. Sessions whose report
+    predates the records fall back to the `report_id` on their report points.
+
+    Activity is persisted as `last_active` on the record and the session's report points, so
+    idle reports can be expired by any worker (and survive restarts); writes are rate-limited to
+    one per SESSION_TOUCH_INTERVAL per session.
+    """
+
+    def __init__(self, aqdrant, collection_name: str):
+        self.aqdrant = aqdrant
+        self.collection_name = collection_name
+        self.records_collection = sessions_collection_name(collection_name)
+        self._sessions: dict[str, SessionState] = {}
+        self._sweeper: asyncio.Task | None = None
+
+    async def report_version(self, session_id: str) -> str:
+        state = self._sessions.get(session_id)
+        if state is None or time.monotonic() - state.checked > SESSION_VERSION_TTL:
+            report_version = await self._load_report_version(session_id)
+            state = SessionState(report_version, last_touch=state.last_touch if state else 0.0,
+                                 checked=time.monotonic())
+            self._sessions[session_id] = state
+        return state.report_version
+
+    async def _read_record(self, session_id: str) -> dict | None:
+        points = await self.aqdrant.retrieve(collection_name=self.records_collection,
+                                             ids=[session_point_id(session_id)], with_payload=True)
+        return (points[0].payload or {}) if points else None
+
+    async def _load_report_version(self, session_id: str) -> str:
+        try:
+            record = await self._read_record(session_id)
+            if record is not None:
+                return record.get("report_version", "unknown")
+            return await self._scan_report_version(session_id)
+        except Exception as e:
+            logger.error(f"Error reading report version for session {session_id}: {e}")
+            return "unknown"
+
+    async def _scan_report_version(self, session_id: str) -> str:
+        # From the report points themselves: reports uploaded before session records, or what a failed job left
+        points, _ = await self.aqdrant.scroll(collection_name=self.collection_name,
+                                              scroll_filter=report_filter(session_id),
+                                              limit=1, with_payload=["report_id"], with_vectors=False)
+        if not points:
+            return "none"
+        return (points[0].payload or {}).get("report_id", "legacy")
+
+    async def current_job(self, session_id: str) -> str | None:
+        # The upload job that owns the session (see report_jobs.py); None if there is none or it can't be read
+        try:
+            record = await self._read_record(session_id)
+        except Exception as e:
+            logger.error(f"Error reading the record of session {session_id}: {e}")
+            return None
+        return (record or {}).get("job_id")
+
+    async def set_report_version(self, session_id: str, report_version: str, job_id: str | None = None):
+        now = time.time()
+        record = {"session_id": session_id, "report_version": report_version, "job_id": job_id, "last_active": now}
+        await self.aqdrant.upsert(collection_name=self.records_collection, wait=True,
+                                  points=[PointStruct(id=session_point_id(session_id), vector=[1.0], payload=record)])
+        self._sessions[session_id] = SessionState(report_version, last_touch=now, checked=time.monotonic())
+
+    async def reload(self, session_id: str, job_id: str) -> str:
+        # Re-derive the version from the session's report points and publish it to every worker,
+        # unless another job than `job_id` has claimed the session since
+        try:
+            owner = (await self._read_record(session_id) or {}).get("job_id")
+            if owner not in (None, job_id):
+                self._sessions.pop(session_id, None)
+                return await self.report_version(session_id)
+            report_version = await self._scan_report_version(session_id)
+            await self.set_report_version(session_id, report_version)
+        except Exception as e:
+            logger.error(f"Error resetting report version for session {session_id}: {e}")
+            self._sessions.pop(session_id, None)
+            return "unknown"
+        return report_version
+
+    async def touch(self, session_id: str):
+        state = self._sessions.get(session_id)
+        now = time.time()
+        if state is None or state.report_version in ("none", "unknown") or now - state.last_touch < SESSION_TOUCH_INTERVAL:
+            return
+        state.last_touch = now
+        try:
+            await self.aqdrant.set_payload(collection_name=self.collection_name, payload={"last_active": now},
+                                           points=report_filter(session_id), wait=False)
+            await self.aqdrant.set_payload(collection_name=self.records_collection, payload={"last_active": now},
+                                           points=session_record_filter(session_id), wait=False)
+        except Exception as e:
+            logger.error(f"Error recording activity for session {session_id}: {e}")
+
+    async def expire_idle(self, ttl: float = SESSION_TTL):
+        cutoff = time.time() - ttl
+        idle = Filter(must=[
+            FieldCondition(key="source", match=MatchValue(value="report")),
+            FieldCondition(key="last_active", range=Range(lt=cutoff)),
+        ])
+        try:
+            expired = (await self.aqdrant.count(collection_name=self.collection_name, count_filter=idle,
+                                                exact=True)).count
+            if expired:
+                await self.aqdrant.delete(collection_name=self.collection_name,
+                                          points_selector=FilterSelector(filter=idle))
+                logger.info(f"Expired {expired} report chunks from sessions idle for more than {ttl:.0f}s.")
+            # Their records go too, so the sessions read as having no report
+            await self.aqdrant.delete(collection_name=self.records_collection, points_selector=FilterSelector(
+                filter=Filter(must=[FieldCondition(key="last_active", range=Range(lt=cutoff))])))
+        except Exception as e:
+            logger.error(f"Error expiring idle sessions: {e}")
+        # Forget local state for sessions nobody has touched in a while; it is reloaded on demand
+        for session_id in [s for s, state in self._sessions.items() if state.last_touch < cutoff]:
+            del self._sessions[session_id]
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+            await self.expire_idle()
+
+    def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_forever(), name="session-sweeper")
+
+    async def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
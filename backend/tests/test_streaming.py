@@ -0,0 +1,98 @@
+"""/ask/stream in-process: FakeStreamingLLM behind the real endpoint, driven through TestClient.
+
+TestClient only hands the body back once the response is complete, so arrival is measured
+where the app sends each event, against the moment the fake model finished generating.
+Retrieval is replaced with a fixed prompt, so no models or Qdrant data are needed:
+    python -m pytest tests
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Settings are read at import; keep the app offline and its caches out of the working tree
+os.environ.setdefault("QDRANT_URL", ":memory:")
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("EMBEDDING_CACHE_DIR", tempfile.mkdtemp(prefix="medrag_test_embeddings_"))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main  # noqa: E402
+from llm import FakeStreamingLLM  # noqa: E402
+
+ANSWER = "Anaemia is a condition in which the number of red blood cells is lower than normal."
+TOKEN_MS = 20
+
+
+class TimedFakeLLM(FakeStreamingLLM):
+    """Records when generation finished, i.e. when the last token had been produced."""
+
+    finished: float | None = None
+
+    async def stream(self, prompt: str):
+        async for token in super().stream(prompt):
+            yield token
+        self.finished = time.perf_counter()
+
+
+def timed_sends(app, sent: list[tuple[float, str, dict]]):
+    # ASGI wrapper noting when each SSE event leaves the app
+    async def recording_app(scope, receive, send):
+        async def timed_send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                for block in message["body"].decode().strip().split("\n\n"):
+                    event, data = (line.split(": ", 1)[1] for line in block.split("\n"))
+                    sent.append((time.perf_counter(), event, json.loads(data)))
+            await send(message)
+
+        await app(scope, receive, timed_send)
+
+    return recording_app
+
+
+def stream_events(monkeypatch, llm: FakeStreamingLLM) -> list[tuple[float, str, dict]]:
+    async def prepare_answer(data, session_id):
+        return main.PreparedAnswer(scope="test", prompt=f"Question: {data.question}", report_chunks=[],
+                                   who_chunks=["Anaemia is a condition..."], prompt_tokens=12, cacheable=False)
+
+    monkeypatch.setattr(main, "llm", llm)
+    monkeypatch.setattr(main, "prepare_answer", prepare_answer)
+    monkeypatch.setitem(main.app.dependency_overrides, main.require_ready, lambda: None)
+    sent = []
+    # No `with`: startup (and with it the model warm-up) is not run
+    response = TestClient(timed_sends(main.app, sent)).post("/ask/stream", json={"question": "What is anaemia?"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    return sent
+
+
+def test_meta_and_first_token_arrive_before_generation_completes(monkeypatch):
+    llm = TimedFakeLLM(ANSWER, first_token_ms=50, token_ms=TOKEN_MS)
+    sent = stream_events(monkeypatch, llm)
+
+    events = [event for _, event, _ in sent]
+    assert events[0] == "meta" and events[-1] == "done"
+    assert events.count("token") == len(ANSWER.split(" "))
+    assert "".join(data["text"] for _, event, data in sent if event == "token") == ANSWER
+
+    meta_sent = sent[0][0]
+    first_token_sent = next(at for at, event, _ in sent if event == "token")
+    assert llm.finished is not None
+    assert meta_sent < first_token_sent < llm.finished
+    # Streamed as produced, not held back until the end: the rest of the answer still took its time
+    remaining_tokens = len(ANSWER.split(" ")) - 1
+    assert llm.finished - first_token_sent >= remaining_tokens * TOKEN_MS / 1000 * 0.5
+
+
+def test_generation_error_becomes_an_error_event(monkeypatch):
+    class FailingLLM(FakeStreamingLLM):
+        async def stream(self, prompt: str):
+            yield "Anaemia "
+            raise RuntimeError("quota exceeded")
+
+    sent = stream_events(monkeypatch, FailingLLM(first_token_ms=0, token_ms=0))
+
+    assert [event for _, event, _ in sent] == ["meta", "token", "error"]
+    assert "quota exceeded" in sent[-1][2]["error"]
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+import threading
+
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import (
+    Distance,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    VectorParams,
+)
+from qdrant_client.http.exceptions import UnexpectedResponse
+
+logger = logging.getLogger(__name__)
+
+# QDRANT_URL=":memory:" runs Qdrant in-process (no server), for local development and tests
+LOCAL_QDRANT_URL = ":memory:"
+_local_qdrant = None
+# QDRANT_QUANTIZATION=int8 keeps a scalar-quantized copy of the vectors in RAM (4x smaller) and
+# searches it first, rescoring the best QDRANT_OVERSAMPLING x limit hits with the original vectors
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none")
+QDRANT_OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", "2.0"))
+
+
+def qdrant_settings() -> tuple[str, str | None]:
+    qdrant_url = os.getenv("QDRANT_URL")
+    if not qdrant_url:
+        # Raise an error if QDRANT_URL is not set, as it's now required
+        raise RuntimeError("❌ QDRANT_URL environment variable not set. Please set it to your Qdrant instance URL (e.g., your Qdrant Cloud URL), or to ':memory:' to run without a server.")
+
+    qdrant_api_key = os.getenv("QDRANT_API_KEY") # Optional, depending on your Qdrant setup
+    return qdrant_url, qdrant_api_key
+
+
+class SerializedQdrant:
+    """The in-process Qdrant is not thread-safe; this proxy runs one call at a time."""
+
+    def __init__(self, client: QdrantClient):
+        self._client = client
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+        return call
+
+
+class AsyncLocalQdrant:
+    """Async facade over the shared in-process client, so both clients see the same data."""
+
+    def __init__(self, client: SerializedQdrant):
+        self._client = client
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+        return call
+
+
+def local_qdrant() -> SerializedQdrant:
+    global _local_qdrant
+    if _local_qdrant is None:
+        _local_qdrant = SerializedQdrant(QdrantClient(location=LOCAL_QDRANT_URL))
+        logger.info("Using in-process Qdrant (QDRANT_URL=:memory:); data is lost on restart.")
+    return _local_qdrant
+
+
+def connect_qdrant() -> QdrantClient:
+    # --- Qdrant Client updated to use environment variables and increased timeout ---
+    qdrant_url, qdrant_api_key = qdrant_settings()
+    if qdrant_url == LOCAL_QDRANT_URL:
+        return local_qdrant()
+
+    qdrant = QdrantClient(
+        url=qdrant_url,
+        api_key=qdrant_api_key,
+        timeout=60.0 # Increased timeout for potentially long operations like initial indexing
+    )
+    # Print client version for debugging
+    try:
+        import qdrant_client
+        logger.info(f"Qdrant client version: {qdrant_client.__version__}")
+    except AttributeError:
+        logger.info("Qdrant client version: Unable to determine version")
+    logger.info("Qdrant client connected successfully")
+    return qdrant
+
+
+def connect_async_qdrant() -> AsyncQdrantClient:
+    # Used on the request path: calls are awaited, and the underlying HTTP connection pool is
+    # reused across requests instead of blocking the event loop on every search
+    qdrant_url, qdrant_api_key = qdrant_settings()
+    if qdrant_url == LOCAL_QDRANT_URL:
+        return AsyncLocalQdrant(local_qdrant())
+    return AsyncQdrantClient(url=qdrant_url, api_key=qdrant_api_key, timeout=30.0)
+
+
+def quantization_config() -> ScalarQuantization | None:
+    if QDRANT_QUANTIZATION == "none":
+        return None
+    if QDRANT_QUANTIZATION != "int8":
+        raise RuntimeError(f"❌ Unknown QDRANT_QUANTIZATION '{QDRANT_QUANTIZATION}', expected 'none' or 'int8'.")
+    return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+
+
+def search_params() -> SearchParams | None:
+    # Passed with every search of a quantized collection
+    if QDRANT_QUANTIZATION == "none":
+        return None
+    return SearchParams(quantization=QuantizationSearchParams(rescore=True, oversampling=QDRANT_OVERSAMPLING))
+
+
+def ensure_collection(qdrant, collection_name: str, vector_dim: int, distance: Distance = Distance.COSINE,
+                      quantization: ScalarQuantization | None = None):
+    try:
+        if qdrant.collection_exists(collection_name=collection_name):
+            logger.info(f"Qdrant collection '{collection_name}' already exists.")
+            if quantization is not None and qdrant.get_collection(collection_name).config.quantization_config is None:
+                # Existing points are quantized in the background by the server
+                qdrant.update_collection(collection_name=collection_name, quantization_config=quantization)
+                logger.info(f"Enabled {QDRANT_QUANTIZATION} quantization on Qdrant collection '{collection_name}'.")
+            return
+        logger.info(f"Qdrant collection '{collection_name}' not found, attempting to create.")
+        qdrant.create_collection(
+            collection_name=collection_name,
+            vectors_config=VectorParams(size=vector_dim, distance=distance),
+            quantization_config=quantization
+        )
+        logger.info(f"Qdrant collection '{collection_name}' created successfully.")
+    except Exception as e:
+        # Catch any other unexpected errors during collection check/creation
+        raise RuntimeError(f"Error checking/creating Qdrant collection: {e}")
+
+
+def ensure_payload_index(qdrant, collection_name: str, field_name: str, field_schema: str = "keyword"):
+    # This ensures that filtering on `field_name` is efficient and doesn't throw errors
+    try:
+        # Create index using the client method directly (use string instead of enum)
+        qdrant.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=field_schema  # Use string value instead of FieldType.KEYWORD
+        )
+        logger.info(f"Payload index for '{field_name}' field created or already exists in collection '{collection_name}'.")
+    except UnexpectedResponse as e:
+        if "already exists" in str(e): # Common error message if index exists
+            logger.info(f"Payload index for '{field_name}' field already exists in collection '{collection_name}'.")
+        else:
+            logger.warning(f"Could not create payload index for '{field_name}' field (UnexpectedResponse): {e}")
+    except Exception as e:
+        # Catch any other general exceptions during index creation
+        logger.warning(f"Could not create payload index for '{field_name}' field: {e}")
@@ -0,0 +1,317 @@
+import argparse
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+
+import numpy as np
+from qdrant_client.models import (
+    Distance,
+    Filter,
+    FieldCondition,
+    MatchAny,
+    MatchValue,
+    FilterSelector,
+    HasIdCondition,
+    IsEmptyCondition,
+    PayloadField,
+    PointStruct,
+)
+
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    # Our modules read their settings at import time, so .env has to be loaded first
+    from dotenv import load_dotenv
+    load_dotenv()
+
+from chunking import CHUNKER_VERSION, chunk_section, split_sections
+from embedding_store import POINT_ID_NAMESPACE, content_hash
+from ingestion import chunk_point_id, index_chunks
+from locks import QdrantLease
+from models import EMBEDDER_MODEL_NAME, model_id
+from vector_db import ensure_collection, ensure_payload_index
+
+# === WHO Indexing ===
+WHO_GUIDELINES_PATH = os.getenv("WHO_GUIDELINES_PATH", "who_data/who_az_guidelines.txt")
+UNTITLED_TOPIC = "WHO guidelines"
+# The syncing worker renews its lease every third of this; if it dies, another worker can take over this long after
+WHO_SYNC_LOCK_TTL = float(os.getenv("WHO_SYNC_LOCK_TTL", "30"))
+WHO_SYNC_WAIT_INTERVAL = float(os.getenv("WHO_SYNC_WAIT_INTERVAL", "5"))
+
+
+@dataclass
+class SyncReport:
+    added: list[str] = field(default_factory=list)
+    changed: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    unchanged: int = 0
+    failed: list[str] = field(default_factory=list)
+    chunks_indexed: int = 0
+    seconds: float = 0.0
+    topics: list[str] = field(default_factory=list)  # every topic in the file after the sync
+
+    def summary(self) -> str:
+        return (f"{len(self.added)} added, {len(self.changed)} changed, {len(self.removed)} removed, "
+                f"{self.unchanged} unchanged, {len(self.failed)} failed topics; "
+                f"{self.chunks_indexed} chunks indexed in {self.seconds:.1f}s")
+
+
+def manifest_collection_name(collection_name: str) -> str:
+    return f"{collection_name}_who_manifest"
+
+
+def who_filter(*conditions) -> Filter:
+    return Filter(must=[FieldCondition(key="source", match=MatchValue(value="who")), *conditions])
+
+
+def topic_condition(topic: str) -> FieldCondition:
+    return FieldCondition(key="topic", match=MatchValue(value=topic))
+
+
+def topics_condition(topics: list[str]) -> FieldCondition:
+    return FieldCondition(key="topic", match=MatchAny(any=list(topics)))
+
+
+def split_topics(text: str) -> dict[str, str]:
+    sections = [(name, body) for name, body in split_sections(text) if name is not None]
+    if not sections:
+        return {UNTITLED_TOPIC: text.strip()} if text.strip() else {}
+
+    topics: dict[str, str] = {}
+    for name, body in sections:
+        # A topic scraped twice is treated as one section
+        topics[name] = f"{topics[name]}\n{body}" if name in topics else body
+    return topics
+
+
+def read_guidelines(path: str = WHO_GUIDELINES_PATH) -> str:
+    if not os.path.exists(path):
+        logger.error(f"WHO guidelines file not found at {path}.")
+        return ""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def who_chunk_payloads(text: str) -> list[dict]:
+    # The chunks the in-process WHO indexes are built from: the same ones sync_who_guidelines
+    # stores in Qdrant, with identical text within a topic collapsed into one, like point ids
+    payloads, seen = [], set()
+    for topic, body in split_topics(text).items():
+        for chunk in chunk_section(body, topic):
+            if (topic, chunk.text) not in seen:
+                seen.add((topic, chunk.text))
+                payloads.append({"text": chunk.text, "source": "who", **chunk.payload()})
+    return payloads
+
+
+class TopicIndex:
+    """Embedded topic titles, used to guess which WHO topics a question is about.
+
+    Matching is a dot product of the question embedding against a few hundred title
+    embeddings, so it adds microseconds to a request while letting the WHO search be
+    restricted to those topics' chunks.
+    """
+
+    def __init__(self, topics: list[str], vectors: np.ndarray):
+        self.topics = topics
+        self.vectors = vectors
+
+    @classmethod
+    def build(cls, topics: list[str], embedder) -> "TopicIndex":
+        if not topics:
+            return cls([], np.zeros((0, 0), dtype=np.float32))
+        # Titles are URL slugs like "cardiovascular-diseases-(cvds)"
+        titles = [topic.replace("-", " ").replace("_", " ") for topic in topics]
+        vectors = np.asarray(embedder.encode(titles, convert_to_numpy=True), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return cls(list(topics), vectors)
+
+    def match(self, q_vec, limit: int, min_similarity: float) -> list[str]:
+        if not self.topics or limit <= 0:
+            return []
+        q = np.asarray(q_vec, dtype=np.float32)
+        scores = self.vectors @ (q / max(float(np.linalg.norm(q)), 1e-12))
+        best = np.argsort(-scores)[:limit]
+        return [self.topics[i] for i in best if scores[i] >= min_similarity]
+
+
+def load_manifest(qdrant, collection_name: str) -> dict[str, dict]:
+    manifest = {}
+    offset = None
+    while True:
+        points, offset = qdrant.scroll(
+            collection_name=manifest_collection_name(collection_name),
+            limit=1000, offset=offset, with_payload=True, with_vectors=False
+        )
+        for p in points:
+            manifest[p.payload["topic"]] = p.payload
+        if offset is None:
+            return manifest
+
+
+def manifest_point(topic: str, topic_hash: str, chunks: int) -> PointStruct:
+    return PointStruct(
+        id=str(uuid.uuid5(POINT_ID_NAMESPACE, f"who-manifest:{topic}")),
+        vector=[1.0],
+        payload={"topic": topic, "hash": topic_hash, "chunks": chunks, "indexed_at": time.time()}
+    )
+
+
+def verify_manifest(qdrant, collection_name: str, manifest: dict[str, dict]) -> dict[str, dict]:
+    # One exact count catches the common cases (collection wiped, earlier run half-failed);
+    # per-topic counts are only needed to find out which topics to repair
+    expected = sum(entry["chunks"] for entry in manifest.values())
+    actual = qdrant.count(collection_name=collection_name, count_filter=who_filter(), exact=True).count
+    if actual == expected:
+        return manifest
+
+    logger.info(f"WHO index has {actual} points but manifest expects {expected}, checking topics...")
+    verified = {}
+    for topic, entry in manifest.items():
+        count = qdrant.count(collection_name=collection_name, count_filter=who_filter(topic_condition(topic)),
+                             exact=True).count
+        if count == entry["chunks"]:
+            verified[topic] = entry
+        else:
+            logger.info(f"Topic '{topic}' has {count} of {entry['chunks']} chunks, will re-index.")
+    return verified
+
+
+def sync_who_guidelines(qdrant, collection_name: str, embedder, store=None,
+                        path: str = WHO_GUIDELINES_PATH, full: bool = False,
+                        model_name: str = model_id(EMBEDDER_MODEL_NAME)) -> SyncReport:
+    """Bring the `source == "who"` points in line with the guidelines file, topic by topic.
+
+    Only topics whose content hash differs from the manifest are embedded and upserted;
+    topics that disappeared from the file are deleted. A topic's manifest entry is only
+    written once all of its chunks are stored, so failed runs are repaired on the next sync.
+    """
+    report = SyncReport()
+    if not os.path.exists(path):
+        logger.error(f"WHO guidelines file not found at {path}.")
+        return report
+
+    start = time.perf_counter()
+    with open(path, "r", encoding="utf-8") as f:
+        topics = split_topics(f.read())
+
+    ensure_collection(qdrant, manifest_collection_name(collection_name), 1, distance=Distance.DOT)
+    stored_manifest = load_manifest(qdrant, collection_name)
+    manifest = verify_manifest(qdrant, collection_name, stored_manifest)
+
+    # Points written before topics were tracked can't be diffed, so they're replaced
+    qdrant.delete(
+        collection_name=collection_name,
+        points_selector=FilterSelector(filter=who_filter(IsEmptyCondition(is_empty=PayloadField(key="topic"))))
+    )
+
+    report.topics = list(topics)
+    # The model (with its inference backend) and the chunker version are part of the hash, so a
+    # new embedder or chunking change re-indexes every topic instead of mixing vectors
+    hashes = {topic: content_hash(f"{model_name}\n{CHUNKER_VERSION}\n{body}") for topic, body in topics.items()}
+    for topic in topics:
+        if topic not in manifest:
+            report.added.append(topic)
+        elif full or manifest[topic]["hash"] != hashes[topic]:
+            report.changed.append(topic)
+        else:
+            report.unchanged += 1
+    report.removed = [topic for topic in stored_manifest if topic not in topics]
+
+    to_index = report.added + report.changed
+    chunks, chunk_payloads = [], []
+    for topic in to_index:
+        for chunk in chunk_section(topics[topic], topic):
+            chunks.append(chunk.text)
+            chunk_payloads.append(chunk.payload())
+    logger.info(f"WHO sync: {len(to_index)} topics ({len(chunks)} chunks) to index, {len(report.removed)} to remove.")
+
+    stats = index_chunks(qdrant, collection_name, embedder, chunks, payload={"source": "who"},
+                         label="WHO chunks", store=store, chunk_payloads=chunk_payloads, stage_prefix="who_index")
+    report.chunks_indexed = stats.indexed
+
+    ids_by_topic: dict[str, set] = {topic: set() for topic in to_index}
+    for chunk, extra in zip(chunks, chunk_payloads):
+        ids_by_topic[extra["topic"]].add(chunk_point_id(chunk, {"source": "who", **extra}))
+
+    manifest_updates = []
+    for topic, ids in ids_by_topic.items():
+        if ids & stats.failed_ids:
+            report.failed.append(topic)
+            continue
+        # New chunks are already in place; drop whatever the old version of the topic left behind
+        qdrant.delete(
+            collection_name=collection_name,
+            points_selector=FilterSelector(filter=Filter(
+                must=who_filter(topic_condition(topic)).must,
+                must_not=[HasIdCondition(has_id=list(ids))]
+            ))
+        )
+        manifest_updates.append(manifest_point(topic, hashes[topic], len(ids)))
+
+    for topic in report.removed:
+        qdrant.delete(collection_name=collection_name,
+                      points_selector=FilterSelector(filter=who_filter(topic_condition(topic))))
+    if report.removed:
+        qdrant.delete(collection_name=manifest_collection_name(collection_name),
+                      points_selector=[manifest_point(topic, "", 0).id for topic in report.removed])
+    if manifest_updates:
+        qdrant.upsert(collection_name=manifest_collection_name(collection_name), points=manifest_updates)
+
+    report.seconds = time.perf_counter() - start
+    for kind in ("added", "changed", "removed", "failed"):
+        topics_of_kind = getattr(report, kind)
+        if topics_of_kind:
+            logger.info(f"WHO topics {kind}: {', '.join(topics_of_kind)}")
+    logger.info(f"WHO guidelines sync complete: {report.summary()}")
+    return report
+
+
+def sync_who_guidelines_locked(qdrant, collection_name: str, embedder, store=None,
+                               path: str = WHO_GUIDELINES_PATH, full: bool = False,
+                               model_name: str = model_id(EMBEDDER_MODEL_NAME),
+                               wait: bool = True) -> SyncReport | None:
+    # One sync at a time across all workers and machines; the others wait, then find
+    # nothing left to do (the manifest makes a repeated sync cheap). With wait=False,
+    # returns None at once when another worker holds the lease.
+    lease = QdrantLease(qdrant, collection_name, "who-sync", ttl=WHO_SYNC_LOCK_TTL)
+    while not lease.acquire():
+        if not wait:
+            return None
+        logger.info(f"WHO sync is running in another worker, checking again in {WHO_SYNC_WAIT_INTERVAL:.0f}s...")
+        time.sleep(WHO_SYNC_WAIT_INTERVAL)
+    try:
+        return sync_who_guidelines(qdrant, collection_name, embedder, store=store, path=path, full=full,
+                                   model_name=model_name)
+    finally:
+        lease.release()
+
+
+# === Command Line ===
+# Re-index explicitly, without starting the API: `python who_index.py [--full]`; use this with
+# WHO_INDEX_ON_STARTUP=off to keep indexing out of the API processes entirely
+if __name__ == "__main__":
+    from embedding_store import EmbeddingStore
+    from models import load_embedder
+    from observability import configure_logging
+    from vector_db import connect_qdrant, quantization_config
+
+    configure_logging()
+
+    parser = argparse.ArgumentParser(description="Incrementally sync WHO guidelines into Qdrant.")
+    parser.add_argument("--path", default=WHO_GUIDELINES_PATH, help="guidelines file written by data_loader.py")
+    parser.add_argument("--collection", default="medical_docs")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and re-index every topic")
+    args = parser.parse_args()
+
+    embedder = load_embedder()
+    vector_dim = embedder.get_sentence_embedding_dimension() or 384
+    qdrant = connect_qdrant()
+    ensure_collection(qdrant, args.collection, vector_dim, quantization=quantization_config())
+    ensure_payload_index(qdrant, args.collection, "source")
+    ensure_payload_index(qdrant, args.collection, "topic")
+    result = sync_who_guidelines_locked(qdrant, args.collection, embedder, EmbeddingStore(model_id(EMBEDDER_MODEL_NAME), vector_dim),
+                                 path=args.path, full=args.full)
+    raise SystemExit(1 if result.failed else 0)
@@ -1,4 +1,15 @@
 const backendUrl = "https://medical-rag-assistant.fly.dev"; 
+
+// Each browser keeps its own report on the backend, identified by this id
+function getSessionId() {
+    let sessionId = localStorage.getItem("sessionId");
+    if (!sessionId) {
+        sessionId = crypto.randomUUID();
+        localStorage.setItem("sessionId", sessionId);
+    }
+    return sessionId;
+}
+
 // Helper function to update status messages
 function updateStatus(elementId, message, type = '') {
     const element = document.getElementById(elementId);
@@ -63,11 +74,23 @@ async function uploadReport() {
     try {
         const response = await fetch(`${backendUrl}/upload`, {
             method: "POST",
+            headers: { "X-Session-ID": getSessionId() },
             body: formData,
         });
 
         const result = await response.json();
-        updateStatus('uploadStatus', result.detail || "✅ Report uploaded successfully! You can now ask questions.", 'upload');
+        if (!response.ok || !result.job_id) {
+            updateStatus('uploadStatus', `❌ ${result.error || result.detail || "Upload failed."}`, 'upload');
+            return;
+        }
+
+        // Indexing runs in the background; poll until the job finishes
+        const job = await waitForUploadJob(result.status_url);
+        if (job.status === 'done') {
+            updateStatus('uploadStatus', "✅ Report uploaded successfully! You can now ask questions.", 'upload');
+        } else {
+            updateStatus('uploadStatus', `❌ ${job.error || "Indexing the report failed."}`, 'upload');
+        }
     } catch (err) {
         updateStatus('uploadStatus', "❌ Upload failed. Please check the backend server.", 'upload');
         console.error("Upload error:", err);
@@ -76,6 +99,44 @@ async function uploadReport() {
     }
 }
 
+// Polls an upload job until it is done, showing page progress (the report is searchable as pages land)
+async function waitForUploadJob(statusUrl) {
+    while (true) {
+        const response = await fetch(`${backendUrl}${statusUrl}`, {
+            headers: { "X-Session-ID": getSessionId() },
+        });
+        const job = await response.json();
+        if (!response.ok) return { status: 'failed', error: job.error };
+        if (['done', 'failed', 'cancelled'].includes(job.status)) return job;
+        updateStatus('uploadStatus', `Indexing your report... ${job.pages_processed} / ${job.pages_total} pages`, 'upload');
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
+// Reads a Server-Sent Events stream from a fetch response and calls handlers[event](data)
+async function readAnswerStream(response, handlers) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let event = 'message';
+            let data = '';
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            if (handlers[event]) handlers[event](data ? JSON.parse(data) : {});
+        }
+    }
+}
+
 async function askQuestion() {
     const questionInput = document.getElementById("questionInput");
     const answerCard = document.getElementById("answerCard");
@@ -98,18 +159,37 @@ async function askQuestion() {
     }
 
     try {
-        const response = await fetch(`${backendUrl}/ask`, {
+        const response = await fetch(`${backendUrl}/ask/stream`, {
             method: "POST",
-            headers: { "Content-Type": "application/json" },
+            headers: { "Content-Type": "application/json", "X-Session-ID": getSessionId() },
             body: JSON.stringify({ question }),
         });
+        if (!response.ok || !response.body) {
+            throw new Error(`Request failed with status ${response.status}`);
+        }
 
-        const result = await response.json();
-        answerText.textContent = result.answer || "No answer found for your question.";
-        
-        answerCard.style.display = 'block';
-        answerCard.classList.add('visible');
-        answerCard.classList.add('animate-fade-in');
+        // Show the answer card as soon as the first token arrives
+        let started = false;
+        await readAnswerStream(response, {
+            meta: () => updateStatus('questionStatus', 'Generating answer...', 'question'),
+            token: (data) => {
+                if (!started) {
+                    started = true;
+                    answerCard.style.display = 'block';
+                    answerCard.classList.add('visible');
+                    answerCard.classList.add('animate-fade-in');
+                }
+                answerText.textContent += data.text;
+            },
+            error: (data) => { throw new Error(data.error); },
+        });
+
+        if (!started) {
+            answerText.textContent = "No answer found for your question.";
+            answerCard.style.display = 'block';
+            answerCard.classList.add('visible');
+            answerCard.classList.add('animate-fade-in');
+        }
 
         updateStatus('questionStatus', '✅ Answer generated successfully!', 'question');
     } catch (err) {
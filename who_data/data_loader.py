@@ -1,6 +1,47 @@
+"""Fetch the WHO fact sheets into per-topic files, a manifest, and who_az_guidelines.txt.
+
+    python data_loader.py [--concurrency 8] [--resume] [--force] [--base-url http://127.0.0.1:8000]
+
+Pages are downloaded concurrently over one pooled session, with timeouts and retries. The ETag and
+Last-Modified of every page are kept in the manifest and sent back as conditional GETs, so pages
+that have not changed since the last run cost a 304 and are not parsed again. A page that fails
+keeps its previous text, and --resume skips the pages a previous (interrupted or partly failed)
+run already fetched. manifest.json records, per topic, what this run added, changed or removed,
+for the WHO index sync to pick up; who_az_guidelines.txt is rebuilt from the per-topic files.
+Topics that have no per-topic file yet are first seeded from the existing who_az_guidelines.txt,
+and the combined file is never rewritten without a topic it had unless --allow-shrink is given.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, urlunsplit
+
 import requests
 from bs4 import BeautifulSoup
-import re
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# === Fetcher Settings ===
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+GUIDELINES_PATH = os.getenv("WHO_GUIDELINES_PATH", os.path.join(DATA_DIR, "who_az_guidelines.txt"))
+FACT_SHEETS_DIR = os.getenv("WHO_FACT_SHEETS_DIR", os.path.join(DATA_DIR, "fact_sheets"))
+MANIFEST_PATH = os.path.join(FACT_SHEETS_DIR, "manifest.json")
+FETCH_CONCURRENCY = int(os.getenv("WHO_FETCH_CONCURRENCY", "8"))
+FETCH_TIMEOUT = float(os.getenv("WHO_FETCH_TIMEOUT", "30"))
+FETCH_RETRIES = int(os.getenv("WHO_FETCH_RETRIES", "3"))
+# An interrupted run loses at most this many seconds of fetched pages
+MANIFEST_SAVE_INTERVAL = float(os.getenv("WHO_MANIFEST_SAVE_INTERVAL", "1"))
+USER_AGENT = "medrag-who-loader/1.0"
+BANNER = "=" * 40
 
 players = {
     "Abortion": "https://www.who.int/news-room/fact-sheets/detail/abortion",
@@ -251,15 +292,269 @@ def clean_text(text):
 
     return text.strip()
 
-with open("who_az_guidelines.txt", "w", encoding="utf-8") as outfile:
-    for name, url in players.items():
-        print(f"Scraping {name}...")
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
 
-        paragraphs = soup.find_all('p')
-        raw_text = "\n".join([p.get_text() for p in paragraphs if p.get_text(strip=True)])
-        cleaned = clean_text(raw_text)
+# === Fetching ===
+def topic_filename(name: str) -> str:
+    return re.sub(r"[^a-z0-9().-]+", "-", name.lower()).strip("-") + ".txt"
+
+
+def section_title(name: str) -> str:
+    return name.replace("_", " ")
+
+
+def read_sections(path: str) -> dict[str, str]:
+    # Section title -> text, from a combined file written by Fetcher.write_guidelines()
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        parts = re.split(f"\n\n{BANNER}\n(.*?)\n{BANNER}\n", f.read())
+    return dict(zip(parts[1::2], parts[2::2]))
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def with_base_url(url: str, base_url: str | None) -> str:
+    # Points the fact-sheet URLs at a stand-in server (tests, benchmarks) keeping their paths
+    if not base_url:
+        return url
+    base = urlsplit(base_url)
+    parts = urlsplit(url)
+    return urlunsplit((base.scheme, base.netloc, base.path.rstrip("/") + parts.path, parts.query, ""))
+
+
+def extract_text(html: str) -> str:
+    soup = BeautifulSoup(html, "html.parser")
+    paragraphs = soup.find_all("p")
+    return clean_text("\n".join([p.get_text() for p in paragraphs if p.get_text(strip=True)]))
+
+
+def make_session(concurrency: int, retries: int) -> requests.Session:
+    # One connection per worker thread, reused across pages; 429/5xx are retried with backoff
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=("GET",), respect_retry_after_header=True, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=retry)
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def atomic_write(path: str, text: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> dict:
+    if not os.path.exists(path):
+        return {"run": {}, "topics": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class Fetcher:
+    """Fetches fact sheets into `fact_sheets_dir`, keeping the manifest up to date as pages complete.
+
+    The manifest is saved every MANIFEST_SAVE_INTERVAL seconds during a run, so an interrupted run
+    keeps (almost) everything it already fetched; `resume=True` then picks up where it stopped.
+    """
+
+    def __init__(self, fact_sheets_dir: str = FACT_SHEETS_DIR, base_url: str | None = None,
+                 concurrency: int = FETCH_CONCURRENCY, timeout: float = FETCH_TIMEOUT,
+                 retries: int = FETCH_RETRIES, force: bool = False):
+        self.fact_sheets_dir = fact_sheets_dir
+        self.manifest_path = os.path.join(fact_sheets_dir, "manifest.json")
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.force = force
+        self.session = make_session(concurrency, retries)
+        self.manifest = load_manifest(self.manifest_path)
+        self._lock = threading.Lock()
+
+    def save_manifest(self):
+        with self._lock:
+            text = json.dumps(self.manifest, indent=2, ensure_ascii=False)
+        atomic_write(self.manifest_path, text)
+
+    def conditional_headers(self, entry: dict | None) -> dict:
+        if self.force or not entry or not os.path.exists(os.path.join(self.fact_sheets_dir, entry["file"])):
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def fetch_topic(self, name: str, url: str) -> tuple[str, dict]:
+        """Fetches one page; returns its outcome (added/changed/unchanged/failed) and manifest entry."""
+        previous = self.manifest["topics"].get(name)
+        entry = dict(previous or {}, url=url, file=topic_filename(name), checked_at=now_iso())
+        try:
+            response = self.session.get(with_base_url(url, self.base_url), timeout=self.timeout,
+                                        headers=self.conditional_headers(previous))
+            if response.status_code == 304:
+                entry.update(status="ok", error=None)
+                return "unchanged", entry
+            response.raise_for_status()
+            text = extract_text(response.text)
+            if not text:
+                raise ValueError("no paragraphs found on the page")
+            digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            path = os.path.join(self.fact_sheets_dir, entry["file"])
+            unchanged = bool(previous) and previous.get("sha256") == digest and os.path.exists(path)
+            if not unchanged:
+                atomic_write(path, text)
+        except Exception as e:
+            # Network, markup or disk: one page failing never stops the run. The previous text (if any)
+            # stays in place and in who_az_guidelines.txt, with the validators that go with it
+            entry.update(status="failed", error=f"{type(e).__name__}: {e}")
+            return "failed", entry
+
+        entry.update(status="ok", error=None, etag=response.headers.get("ETag"),
+                     last_modified=response.headers.get("Last-Modified"), fetched_at=entry["checked_at"],
+                     bytes=len(response.content), chars=len(text), sha256=digest)
+        if unchanged:
+            # Served in full (no validators, or a new ETag) but the text is the same
+            return "unchanged", entry
+        return ("changed" if previous and previous.get("sha256") else "added"), entry
+
+    def run(self, topics: dict[str, str], resume: bool = False) -> dict:
+        os.makedirs(self.fact_sheets_dir, exist_ok=True)
+        previous_run = self.manifest.get("run") or {}
+        outcomes = {"added": [], "changed": [], "unchanged": [], "failed": [], "removed": []}
+        pending = dict(topics)
+        if resume and previous_run.get("started_at"):
+            # Carry on with the previous run: keep what it did, redo only what it missed or failed
+            started_at = previous_run["started_at"]
+            for outcome in ("added", "changed", "unchanged", "removed"):
+                outcomes[outcome] = list(previous_run.get(outcome, []))
+            for name in list(pending):
+                entry = self.manifest["topics"].get(name)
+                if entry and entry.get("status") == "ok" and entry.get("checked_at", "") >= started_at:
+                    pending.pop(name)
+        else:
+            started_at = now_iso()
+        self.manifest["run"] = {"started_at": started_at, "finished_at": None, **outcomes}
+        # Topics dropped from `players` (not just left out of this run)
+        for name in [name for name in self.manifest["topics"] if name not in players]:
+            entry = self.manifest["topics"].pop(name)
+            path = os.path.join(self.fact_sheets_dir, entry["file"])
+            if os.path.exists(path):
+                os.remove(path)
+            outcomes["removed"].append(name)
+        logger.info(f"Fetching {len(pending)} of {len(topics)} fact sheets, {self.concurrency} at a time...")
+
+        start = last_save = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                futures = {pool.submit(self.fetch_topic, name, url): name for name, url in pending.items()}
+                for future in as_completed(futures):
+                    name = futures[future]
+                    outcome, entry = future.result()
+                    with self._lock:
+                        self.manifest["topics"][name] = entry
+                        outcomes[outcome].append(name)
+                    if outcome == "failed":
+                        logger.warning(f"❌ {name}: {entry['error']}")
+                    else:
+                        logger.debug(f"{name}: {outcome}")
+                    if time.perf_counter() - last_save >= MANIFEST_SAVE_INTERVAL:
+                        self.save_manifest()
+                        last_save = time.perf_counter()
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self.manifest["run"].update(
+                    finished_at=now_iso(), seconds=round(seconds, 3), pages=len(pending),
+                    pages_per_second=round(len(pending) / seconds, 2) if seconds > 0 else None, **outcomes,
+                )
+        finally:
+            # Also when interrupted: the manifest has to describe the per-topic files already written
+            self.save_manifest()
+        return self.manifest["run"]
+
+    def seed_from_guidelines(self, topics: dict[str, str], path: str = GUIDELINES_PATH) -> int:
+        """Writes per-topic files for the topics the combined file has and the fact sheets directory
+        lacks (a first run, or one with only some --topics), so rebuilding it keeps them; returns how many."""
+        os.makedirs(self.fact_sheets_dir, exist_ok=True)
+        sections = read_sections(path)
+        seeded = 0
+        for name, url in topics.items():
+            text = sections.get(section_title(name))
+            entry = self.manifest["topics"].get(name)
+            if text is None or (entry and os.path.exists(os.path.join(self.fact_sheets_dir, entry["file"]))):
+                continue
+            atomic_write(os.path.join(self.fact_sheets_dir, topic_filename(name)), text)
+            # No validators: the first fetch downloads the page, and the hash tells whether it changed
+            self.manifest["topics"][name] = {"url": url, "file": topic_filename(name), "status": "seeded",
+                                             "sha256": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+                                             "chars": len(text)}
+            seeded += 1
+        if seeded:
+            self.save_manifest()
+        return seeded
+
+    def write_guidelines(self, topics: dict[str, str], path: str = GUIDELINES_PATH,
+                         allow_shrink: bool = False) -> int:
+        """Rebuilds the combined file from the per-topic files, in `topics` order; returns the topic count.
+
+        Refuses (RuntimeError) to drop a topic of `topics` the current file has but no per-topic file
+        backs, unless `allow_shrink`: the WHO index sync would delete it from Qdrant as removed.
+        """
+        sections, written = [], set()
+        for name in topics:
+            entry = self.manifest["topics"].get(name)
+            file_path = os.path.join(self.fact_sheets_dir, entry["file"]) if entry else None
+            if file_path and os.path.exists(file_path):
+                with open(file_path, "r", encoding="utf-8") as f:
+                    sections.append(f"\n\n{BANNER}\n{section_title(name)}\n{BANNER}\n{f.read()}")
+                written.add(name)
+        existing = read_sections(path)
+        dropped = [name for name in topics if name not in written and section_title(name) in existing]
+        if dropped and not allow_shrink:
+            raise RuntimeError(f"❌ Not rewriting {path}: {len(dropped)} of its topics ({', '.join(dropped[:5])}"
+                               f"{', ...' if len(dropped) > 5 else ''}) have no fact sheet in {self.fact_sheets_dir}; "
+                               f"pass --allow-shrink to drop them.")
+        atomic_write(path, "".join(sections))
+        return len(sections)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch the WHO fact sheets.")
+    parser.add_argument("--concurrency", type=int, default=FETCH_CONCURRENCY)
+    parser.add_argument("--timeout", type=float, default=FETCH_TIMEOUT, help="Seconds per request")
+    parser.add_argument("--retries", type=int, default=FETCH_RETRIES)
+    parser.add_argument("--resume", action="store_true", help="Skip pages the previous run already fetched")
+    parser.add_argument("--force", action="store_true", help="Download every page, ignoring ETag/Last-Modified")
+    parser.add_argument("--base-url", help="Fetch from this server instead of www.who.int, e.g. a local stand-in")
+    parser.add_argument("--topics", nargs="+", help="Only these topics (default: all)")
+    parser.add_argument("--fact-sheets-dir", default=FACT_SHEETS_DIR)
+    parser.add_argument("--output", default=GUIDELINES_PATH, help="Combined file read by who_index.py")
+    parser.add_argument("--allow-shrink", action="store_true",
+                        help="Rewrite --output even if that drops topics it has but no fact sheet backs")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
-        outfile.write(f"\n\n{'='*40}\n{name.replace('_', ' ')}\n{'='*40}\n")
-        outfile.write(cleaned)
+    topics = {name: players[name] for name in args.topics} if args.topics else players
+    fetcher = Fetcher(args.fact_sheets_dir, base_url=args.base_url, concurrency=args.concurrency,
+                      timeout=args.timeout, retries=args.retries, force=args.force)
+    seeded = fetcher.seed_from_guidelines(players, args.output)
+    if seeded:
+        logger.info(f"Seeded {seeded} fact sheets from {args.output}.")
+    run = fetcher.run(topics, resume=args.resume)
+    try:
+        written = fetcher.write_guidelines(players, args.output, allow_shrink=args.allow_shrink)
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    logger.info(f"{len(run['added'])} added, {len(run['changed'])} changed, {len(run['unchanged'])} unchanged, "
+                f"{len(run['failed'])} failed, {len(run['removed'])} removed; {run['pages']} pages in "
+                f"{run['seconds']:.1f}s ({run['pages_per_second']} pages/s). {written} topics in {args.output}.")
+    if run["failed"]:
+        raise SystemExit(f"❌ {len(run['failed'])} pages failed: {', '.join(run['failed'])} (re-run with --resume)")